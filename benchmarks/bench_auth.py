@@ -0,0 +1,107 @@
+"""
+Benchmark the authentication overhead in front of /predict.
+
+Sends the same image repeatedly, so every request after the first is a
+prediction-cache hit. The remaining cost is mostly request handling plus
+the user resolution. This is compared for:
+    db         - users table query on every request (USER_CACHE_TTL=0)
+    cached     - in-process user cache (the default)
+    stateless  - signed claims only (AUTH_STATELESS=1)
+
+    python benchmarks/bench_auth.py --requests 2000
+
+Defaults to a temporary SQLite file; set DATABASE_URL to measure against
+a real server.
+
+Sample run: 1 vCPU, SQLite file, --requests 2000, in-process TestClient.
+
+    mode          auth us   /predict req/s   /predict ms
+    db              958.6            256.7          3.89
+    cached           79.3            444.7          2.25
+    stateless        72.4            506.3          1.98
+
+With the user cached, the remaining auth cost is mostly decoding and
+verifying the JWT.
+"""
+import io
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+os.chdir(os.path.join(HERE, ".."))  # the app serves static/ relative to the repo root
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+for name in ("SECRET_KEY", "MAIL_USERNAME", "MAIL_PASSWORD"):
+    os.environ.setdefault(name, "bench")
+os.environ.setdefault("MAIL_FROM", "bench@example.com")
+os.environ.setdefault("MODEL_LAZY_LOAD", "1")
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+import api  # noqa: E402
+import inference  # noqa: E402
+from cache import TTLCache  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from models import User  # noqa: E402
+
+
+class StubModel:
+    def __call__(self, batch):
+        return np.zeros((len(batch), 7), dtype=np.float32)
+
+
+class IdentityScaler:
+    def inverse_transform(self, x):
+        return x
+
+
+def configure(mode):
+    api.AUTH_STATELESS = mode == "stateless"
+    api.user_cache = TTLCache(maxsize=0 if mode == "db" else 10000, ttl=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    # Inference is stubbed out; only request handling and auth are measured
+    inference._model, inference._scaler = StubModel(), IdentityScaler()
+    with SessionLocal() as db:
+        if db.query(User).filter(User.username == "bench").first() is None:
+            db.add(User(username="bench", hashed_password="x"))
+            db.commit()
+    token = api.create_access_token("bench")
+    headers = {"Authorization": f"Bearer {token}"}
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64)).save(buf, format="PNG")
+    files = {"file": ("frame.png", buf.getvalue(), "image/png")}
+
+    print(f"{'mode':<10} {'auth us':>10} {'/predict req/s':>16} {'/predict ms':>13}")
+    with TestClient(api.app) as client:
+        for mode in ("db", "cached", "stateless"):
+            configure(mode)
+
+            async def resolve_many():
+                for _ in range(args.requests):
+                    await api.get_current_user(token)
+
+            asyncio.run(resolve_many())  # warm-up
+            start = time.perf_counter()
+            asyncio.run(resolve_many())
+            auth_us = (time.perf_counter() - start) / args.requests * 1e6
+
+            assert client.post("/predict", headers=headers, files=files).status_code == 200
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                client.post("/predict", headers=headers, files=files)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:<10} {auth_us:>10.1f} {args.requests / elapsed:>16.1f} {elapsed / args.requests * 1000:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
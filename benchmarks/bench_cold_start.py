@@ -0,0 +1,95 @@
+"""
+Cold-start benchmark for the API.
+
+Starts uvicorn in a fresh process and measures the time from process start
+to the first HTTP response, and to /ready reporting the model as loaded.
+
+    python benchmarks/bench_cold_start.py --runs 5
+
+DATABASE_URL defaults to a throwaway SQLite file and the mail/secret settings
+to dummy values, so no external services are needed.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import statistics
+import urllib.request
+import urllib.error
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def get_status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as res:
+            return res.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return None
+
+
+def one_run(env, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+    first_response = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            status = get_status(base + "/ready")
+            now = time.perf_counter() - start
+            if status is not None and first_response is None:
+                first_response = now
+            if status == 200:
+                ready = now
+                break
+            time.sleep(0.02)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return first_response, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_cold_start.db"))
+    for key in ("MAIL_USERNAME", "MAIL_PASSWORD", "MAIL_FROM", "SECRET_KEY"):
+        env.setdefault(key, "bench@example.com" if key.startswith("MAIL") else "bench")
+
+    firsts, readies = [], []
+    for i in range(args.runs):
+        first, ready = one_run(env, args.timeout)
+        print(f"run {i + 1}: first response {first if first is None else f'{first:.2f}s'}, "
+              f"ready {ready if ready is None else f'{ready:.2f}s'}")
+        if first is not None:
+            firsts.append(first)
+        if ready is not None:
+            readies.append(ready)
+
+    if firsts:
+        print(f"median first response: {statistics.median(firsts):.2f}s")
+    if readies:
+        print(f"median ready:          {statistics.median(readies):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
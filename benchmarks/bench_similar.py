@@ -0,0 +1,100 @@
+"""
+/similar search cost as the embedding index grows: exact chunked scan vs
+IVF lists (embeddings.EmbeddingIndex), with recall@10 of IVF against exact.
+
+Vectors are synthetic 512-d clustered points standing in for resnet
+features, appended in batches of 1000 like score.py --index does.
+
+    python benchmarks/bench_similar.py --rows 1000000 --queries 50
+
+Sample runs: 1 vCPU, 5 GB RAM, --queries 50 (30 at 100k), local disk, page
+cache warm. At 1M rows the vectors take 1 GB.
+
+    rows      search          p50 ms    p95 ms  recall@10
+    100000    exact            216.4     236.5       1.00
+              ivf nprobe=8       6.3       7.5       0.92
+              ivf nprobe=16      9.6      12.7       0.94
+              ivf nprobe=32     21.8      27.7       0.96
+    1000000   exact           2274.2    2447.4       1.00
+              ivf nprobe=8      22.3      26.9       1.00
+              ivf nprobe=16     44.5      83.7       1.00
+              ivf nprobe=32     94.0     155.5       1.00
+
+At 1M rows, appends ran at 38k rows/s. Training 1000 lists took 33 s.
+The exact scan is linear in the index size (about 2.2 us per row, mostly
+the float16 -> float32 conversion). IVF reads only nprobe / nlist of the
+rows. With nlist = sqrt(N) its cost grows with sqrt(N).
+
+The synthetic clusters get denser as rows are added, which is why recall
+reaches 1.00 at 1M rows. Measure recall on real embeddings before
+lowering EMBEDDING_NPROBE.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from embeddings import EmbeddingIndex  # noqa: E402
+
+
+def clustered(rng, centres, n, noise=1.0):
+    points = centres[rng.integers(len(centres), size=n)]
+    return points + noise * rng.normal(size=points.shape)
+
+
+def time_search(index, queries, **options):
+    times, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append({row for _, row, _ in index.search(query, k=10, **options)})
+        times.append((time.perf_counter() - start) * 1000)
+    return np.array(times), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--lists", type=int, default=None, help="IVF lists (default sqrt(rows))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[8, 16, 32])
+    parser.add_argument("--dir", default=None, help="index directory (default: a temporary one)")
+    args = parser.parse_args()
+
+    path = args.dir or tempfile.mkdtemp(prefix="bench_similar_")
+    rng = np.random.default_rng(0)
+    centres = rng.normal(size=(2000, args.dim)).astype(np.float32)
+    try:
+        index = EmbeddingIndex(path)
+        start = time.perf_counter()
+        for done in range(0, args.rows, 1000):
+            n = min(1000, args.rows - done)
+            index.add(clustered(rng, centres, n), [{"filename": f"img{done + i}.jpg"} for i in range(n)])
+        elapsed = time.perf_counter() - start
+        print(f"append: {args.rows} rows in {elapsed:.1f} s ({args.rows / elapsed / 1000:.1f}k rows/s)")
+
+        queries = clustered(rng, centres, args.queries)
+        exact_times, exact = time_search(index, queries)
+
+        start = time.perf_counter()
+        nlist = index.train(args.lists)
+        print(f"train:  {nlist} lists in {time.perf_counter() - start:.1f} s")
+
+        print(f"{'search':<15} {'p50 ms':>7} {'p95 ms':>9} {'recall@10':>10}")
+        print(f"{'exact':<15} {np.percentile(exact_times, 50):>7.1f} {np.percentile(exact_times, 95):>9.1f} {1.0:>10.2f}")
+        for nprobe in args.nprobe:
+            times, found = time_search(index, queries, nprobe=nprobe)
+            recall = np.mean([len(a & b) / 10 for a, b in zip(found, exact)])
+            label = f"ivf nprobe={nprobe}"
+            print(f"{label:<15} {np.percentile(times, 50):>7.1f} {np.percentile(times, 95):>9.1f} {recall:>10.2f}")
+    finally:
+        if args.dir is None:
+            shutil.rmtree(path)
+
+
+if __name__ == "__main__":
+    main()
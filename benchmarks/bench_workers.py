@@ -0,0 +1,137 @@
+"""
+Memory and throughput of N model-holding processes, three ways:
+
+    copies  - N processes each loading the checkpoint normally (what
+              uvicorn --workers N does today)
+    mmap    - N processes loading it with INFERENCE_MMAP_WEIGHTS=1
+    pool    - one InferencePool with N workers (INFERENCE_WORKERS=N)
+
+Memory is the summed PSS (proportional set size: shared pages are split
+between the processes mapping them) of the N processes, after each has
+run the forward pass on 8 rows. The API process in front of the pool is
+not counted. Throughput is pool images/s for batches of 8 sent from 2
+threads.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --model resnet34
+
+Sample run: 1 vCPU, 5 GB RAM, torch 2.14, resnet34 (81 MB of weights).
+
+    workers  mode       PSS MB  per worker  pool img/s
+    1        copies      665.8       665.8
+             mmap        655.8       655.8
+             pool        659.9       659.9        10.0
+    2        copies     1218.1       609.1
+             mmap       1121.5       560.8
+             pool       1155.5       577.7         9.4
+    4        copies     2270.6       567.7
+             mmap       1980.6       495.2
+             pool       1915.9       479.0         8.5
+
+At 4 workers, sharing the weights saves 290-355 MB, roughly the 81 MB
+checkpoint for each worker after the first. Most of a worker's memory is
+the torch runtime and the forward-pass buffers, not the weights, so the
+total still grows with N, only more slowly. On one vCPU the pool cannot
+add throughput; the 8.5 img/s at 4 workers is the cost of time-slicing
+them. Give each worker its own core.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing as mp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import torch  # noqa: E402
+from model import get_model, load_model  # noqa: E402
+from workers import InferencePool  # noqa: E402
+
+
+def memory_mb(pid):
+    """
+    (PSS, RSS) of one process in MB, from /proc (Linux only).
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Pss", "Rss"):
+                values[key] = int(rest.split()[0]) / 1024
+    return values["Pss"], values["Rss"]
+
+
+def hold_model(model_name, model_path, mmap, ready, stop):
+    torch.set_num_threads(1)
+    model = load_model(model_name, model_path, torch.device("cpu"), mmap=mmap)
+    with torch.no_grad():
+        model(torch.randn(8, 3, 224, 224))
+    ready.release()
+    stop.wait()
+
+
+def standalone(n, model_name, model_path, mmap):
+    ctx = mp.get_context("spawn")
+    ready, stop = ctx.Semaphore(0), ctx.Event()
+    processes = [ctx.Process(target=hold_model, args=(model_name, model_path, mmap, ready, stop)) for _ in range(n)]
+    for process in processes:
+        process.start()
+    try:
+        for _ in processes:
+            ready.acquire()
+        return sum(memory_mb(p.pid)[0] for p in processes)
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+
+
+def pooled(n, model_name, model_path, batches):
+    pool = InferencePool(n, model_name, model_path, num_threads=1)
+    try:
+        # Chunks of 8 rows, so each worker's activations match the other modes
+        for _ in range(2):
+            pool(torch.randn(8 * n, 3, 224, 224))
+        batch = torch.randn(8, 3, 224, 224)
+        pss = sum(memory_mb(p.pid)[0] for p in pool._processes)
+
+        def run():
+            for _ in range(batches // 2):
+                pool(batch)
+
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return pss, (batches // 2) * 2 * 8 / (time.perf_counter() - start)
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--model", default="resnet34", choices=["resnet18", "resnet34", "mobilenet_v2"])
+    parser.add_argument("--batches", type=int, default=20, help="batches of 8 for the pool throughput")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"{args.model}_aqi.pth")
+        torch.save(get_model(args.model, pretrained=False).state_dict(), path)
+        print(f"{args.model}: {os.path.getsize(path) / 2 ** 20:.0f} MB of weights")
+        print(f"{'workers':<8} {'mode':<8} {'PSS MB':>8} {'per worker':>11} {'pool img/s':>11}")
+        for n in args.workers:
+            for mode in ("copies", "mmap", "pool"):
+                rate = ""
+                if mode == "pool":
+                    pss, images_per_s = pooled(n, args.model, path, args.batches)
+                    rate = f"{images_per_s:.1f}"
+                else:
+                    pss = standalone(n, args.model, path, mmap=mode == "mmap")
+                print(f"{n if mode == 'copies' else '':<8} {mode:<8} {pss:>8.1f} {pss / n:>11.1f} {rate:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+"""
+Reproducible inference benchmark suite. One run writes one JSON file, and
+two files (e.g. from two commits) can be compared:
+
+    python benchmarks/suite.py --out results/$(git rev-parse --short HEAD).json
+    python benchmarks/suite.py --quick --out /tmp/smoke.json
+    python benchmarks/suite.py --compare results/old.json results/new.json
+
+Nothing external is needed. Every model.get_model architecture gets a
+random-weight checkpoint (fixed seed) in a temporary directory. Inputs are
+synthetic photo-like JPEGs at phone and camera resolutions. The API runs
+on a throwaway SQLite file with AUTH_STATELESS=1 and a locally signed
+token, so auth needs no users table and no mail server.
+
+Per architecture, in a fresh process:
+    cold_start     import, checkpoint load and first forward pass (seconds)
+    latency        one encoded JPEG -> predictions (decode, transforms,
+                   forward, inverse scale), p50/p95 ms per resolution
+    throughput     images/s for preprocessed batches of 1, 8 and 32
+    peak_rss_mb    peak resident memory of that process
+
+Per architecture, end to end over HTTP (uvicorn, one worker):
+    ready_s        process start until /ready returns 200
+    concurrency.N  /predict req/s and p50/p95 ms with N clients in flight.
+                   PREDICTION_CACHE_SIZE=0, so every request runs the model
+    peak_rss_mb    peak resident memory of the server (Linux only)
+
+The per-component scripts next to this one (bench_decode, bench_batching,
+bench_cold_start, ...) remain for digging into a single stage.
+
+Sample run: 1 vCPU, 5 GB RAM, torch 2.14, --quick (3 latency iterations,
+32 throughput images, 32 requests per concurrency level). "http req/s" is
+at 32 clients. Of the worker's peak RSS, about 700 MB is importing this
+CUDA build of torch; the batch-32 pass adds most of the rest.
+
+    model         cold s  640x480 p50  4032x3024 p50  b32 img/s  rss MB  http req/s (max c)
+    resnet18        7.14     88.46 ms      137.64 ms      15.07  1227.3               14.53
+    resnet34        6.66    154.64 ms      184.88 ms        8.1  1206.8                 9.0
+    mobilenet_v2    6.92     45.27 ms       96.09 ms      13.21  1240.9               17.19
+
+On this shared VM, two back-to-back --quick runs of the same commit
+differed by up to 40% on HTTP p95 and 25% on mobilenet_v2 req/s. Compare
+runs made on the same machine with the same settings (--compare warns
+otherwise). Use the default sizes, or repeat runs, before trusting changes
+of a few percent.
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+from datetime import datetime, timezone
+
+START = time.perf_counter()
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SRC = os.path.join(ROOT, "src")
+
+MODEL_NAMES = ["resnet18", "resnet34", "mobilenet_v2"]
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+BATCH_SIZES = [1, 8, 32]
+CONCURRENCY = [1, 8, 32]
+SECRET_KEY = "bench-suite"
+
+
+def percentiles(times_ms):
+    times = sorted(times_ms)
+    pick = lambda q: times[min(len(times) - 1, int(q * len(times)))]  # noqa: E731
+    return {"p50_ms": round(pick(0.5), 2), "p95_ms": round(pick(0.95), 2), "n": len(times)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def synthetic_jpeg(width, height, seed=0):
+    """
+    Gradients plus sensor-style noise, encoded at quality 90, so file sizes
+    and decode costs resemble real photos rather than flat test patterns.
+    """
+    import numpy as np
+    from PIL import Image
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    rgb = np.stack([x / (width / 200), y / (height / 160), (x + y) / ((width + height) / 230)], axis=-1)
+    noise = np.random.default_rng(seed).normal(0, 6, rgb.shape).astype(np.float32)
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(rgb + noise, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+# -------------------------------
+# MODEL WORKER (one fresh process per architecture)
+# -------------------------------
+def run_model_worker(args):
+    sys.path.insert(0, SRC)
+    os.environ["MODEL_NAME"] = args.worker
+    os.environ["MODEL_PATH"] = args.checkpoint
+    import torch
+    import inference
+    imported = time.perf_counter()
+    inference.load()
+    loaded = time.perf_counter()
+    inference.predict_batch(torch.zeros(1, 3, 224, 224))
+    first = time.perf_counter()
+    result = {"cold_start": {
+        "import_s": round(imported - START, 3),
+        "load_s": round(loaded - imported, 3),
+        "first_forward_s": round(first - loaded, 3),
+        "total_s": round(first - START, 3),
+    }}
+
+    result["latency"] = {}
+    for width, height in RESOLUTIONS:
+        with open(os.path.join(args.inputs, f"{width}x{height}.jpg"), "rb") as f:
+            data = f.read()
+        inference.predict_bytes(data)  # warm-up
+        times = []
+        for _ in range(args.iters):
+            start = time.perf_counter()
+            inference.predict_bytes(data)
+            times.append((time.perf_counter() - start) * 1000)
+        result["latency"][f"{width}x{height}"] = {**percentiles(times), "jpeg_kb": len(data) // 1024}
+
+    result["throughput"] = {}
+    generator = torch.Generator().manual_seed(0)
+    for batch_size in BATCH_SIZES:
+        batch = torch.randn(batch_size, 3, 224, 224, generator=generator)
+        inference.predict_batch(batch)  # warm-up
+        batches = max(1, args.images // batch_size)
+        start = time.perf_counter()
+        for _ in range(batches):
+            inference.predict_batch(batch)
+        elapsed = time.perf_counter() - start
+        result["throughput"][f"batch_{batch_size}"] = {"images_per_s": round(batches * batch_size / elapsed, 2)}
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    print(json.dumps(result))
+
+
+def make_checkpoint(name, directory):
+    sys.path.insert(0, SRC)
+    import torch
+    from model import get_model
+    torch.manual_seed(0)
+    path = os.path.join(directory, f"{name}_bench.pth")
+    torch.save(get_model(name, pretrained=False).state_dict(), path)
+    return path
+
+
+def write_inputs(directory):
+    # Made here rather than in the model process, whose peak RSS would
+    # otherwise be the float32 image synthesis instead of inference
+    for width, height in RESOLUTIONS:
+        with open(os.path.join(directory, f"{width}x{height}.jpg"), "wb") as f:
+            f.write(synthetic_jpeg(width, height))
+
+
+def bench_model(name, checkpoint, args):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", name, "--checkpoint", checkpoint,
+         "--inputs", args.inputs, "--iters", str(args.iters), "--images", str(args.images)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# -------------------------------
+# END TO END OVER HTTP
+# -------------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def load_test(client, token, images, requests, concurrency):
+    """
+    requests POSTs to /predict with at most `concurrency` in flight. Returns
+    the request rate, latency percentiles and the number of failed requests.
+    """
+    import httpx
+    headers = {"Authorization": f"Bearer {token}"}
+    times, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(images[i % len(images)])
+
+    async def client_loop():
+        nonlocal errors
+        while not queue.empty():
+            data = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                res = await client.post("/predict", headers=headers, files={"file": ("bench.jpg", data, "image/jpeg")})
+                errors += res.status_code != 200
+            except httpx.TransportError:
+                errors += 1
+            times.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"requests_per_s": round(requests / elapsed, 2), **percentiles(times), "errors": errors}
+
+
+def bench_http(name, checkpoint, workdir, args):
+    import httpx
+    from jose import jwt
+
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "MODEL_NAME": name, "MODEL_PATH": checkpoint,
+        "DATABASE_URL": "sqlite:///" + os.path.join(workdir, f"{name}.db"),
+        "EMBEDDING_INDEX_DIR": os.path.join(workdir, "embeddings"),
+        "SECRET_KEY": SECRET_KEY, "AUTH_STATELESS": "1", "PREDICTION_CACHE_SIZE": "0",
+        "MAIL_USERNAME": "bench@example.com", "MAIL_PASSWORD": "bench", "MAIL_FROM": "bench@example.com",
+    })
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api:app", "--port", str(port), "--log-level", "warning",
+         # Pooled connections sit idle between concurrency levels
+         "--timeout-keep-alive", "60"],
+        cwd=ROOT, env=env,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        ready = None
+        while ready is None and time.perf_counter() - start < args.timeout:
+            try:
+                if httpx.get(base + "/ready", timeout=1).status_code == 200:
+                    ready = time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {proc.returncode}")
+            time.sleep(0.02)
+        if ready is None:
+            raise RuntimeError(f"Server not ready after {args.timeout} s")
+
+        token = jwt.encode({"sub": "bench", "iat": int(time.time()), "exp": int(time.time()) + 3600},
+                           SECRET_KEY, algorithm="HS256")
+        images = [synthetic_jpeg(640, 480, seed) for seed in range(8)]
+
+        async def run():
+            limits = httpx.Limits(max_connections=max(args.concurrency))
+            async with httpx.AsyncClient(base_url=base, limits=limits, timeout=args.timeout) as client:
+                await load_test(client, token, images, max(args.concurrency), max(args.concurrency))  # warm-up
+                # Every level sends at least one request per client
+                return {str(c): await load_test(client, token, images, max(args.requests, c), c)
+                        for c in args.concurrency}
+
+        result = {"ready_s": round(ready, 3), "concurrency": asyncio.run(run())}
+        result["peak_rss_mb"] = server_peak_rss_mb(proc.pid)
+        return result
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+# -------------------------------
+# RESULTS
+# -------------------------------
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                cwd=ROOT, capture_output=True, text=True, check=True)
+        return commit.stdout.strip(), bool(status.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def metadata(args):
+    import torch
+    import PIL
+    commit, dirty = git_commit()
+    return {
+        "commit": commit, "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "torch": torch.__version__, "pillow": PIL.__version__,
+        "platform": platform.platform(), "cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "settings": {key: getattr(args, key) for key in ("models", "iters", "images", "requests", "concurrency")},
+    }
+
+
+def flatten(tree, prefix=""):
+    """
+    Numeric leaves of a results dict as {"models.resnet34.latency...": value}.
+    """
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"old: {old['meta'].get('commit')} ({old['meta'].get('timestamp')})")
+    print(f"new: {new['meta'].get('commit')} ({new['meta'].get('timestamp')})")
+    if old["meta"].get("settings") != new["meta"].get("settings") or old["meta"].get("cpus") != new["meta"].get("cpus"):
+        print("warning: the runs used different settings or CPU counts")
+
+    old_flat = flatten({k: v for k, v in old.items() if k != "meta"})
+    new_flat = flatten({k: v for k, v in new.items() if k != "meta"})
+    width = max(map(len, old_flat.keys() | new_flat.keys()), default=6)
+    print(f"{'metric':<{width}} {'old':>10} {'new':>10} {'change':>8}")
+    for key in sorted(old_flat.keys() | new_flat.keys()):
+        if key.endswith(".n") or key.endswith(".jpeg_kb"):
+            continue
+        a, b = old_flat.get(key), new_flat.get(key)
+        change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else ""
+        print(f"{key:<{width}} {'-' if a is None else a:>10} {'-' if b is None else b:>10} {change:>8}")
+
+
+def summary(results):
+    print(f"{'model':<13} {'cold s':>6} {'640x480 p50':>12} {'4032x3024 p50':>14} {'b32 img/s':>10} {'rss MB':>7}"
+          f" {'http req/s (max c)':>19}")
+    for name, result in results["models"].items():
+        latency = result["latency"]
+        http = results["http"].get(name, {}).get("concurrency", {})
+        top = http[max(http, key=int)]["requests_per_s"] if http else "-"
+        print(f"{name:<13} {result['cold_start']['total_s']:>6.2f} {latency.get('640x480', {}).get('p50_ms', '-'):>9} ms"
+              f" {latency.get('4032x3024', {}).get('p50_ms', '-'):>11} ms"
+              f" {result['throughput'].get('batch_32', {}).get('images_per_s', '-'):>10}"
+              f" {result['peak_rss_mb']:>7} {top:>19}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default=None, help="JSON results path (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files and exit")
+    parser.add_argument("--models", nargs="+", default=MODEL_NAMES, choices=MODEL_NAMES)
+    parser.add_argument("--iters", type=int, default=20, help="timed single-image predictions per resolution")
+    parser.add_argument("--images", type=int, default=256, help="images per batch size in the throughput test")
+    parser.add_argument("--requests", type=int, default=200, help="HTTP requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument("--no-http", action="store_true", help="skip the end-to-end HTTP load test")
+    parser.add_argument("--quick", action="store_true", help="smoke-run sizes: --iters 3 --images 32 --requests 32")
+    parser.add_argument("--timeout", type=float, default=180.0)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--checkpoint", help=argparse.SUPPRESS)
+    parser.add_argument("--inputs", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_model_worker(args)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.quick:
+        args.iters, args.images, args.requests = 3, 32, 32
+
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    results = {"meta": metadata(args), "models": {}, "http": {}}
+    try:
+        args.inputs = workdir
+        write_inputs(workdir)
+        for name in args.models:
+            checkpoint = make_checkpoint(name, workdir)
+            print(f"{name}: model benchmarks", file=sys.stderr)
+            results["models"][name] = bench_model(name, checkpoint, args)
+            if not args.no_http:
+                print(f"{name}: HTTP load test", file=sys.stderr)
+                results["http"][name] = bench_http(name, checkpoint, workdir, args)
+    finally:
+        shutil.rmtree(workdir)
+
+    out = args.out or os.path.join(ROOT, "benchmarks", "results", f"{(results['meta']['commit'] or 'nocommit')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    summary(results)
+    print(f"wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,44 @@
-import io
 import os
+import json
+import time
+import asyncio
 import random
-from datetime import datetime, timedelta
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException
-import requests
-from fastapi.responses import FileResponse
+import zipfile
+from itertools import islice
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, and_, select
 from jose import jwt, JWTError
-from PIL import Image
 from passlib.context import CryptContext
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 import uvicorn
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig
-import math
-from database import SessionLocal, engine, Base
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine, Base, get_db
 from models import User, PollutionData
-from inference import predict_image
+import inference
+from inference import (
+    preprocess_bytes, format_predictions, numeric_predictions, predict_chunk, content_key,
+    scheduler, tta_scheduler, embedding_scheduler, RESPONSE_METADATA,
+)
+from types import SimpleNamespace
+from cache import TTLCache, make_cache
+from waqi import WaqiClient, WaqiUnavailable
+from geo import PointIndex, covering_geohashes, geohash, haversine_km
+from ingest import BufferedWriter, bulk_insert
+from imaging import DECODE_ERRORS, MAX_IMAGE_BYTES, ImageTooLarge
+from embeddings import EmbeddingIndex
+import metrics
+from metrics import Gauge, MetricsMiddleware, stage
 
 # ----------------------------
 # Load environment
@@ -68,10 +86,41 @@ class ResetPasswordRequest(BaseModel):
     email: str
     otp: str
     new_password: str
+
+class ReadingIn(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    timestamp: Optional[datetime] = None  # UTC; defaults to the upload time
+    station_lat: Optional[float] = None
+    station_lon: Optional[float] = None
+    distance_km: Optional[float] = None
+    aqi: Optional[float] = None
+    pm25: Optional[float] = None
+    pm10: Optional[float] = None
+    o3: Optional[float] = None
+    co: Optional[float] = None
+    so2: Optional[float] = None
+    no2: Optional[float] = None
 # ----------------------------
 # App setup
 # ----------------------------
-app = FastAPI(title="Air Quality Prediction API")
+@asynccontextmanager
+async def lifespan(app):
+    # Load the model off the startup path so the server answers immediately;
+    # with MODEL_LAZY_LOAD=1 it is loaded by the first prediction instead
+    if os.getenv("MODEL_LAZY_LOAD") != "1":
+        inference.load_in_background()
+    await run_in_threadpool(load_recent_readings)
+    sweeper = asyncio.create_task(sweep_caches())
+    yield
+    sweeper.cancel()
+    await waqi_client.aclose()
+    await run_in_threadpool(reading_writer.close)
+    await run_in_threadpool(inference.close)
+    if async_engine is not None:
+        await async_engine.dispose()
+
+app = FastAPI(title="Air Quality Prediction API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -80,6 +129,11 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+
+# Sampling profilers can be started and stopped through /debug/profiler/*
+# only when PROFILING_ENABLED=1
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED") == "1"
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 Base.metadata.create_all(bind=engine)
@@ -88,93 +142,242 @@ Base.metadata.create_all(bind=engine)
 # Configs
 # ----------------------------
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt costs ~100+ ms of CPU per call; a small dedicated pool keeps it off
+# the event loop and bounds how many cores signups and logins can take
+password_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")), thread_name_prefix="bcrypt"
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
-otp_store = {}  # temporary OTP storage
 
-# ----------------------------
-# DB dependency
-# ----------------------------
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Resolved users are cached per token subject for USER_CACHE_TTL seconds
+# (0 queries the users table on every request). AUTH_STATELESS=1 trusts the
+# signed token claims and skips the lookup entirely
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+AUTH_STATELESS = os.getenv("AUTH_STATELESS") == "1"
+user_cache = TTLCache(maxsize=int(os.getenv("USER_CACHE_SIZE", "10000")) if USER_CACHE_TTL > 0 else 0, ttl=USER_CACHE_TTL)
+
+# Tokens issued before a password reset are rejected. The reset times live
+# for a token lifetime; AUTH_REVOCATION_URL=redis://... shares them between workers
+password_resets = make_cache(
+    os.getenv("AUTH_REVOCATION_URL"),
+    maxsize=100_000,
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    prefix="pwreset:",
+)
+PREDICT_CHUNK_SIZE = int(os.getenv("PREDICT_CHUNK_SIZE", "32"))  # images per forward pass in /predict/batch
+if PREDICT_CHUNK_SIZE < 1:
+    raise ValueError("PREDICT_CHUNK_SIZE must be at least 1")
+
+# Repeated uploads (re-submitted frames, client retries) are answered from a
+# cache keyed by a hash of the upload bytes. PREDICTION_CACHE_URL=redis://...
+# shares it between workers; PREDICTION_CACHE_SIZE=0 disables it.
+prediction_cache = make_cache(
+    os.getenv("PREDICTION_CACHE_URL"),
+    maxsize=int(os.getenv("PREDICTION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "300")),
+    prefix=f"pred:{inference.MODEL_NAME}:{inference.BACKEND}:",
+)
+# Embeddings of scored images for /similar (see embeddings.py). This process
+# appends to the index; train its IVF lists offline once it is large.
+embedding_index = EmbeddingIndex(
+    os.getenv("EMBEDDING_INDEX_DIR", "data/embeddings"),
+    nprobe=int(os.getenv("EMBEDDING_NPROBE", "16")),
+)
+# Pending OTPs expire after OTP_TTL_MINUTES; OTP_STORE_URL=redis://... shares
+# them between workers. Registrations store the bcrypt hash, never the password
+OTP_TTL_MINUTES = 5
+otp_store = make_cache(
+    os.getenv("OTP_STORE_URL"), maxsize=100_000, ttl=OTP_TTL_MINUTES * 60, prefix="otp:"
+)
+
+# Readings of the last READINGS_WINDOW_HOURS are kept in a grid-bucketed
+# in-memory index for /readings/nearby; older ones are queried by geohash
+READINGS_WINDOW_HOURS = float(os.getenv("READINGS_WINDOW_HOURS", "24"))
+reading_index = PointIndex(cell_deg=0.05, max_age_s=READINGS_WINDOW_HOURS * 3600)
+
+# /locationdata readings are buffered and written with one bulk INSERT per
+# READINGS_FLUSH_ROWS rows or READINGS_FLUSH_SECONDS, whichever comes first
+READINGS_FLUSH_ROWS = int(os.getenv("READINGS_FLUSH_ROWS", "200"))
+READINGS_FLUSH_SECONDS = float(os.getenv("READINGS_FLUSH_SECONDS", "1"))
+READINGS_BULK_MAX = 5000  # readings per /readings/bulk request
+
+# WAQI lookups: pooled async client; pings within WAQI_CACHE_BUCKET_DEG
+# (0.01 deg, about 1 km) reuse one station response for WAQI_CACHE_TTL seconds.
+# WAQI_BASE_URL can point at a local stub (tests/waqi_stub.py)
+waqi_client = WaqiClient(
+    os.getenv("WAQI_API_KEY"),
+    base_url=os.getenv("WAQI_BASE_URL", "https://api.waqi.info"),
+    timeout=float(os.getenv("WAQI_TIMEOUT", "5")),
+    retries=int(os.getenv("WAQI_RETRIES", "2")),
+    max_connections=int(os.getenv("WAQI_MAX_CONNECTIONS", "20")),
+    cache_ttl=float(os.getenv("WAQI_CACHE_TTL", "300")),
+    bucket_deg=float(os.getenv("WAQI_CACHE_BUCKET_DEG", "0.01")),
+)
 
 # ----------------------------
 # JWT helpers
 # ----------------------------
 def create_access_token(username: str):
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    return jwt.encode({"sub": username, "exp": expire}, SECRET_KEY, algorithm="HS256")
-
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    # Fractional iat: a whole-second one would let a token issued just before
+    # a reset, in the same second, pass the revocation check
+    return jwt.encode({"sub": username, "exp": expire, "iat": time.time()}, SECRET_KEY, algorithm="HS256")
+
+def revoke_tokens(username: str):
+    """
+    Reject this user's existing tokens and drop the cached user (password reset).
+    """
+    password_resets.set(username, time.time())
+    user_cache.invalidate(username)
+
+async def fetch_user(username: str):
+    """
+    Look a user up without blocking the event loop: on the async engine when
+    enabled (DB_ASYNC / ASYNC_DATABASE_URL), otherwise on the threadpool.
+    """
+    query = select(User).where(User.username == username)
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return await db.scalar(query)
+
+    def lookup():
+        with SessionLocal() as db:
+            return db.scalar(query)
+
+    return await run_in_threadpool(lookup)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        with stage("auth_jwt"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
         username = payload.get("sub")
         if not username:
             raise HTTPException(status_code=401, detail="Invalid token")
-        user = db.query(User).filter(User.username == username).first()
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
+        reset_at = password_resets.get(username)
+        if reset_at is not None and payload.get("iat", 0) < reset_at:
+            raise HTTPException(status_code=401, detail="Token revoked")
+        if AUTH_STATELESS:
+            # Only the claims are known; handlers needing the full row query it
+            return SimpleNamespace(username=username)
+        with stage("auth_user"):
+            user = user_cache.get(username)
+            if user is None:
+                user = await fetch_user(username)
+                if not user:
+                    raise HTTPException(status_code=401, detail="User not found")
+                user_cache.set(username, user)
         return user
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def distance_km(lat1, lon1, lat2, lon2):
-    R = 6371
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
+# ----------------------------
+# Password hashing
+# ----------------------------
+MAX_BCRYPT_BYTES = 72
+
+def bcrypt_safe(password: str):
+    # bcrypt only uses the first 72 bytes
+    return password.encode("utf-8")[:MAX_BCRYPT_BYTES].decode("utf-8", errors="ignore")
+
+async def hash_password(password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, bcrypt_safe(password))
+
+async def verify_password(password: str, hashed_password: str):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify, bcrypt_safe(password), hashed_password)
+
+async def sweep_caches(interval=60):
+    """
+    Periodically drop expired OTPs, cached users, reset markers and indexed
+    readings so idle entries do not pile up until they are read again.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        for store in (otp_store, user_cache, password_resets):
+            store.sweep()
+        reading_index.sweep(time.time())
+
+def otp_expired(record):
+    return datetime.utcnow() > datetime.fromisoformat(record["expires"])
 
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) \
-        * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+# ----------------------------
+# Spatial index of recent readings
+# ----------------------------
+READING_FIELDS = ("id", "latitude", "longitude", "aqi", "pm25", "pm10", "o3", "co", "so2", "no2")
 
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
 
+def reading_dict(row):
+    """
+    API view of a pollution_data row (a mapping of column values).
+    """
+    reading = {field: row[field] for field in READING_FIELDS}
+    reading["timestamp"] = row["timestamp"].isoformat()
+    return reading
 
-# ----------------------------
-# WAQI API Call
-# ----------------------------
-def get_waqi_data(lat, lon):
-    API_KEY = os.getenv("WAQI_API_KEY")
-    url = f"https://api.waqi.info/feed/geo:{lat};{lon}/?token={API_KEY}"
 
-    res = requests.get(url).json()
+def index_readings(rows):
+    # Back-filled readings older than the window are only queried from the DB
+    cutoff = datetime.utcnow() - timedelta(hours=READINGS_WINDOW_HOURS)
+    for row in rows:
+        if row["timestamp"] < cutoff:
+            continue
+        reading_index.add(row["latitude"], row["longitude"], row["timestamp"].timestamp(), reading_dict(row))
 
-    if res.get("status") != "ok":
-        return None
 
-    data = res["data"]
+def load_recent_readings():
+    """
+    Fill the in-memory index with the readings of the last READINGS_WINDOW_HOURS.
+    """
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(hours=READINGS_WINDOW_HOURS)
+        query = select(PollutionData.__table__).where(PollutionData.timestamp >= since).order_by(PollutionData.timestamp)
+        index_readings(db.execute(query).mappings())
+    finally:
+        db.close()
 
-    station_lat, station_lon = data["city"]["geo"]
-    iaqi = data.get("iaqi", {})
 
-    return {
-        "station_lat": station_lat,
-        "station_lon": station_lon,
-        "aqi": data.get("aqi"),
-        "pm25": iaqi.get("pm25", {}).get("v"),
-        "pm10": iaqi.get("pm10", {}).get("v"),
-        "o3": iaqi.get("o3", {}).get("v"),
-        "co": iaqi.get("co", {}).get("v"),
-        "so2": iaqi.get("so2", {}).get("v"),
-        "no2": iaqi.get("no2", {}).get("v"),
-    }
+def query_nearby_readings(db, lat, lon, radius_km, since, limit):
+    """
+    Readings older than the in-memory window: a few geohash-prefix range
+    scans on the indexed column, then an exact distance filter.
+    """
+    cells = [
+        and_(PollutionData.geohash >= prefix, PollutionData.geohash < prefix + "~")
+        for prefix in covering_geohashes(lat, lon, radius_km)
+    ]
+    query = select(PollutionData.__table__).where(or_(*cells), PollutionData.timestamp >= since)
+    rows = db.execute(query).mappings().all()
+    if not rows:
+        return []
+    distances = haversine_km(lat, lon, [r["latitude"] for r in rows], [r["longitude"] for r in rows])
+    hits = sorted((d, i) for i, d in enumerate(distances) if d <= radius_km)[:limit]
+    return [(float(d), reading_dict(rows[i])) for d, i in hits]
+
+
+# Written readings join the in-memory index once they have their ids
+reading_writer = BufferedWriter(
+    SessionLocal, PollutionData,
+    max_rows=READINGS_FLUSH_ROWS, max_delay_s=READINGS_FLUSH_SECONDS, on_flush=index_readings,
+)
+Gauge("aqi_readings_pending_rows", "Readings waiting for the next bulk insert", fn=lambda: reading_writer.pending())
 
 
 # ----------------------------
 # Save API Endpoint
 # ----------------------------
 @app.get("/locationdata")
-def save_pollution_data(
+async def save_pollution_data(
     lat: float,
     lon: float,
-    db: Session = Depends(get_db)
 ):
 
-    waqi = get_waqi_data(lat, lon)
+    try:
+        waqi = await waqi_client.station(lat, lon)
+    except WaqiUnavailable as e:
+        raise HTTPException(502, str(e))
 
     if not waqi:
         raise HTTPException(404, "No WAQI station data found")
@@ -182,7 +385,7 @@ def save_pollution_data(
     station_lat = waqi["station_lat"]
     station_lon = waqi["station_lon"]
 
-    dist = distance_km(lat, lon, station_lat, station_lon)
+    dist = float(haversine_km(lat, lon, station_lat, station_lon))
 
     # ✅ Only save if within radius
     RADIUS_KM = 5
@@ -195,32 +398,77 @@ def save_pollution_data(
         }
 
     # ----------------------------
-    # Save to DB
+    # Queue for the next bulk write
     # ----------------------------
-    record = PollutionData(
-        latitude=lat,
-        longitude=lon,
-        station_lat=station_lat,
-        station_lon=station_lon,
-        distance_km=dist,
-        aqi=waqi["aqi"],
-        pm25=waqi["pm25"],
-        pm10=waqi["pm10"],
-        o3=waqi["o3"],
-        co=waqi["co"],
-        so2=waqi["so2"],
-        no2=waqi["no2"]
-    )
-
-    db.add(record)
-    db.commit()
-    db.refresh(record)
+    reading_writer.add({
+        "latitude": lat,
+        "longitude": lon,
+        "station_lat": station_lat,
+        "station_lon": station_lon,
+        "distance_km": dist,
+        "aqi": waqi["aqi"],
+        "pm25": waqi["pm25"],
+        "pm10": waqi["pm10"],
+        "o3": waqi["o3"],
+        "co": waqi["co"],
+        "so2": waqi["so2"],
+        "no2": waqi["no2"],
+        "geohash": geohash(lat, lon),
+        "timestamp": datetime.utcnow(),
+    })
 
     return {
-        "message": "Pollution data saved",
-        "id": record.id,
+        "message": "Pollution data queued",
         "distance_km": dist
     }
+
+
+@app.post("/readings/bulk")
+def ingest_readings(
+    readings: List[ReadingIn],
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Offline upload: store an array of readings in one bulk INSERT.
+    """
+    if len(readings) > READINGS_BULK_MAX:
+        raise HTTPException(413, f"At most {READINGS_BULK_MAX} readings per request")
+    now = datetime.utcnow()
+    rows = []
+    for reading in readings:
+        row = reading.model_dump()
+        row["timestamp"] = row["timestamp"] or now
+        if row["timestamp"].tzinfo is not None:
+            row["timestamp"] = row["timestamp"].astimezone(timezone.utc).replace(tzinfo=None)
+        row["geohash"] = geohash(row["latitude"], row["longitude"])
+        rows.append(row)
+    ids = bulk_insert(db, PollutionData, rows)
+    for row, row_id in zip(rows, ids):
+        row["id"] = row_id
+    index_readings(rows)
+    return {"message": "Readings saved", "count": len(ids)}
+
+
+@app.get("/readings/nearby")
+def readings_nearby(
+    lat: float,
+    lon: float,
+    radius_km: float = Query(5, gt=0, le=100),
+    hours: float = Query(24, gt=0),
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    Readings within radius_km of (lat, lon) from the last `hours`, nearest first.
+    """
+    now = datetime.utcnow()
+    since = now - timedelta(hours=hours)
+    if hours <= READINGS_WINDOW_HOURS:
+        hits = reading_index.query(lat, lon, radius_km, since=since.timestamp(), now=now.timestamp(), limit=limit)
+    else:
+        hits = query_nearby_readings(db, lat, lon, radius_km, since, limit)
+    return {"readings": [dict(reading, distance_km=dist) for dist, reading in hits]}
 # ----------------------------
 # Routes
 # ----------------------------
@@ -228,6 +476,12 @@ def save_pollution_data(
 def serve_frontend():
     return FileResponse("static/index.html")
 
+@app.get("/ready")
+def ready():
+    if not inference.is_ready():
+        return JSONResponse(status_code=503, content={"ready": False})
+    return {"ready": True}
+
 # ----------------------------
 # OTP registration
 # ----------------------------
@@ -235,12 +489,12 @@ def serve_frontend():
 async def send_registration_otp(req: SendOtpRequest):
     print("✅ Received OTP request:", req.dict())
     otp = str(random.randint(100000, 999999))
-    otp_store[req.email] = {
+    otp_store.set(req.email, {
         "otp": otp,
         "username": req.username,
-        "password": req.password,
-        "expires": datetime.utcnow() + timedelta(minutes=5)
-    }
+        "password_hash": await hash_password(req.password),
+        "expires": (datetime.utcnow() + timedelta(minutes=OTP_TTL_MINUTES)).isoformat()
+    })
 
     message = MessageSchema(
         subject="Your Registration OTP",
@@ -266,42 +520,27 @@ async def verify_registration_otp(req: VerifyOtpRequest, db: Session = Depends(g
     if not record:
         return {"success": False, "message": "No OTP request found"}
 
-    # Ensure expires is a datetime object
-    expires = record["expires"]
-    if isinstance(expires, str):
-        try:
-            expires = datetime.fromisoformat(expires)
-        except ValueError:
-            # fallback if string is not ISO format
-            expires = datetime.strptime(expires, "%Y-%m-%d %H:%M:%S.%f")
-
     # Check if OTP expired
-    if datetime.utcnow() > expires:
-        del otp_store[req.email]
+    if otp_expired(record):
+        otp_store.invalidate(req.email)
         return {"success": False, "message": "OTP expired"}
 
     # Check if OTP matches
     if record["otp"] != req.otp:
         return {"success": False, "message": "Invalid OTP"}
 
-    # OTP correct → create user in DB
-    # Truncate password to 72 bytes for bcrypt
-    MAX_BCRYPT_BYTES = 72
-    password_bytes = record["password"].encode("utf-8")[:MAX_BCRYPT_BYTES]
-    safe_password = password_bytes.decode("utf-8", errors="ignore")
-    hashed_password = pwd_context.hash(safe_password)
-
+    # OTP correct → create user in DB (the password was hashed when the OTP was sent)
     new_user = User(
         username=record["username"],
         email=req.email,
-        hashed_password=hashed_password
+        hashed_password=record["password_hash"]
     )
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
 
     # Remove OTP from store
-    del otp_store[req.email]
+    otp_store.invalidate(req.email)
 
     return {"success": True, "message": "Registration complete"}
 
@@ -314,11 +553,11 @@ async def send_reset_otp(req: ForgotPasswordRequest, db: Session = Depends(get_d
 
     otp = str(random.randint(100000, 999999))
 
-    otp_store[req.email] = {
+    otp_store.set(req.email, {
         "otp": otp,
         "purpose": "reset",
-        "expires": datetime.utcnow() + timedelta(minutes=5)
-    }
+        "expires": (datetime.utcnow() + timedelta(minutes=OTP_TTL_MINUTES)).isoformat()
+    })
 
     message = MessageSchema(
         subject="Password Reset OTP",
@@ -343,8 +582,8 @@ async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db
     if not record or record.get("purpose") != "reset":
         return {"success": False, "message": "No reset OTP request found"}
 
-    if datetime.utcnow() > record["expires"]:
-        del otp_store[req.email]
+    if otp_expired(record):
+        otp_store.invalidate(req.email)
         return {"success": False, "message": "OTP expired"}
 
     if record["otp"] != req.otp:
@@ -354,35 +593,32 @@ async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db
     if not user:
         return {"success": False, "message": "User not found"}
 
-    # Truncate password for bcrypt (72 byte limit)
-    MAX_BCRYPT_BYTES = 72
-    password_bytes = req.new_password.encode("utf-8")[:MAX_BCRYPT_BYTES]
-    safe_password = password_bytes.decode("utf-8", errors="ignore")
-    user.hashed_password = pwd_context.hash(safe_password)
+    user.hashed_password = await hash_password(req.new_password)
 
     db.commit()
+    revoke_tokens(user.username)
 
-    del otp_store[req.email]
+    otp_store.invalidate(req.email)
 
     return {"success": True, "message": "Password reset successful"}
 # ----------------------------
 # User login
 # ----------------------------
 @app.post("/login")
-def login(
+async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     identifier = form_data.username
 
-    user = db.query(User).filter(
+    user = await run_in_threadpool(lambda: db.query(User).filter(
         or_(
             User.username == identifier,
             User.email == identifier
         )
-    ).first()
+    ).first())
 
-    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid username or password")
 
     token = create_access_token(user.username)
@@ -395,15 +631,206 @@ def login(
 # ----------------------------
 # Image prediction
 # ----------------------------
+async def read_upload(file):
+    # Read at most one byte past the limit instead of buffering any size of upload
+    with stage("upload_read"):
+        contents = await file.read(MAX_IMAGE_BYTES + 1)
+    if len(contents) > MAX_IMAGE_BYTES:
+        raise HTTPException(status_code=413, detail=f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return contents
+
+
+async def decode_upload(contents):
+    try:
+        return await run_in_threadpool(preprocess_bytes, contents)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DECODE_ERRORS as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
-    contents = await file.read()
-    image = Image.open(io.BytesIO(contents)).convert("RGB")
-    temp_path = "temp_upload.jpg"
-    image.save(temp_path)
-    pred_dict = predict_image(temp_path)
+async def predict(
+    file: UploadFile = File(...),
+    tta: bool = False,
+    response_format: Literal["text", "numeric"] = Query("text", alias="format"),
+    current_user: User = Depends(get_current_user),
+):
+    contents = await read_upload(file)
+    # Hashing a large upload and a shared-cache lookup both stay off the event loop
+    with stage("cache_lookup"):
+        key = await run_in_threadpool(content_key, contents)
+        if tta:
+            key = "tta:" + key
+        row = await run_in_threadpool(prediction_cache.get, key)
+    if row is None:
+        img_tensor = await decode_upload(contents)
+        # With TTA the row is [mean, std] over flips/crops/ensemble members
+        with stage("inference"):  # queue wait + batched forward pass
+            row = (await (tta_scheduler if tta else scheduler).predict(img_tensor)).tolist()
+        await run_in_threadpool(prediction_cache.set, key, row)
+    if response_format == "numeric":
+        # Floats in RESPONSE_METADATA label order; units are sent once alongside
+        if tta:
+            mean, std = numeric_predictions(row)
+            return {"filename": file.filename, **RESPONSE_METADATA, "values": mean, "uncertainty": std}
+        return {"filename": file.filename, **RESPONSE_METADATA, "values": numeric_predictions(row)}
+    if tta:
+        mean, std = row
+        return {"filename": file.filename, "predictions": format_predictions(mean), "uncertainty": format_predictions(std)}
+    pred_dict = format_predictions(row)
     return {"filename": file.filename, "predictions": pred_dict}
 
+
+@app.post("/similar")
+async def similar_images(
+    file: UploadFile = File(...),
+    k: int = Query(10, ge=1, le=100),
+    add: bool = False,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    The k indexed images that look most like the upload (cosine similarity
+    of backbone features), with the upload's own predictions. add=true also
+    appends the upload to the index, after the search.
+    """
+    if not inference.is_ready():
+        raise HTTPException(status_code=503, detail="Model is not loaded yet")
+    if inference.BACKEND != "eager":
+        raise HTTPException(status_code=501, detail=f"Embeddings need INFERENCE_BACKEND=eager, not {inference.BACKEND}")
+    img_tensor = await decode_upload(await read_upload(file))
+    row, features = await embedding_scheduler.predict(img_tensor)
+
+    neighbours = await run_in_threadpool(embedding_index.search, features, k)
+    if add:
+        meta = {
+            "filename": file.filename,
+            "values": numeric_predictions(row),
+            "added_by": current_user.username,
+            "added_at": datetime.utcnow().isoformat(),
+        }
+        await run_in_threadpool(embedding_index.add, features[None], [meta])
+    return {
+        "filename": file.filename,
+        "predictions": format_predictions(row),
+        "labels": RESPONSE_METADATA["labels"],  # order of each neighbour's "values"
+        "neighbours": [{"row": row_id, "similarity": round(score, 4), **meta} for score, row_id, meta in neighbours],
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return prediction_cache.stats()
+
+# ----------------------------
+# Metrics and profiling
+# ----------------------------
+@app.get("/metrics")
+def metrics_endpoint():
+    """
+    Prometheus text format: HTTP latency per route, aqi_stage_seconds per
+    stage, batch sizes and queue depth, DB pool and WAQI call metrics.
+    """
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def require_profiling():
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+# async so that pyinstrument attaches to the event loop thread
+@app.post("/debug/profiler/start", dependencies=[Depends(require_profiling)])
+async def start_profiler(
+    kind: Literal["stacks", "pyinstrument"] = "stacks",
+    interval_ms: float = Query(5.0, gt=0, le=1000),
+    current_user: User = Depends(get_current_user),
+):
+    try:
+        metrics.start_profiler(kind, interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"profiling": kind, "interval_ms": interval_ms}
+
+
+@app.post("/debug/profiler/stop", dependencies=[Depends(require_profiling)])
+async def stop_profiler(current_user: User = Depends(get_current_user)):
+    """
+    Stop the profiler and return its report: collapsed stacks for "stacks"
+    (feed to flamegraph.pl or speedscope), a call tree for "pyinstrument".
+    """
+    try:
+        return PlainTextResponse(metrics.stop_profiler())
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+def iter_upload_images(files):
+    """
+    Yield (name, bytes) for every uploaded image, expanding zip archives
+    member by member so archives are never read into memory whole.
+    A damaged archive or member, or one over MAX_IMAGE_BYTES, yields the
+    error in place of the bytes.
+    """
+    for upload in files:
+        upload.file.seek(0)
+        if not zipfile.is_zipfile(upload.file):
+            upload.file.seek(0)
+            data = upload.file.read(MAX_IMAGE_BYTES + 1)
+            if len(data) > MAX_IMAGE_BYTES:
+                data = ImageTooLarge(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+            yield upload.filename, data
+            continue
+
+        upload.file.seek(0)
+        try:
+            archive = zipfile.ZipFile(upload.file)
+        except zipfile.BadZipFile as e:
+            yield upload.filename, e
+            continue
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                name = f"{upload.filename}/{info.filename}"
+                if info.file_size > MAX_IMAGE_BYTES:
+                    yield name, ImageTooLarge(f"Image is {info.file_size} bytes, the limit is {MAX_IMAGE_BYTES}")
+                    continue
+                try:
+                    data = archive.read(info)
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError, EOFError) as e:
+                    # CRC mismatch, encrypted member, unsupported compression, truncation
+                    yield name, e
+                    continue
+                yield name, data
+
+
+@app.post("/predict/batch")
+async def predict_batch_upload(
+    files: List[UploadFile] = File(...),
+    response_format: Literal["text", "numeric"] = Query("text", alias="format"),
+    current_user: User = Depends(get_current_user),
+):
+    images = iter_upload_images(files)
+    numeric = response_format == "numeric"
+
+    def next_chunk():
+        return predict_chunk(list(islice(images, PREDICT_CHUNK_SIZE)), cache=prediction_cache, numeric=numeric)
+
+    async def stream_results():
+        # Numeric streams start with one {"labels", "units"} line; each
+        # result then carries a "values" list in that order
+        if numeric:
+            yield json.dumps(RESPONSE_METADATA) + "\n"
+        while True:
+            results = await run_in_threadpool(next_chunk)
+            if not results:
+                break
+            for result in results:
+                yield json.dumps(result) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
 # ----------------------------
 # Run
 # ----------------------------
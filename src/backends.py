@@ -0,0 +1,104 @@
+import os
+import numpy as np
+import torch
+from model import load_model, forward_with_features
+
+BACKENDS = ("eager", "torchscript", "onnx", "int8")
+
+
+# -------------------------------
+# ARTIFACT NAMES
+# -------------------------------
+def export_paths(export_dir, model_name):
+    """
+    Where export.py and quantize.py write the artifacts for one model.
+    """
+    return {
+        "torchscript": os.path.join(export_dir, f"{model_name}_aqi.torchscript.pt"),
+        "onnx": os.path.join(export_dir, f"{model_name}_aqi.onnx"),
+        "int8": os.path.join(export_dir, f"{model_name}_aqi_int8.torchscript.pt"),
+        "scaler": os.path.join(export_dir, "label_scaler.save"),
+    }
+
+
+# -------------------------------
+# BACKENDS
+# -------------------------------
+# Each backend is called with an N x 3 x 224 x 224 float tensor and returns
+# the scaled N x 7 predictions as a numpy array. Backends that can also
+# return penultimate-layer features implement embed(batch).
+
+class EagerBackend:
+    def __init__(self, model, device, channels_last=False):
+        self.model = model
+        self.device = device
+        self.channels_last = channels_last
+
+    def _prepare(self, batch):
+        batch = batch.to(self.device)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def __call__(self, batch):
+        with torch.no_grad():
+            return self.model(self._prepare(batch)).cpu().numpy()
+
+    def embed(self, batch):
+        """
+        (N x 7 scaled predictions, N x D float32 features) as numpy arrays.
+        """
+        with torch.no_grad():
+            preds, features = forward_with_features(self.model, self._prepare(batch))
+        return preds.cpu().numpy(), features.float().cpu().numpy()
+
+
+class TorchScriptBackend(EagerBackend):
+    embed = None  # scripted modules do not run forward hooks
+
+    def __init__(self, path, device, channels_last=False):
+        model = torch.jit.load(path, map_location=device)
+        model.eval()
+        super().__init__(model, device, channels_last)
+
+
+class OnnxBackend:
+    def __init__(self, path, num_threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("The onnx backend needs onnxruntime: pip install onnxruntime")
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        inputs = batch.cpu().numpy().astype(np.float32, copy=False)
+        return self.session.run(None, {self.input_name: inputs})[0]
+
+
+def load_backend(kind, model_name, model_path, export_dir, device,
+                 quantize=None, channels_last=False, num_threads=None, mmap=False):
+    """
+    Build the inference backend selected by kind ("eager", "torchscript", "onnx"
+    or "int8"). Eager loads the state-dict checkpoint, optionally with dynamic
+    quantization or memory-mapped weights; the others load artifacts from
+    export.py / quantize.py.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if kind == "eager":
+        model = load_model(model_name, model_path, device, quantize=quantize, channels_last=channels_last, mmap=mmap)
+        return EagerBackend(model, device, channels_last)
+
+    paths = export_paths(export_dir, model_name)
+    if kind == "torchscript":
+        return TorchScriptBackend(paths["torchscript"], device, channels_last)
+    if kind == "int8":
+        return TorchScriptBackend(paths["int8"], torch.device("cpu"))
+    if kind == "onnx":
+        return OnnxBackend(paths["onnx"], num_threads)
+    raise ValueError(f"Unknown inference backend: {kind} (expected one of {', '.join(BACKENDS)})")
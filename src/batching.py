@@ -0,0 +1,109 @@
+import time
+import queue
+import asyncio
+import threading
+import weakref
+from concurrent.futures import Future
+from metrics import BATCH_SIZE_BUCKETS, Gauge, Histogram
+
+_schedulers = weakref.WeakSet()
+BATCH_SIZE = Histogram("aqi_batch_size", "Items per dispatched batch", ["scheduler"], buckets=BATCH_SIZE_BUCKETS)
+QUEUE_WAIT = Histogram("aqi_batch_queue_wait_seconds", "Time from submit until the batch starts", ["scheduler"])
+BATCH_SECONDS = Histogram("aqi_batch_run_seconds", "Time to run one batch", ["scheduler"])
+QUEUE_DEPTH = Gauge(
+    "aqi_batch_queue_depth", "Requests waiting to be batched", ["scheduler"],
+    fn=lambda: {(s.name,): s.pending() for s in list(_schedulers)},
+)
+
+
+class BatchScheduler:
+    """
+    Gathers single requests from concurrent callers into one batch.
+
+    A batch is dispatched once it holds max_batch_size items or the oldest
+    request has waited max_wait_ms. run_batch is called on a dedicated worker
+    thread with the list of queued items and must return one output row per
+    item; each caller's future resolves to its own row. name labels the
+    scheduler's queue and batch metrics.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, name="batch"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        if max_wait_ms < 0:
+            raise ValueError("max_wait_ms must not be negative")
+        self.run_batch = run_batch
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        _schedulers.add(self)
+
+    def submit(self, item):
+        """
+        Queue one item and return a concurrent.futures.Future for its row.
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    async def predict(self, item):
+        """
+        Awaitable wrapper around submit() for async request handlers.
+        """
+        return await asyncio.wrap_future(self.submit(item))
+
+    def pending(self):
+        """
+        Number of requests waiting to be batched.
+        """
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, name="inference-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Skip callers that gave up while waiting
+        return [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        start = time.perf_counter()
+        BATCH_SIZE.observe(len(batch), scheduler=self.name)
+        for _, _, queued_at in batch:
+            QUEUE_WAIT.observe(start - queued_at, scheduler=self.name)
+        try:
+            outputs = self.run_batch([item for item, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            BATCH_SECONDS.observe(time.perf_counter() - start, scheduler=self.name)
+        for row, (_, future, _) in zip(outputs, batch):
+            future.set_result(row)
@@ -0,0 +1,129 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire ttl seconds after being set.
+    maxsize=0 disables caching (every get is a miss, set is a no-op).
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires = entry
+                if self.clock() < expires:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, self.clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def sweep(self):
+        """
+        Drop expired entries now instead of when they are next read.
+        Returns how many were removed.
+        """
+        with self._lock:
+            now = self.clock()
+            expired = [key for key, (_, expires) in self._data.items() if expires <= now]
+            for key in expired:
+                del self._data[key]
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+            }
+
+
+class RedisCache:
+    """
+    Same interface as TTLCache, backed by Redis so several uvicorn workers
+    share entries. Values must be JSON-serializable. Expiry uses Redis TTLs;
+    size is bounded by the server's maxmemory policy (use allkeys-lru).
+    Hit/miss counters are per process.
+    """
+
+    def __init__(self, url, ttl=300, prefix="cache:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("A redis:// cache URL needs the redis package: pip install redis")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        self.client.setex(self.prefix + key, int(self.ttl), json.dumps(value))
+
+    def invalidate(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def sweep(self):
+        return 0  # Redis expires keys itself
+
+    def stats(self):
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
+
+
+def make_cache(url=None, maxsize=1024, ttl=300, prefix="cache:"):
+    """
+    Build a RedisCache for a redis:// URL, otherwise an in-process TTLCache.
+    """
+    if url:
+        return RedisCache(url, ttl=ttl, prefix=prefix)
+    return TTLCache(maxsize=maxsize, ttl=ttl)
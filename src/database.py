@@ -1,12 +1,92 @@
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
+from metrics import Gauge
 
 DATABASE_URL = os.environ["DATABASE_URL"] # MUST come from env
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not set")
 
-engine = create_engine(DATABASE_URL)
+# Connection pool: size and overflow bound the open connections per worker,
+# pre-ping drops connections the server closed, recycle retires them before
+# server-side idle timeouts. Sizing is left to SQLAlchemy for SQLite.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# Async engine for the hot request paths (the per-request user lookup).
+# ASYNC_DATABASE_URL overrides the driver; DB_ASYNC=1 derives it from
+# DATABASE_URL (postgresql -> asyncpg, sqlite -> aiosqlite)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+DB_ASYNC = os.getenv("DB_ASYNC") == "1" or bool(ASYNC_DATABASE_URL)
+
+_ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_url(url):
+    """
+    The async-driver form of a sync database URL.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}; set ASYNC_DATABASE_URL")
+    return url.set(drivername=_ASYNC_DRIVERS[backend])
+
+
+def pool_options(url):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    return options
+
+
+engine = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
+
+async_engine = None
+AsyncSessionLocal = None
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url = ASYNC_DATABASE_URL or async_url(DATABASE_URL)
+    try:
+        async_engine = create_async_engine(_async_url, **pool_options(_async_url))
+    except ImportError as e:
+        raise RuntimeError(f"DB_ASYNC needs an async driver (pip install asyncpg or aiosqlite): {e}")
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def pool_stats():
+    """
+    Connections per engine pool and state, for the db_pool_connections gauge.
+    """
+    stats = {}
+    pools = [("sync", engine.pool)]
+    if async_engine is not None:
+        pools.append(("async", async_engine.sync_engine.pool))
+    for name, pool in pools:
+        if not hasattr(pool, "checkedout"):
+            continue  # pools without accounting (e.g. NullPool)
+        stats[(name, "checked_out")] = pool.checkedout()
+        stats[(name, "idle")] = pool.checkedin()
+        stats[(name, "overflow")] = max(pool.overflow(), 0)
+        stats[(name, "size")] = pool.size()
+    return stats
+
+
+DB_POOL = Gauge("db_pool_connections", "Database pool connections by state", ["engine", "state"], fn=pool_stats)
+
+
+# DB dependency
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -1,15 +1,35 @@
 import os
+import argparse
+from multiprocessing import Pool
+import joblib
+import numpy as np
 import torch
 from torch.utils.data import Dataset, DataLoader
 from PIL import Image
 from torchvision import transforms
+from imaging import decode, load_resized
+
+LABEL_COLS = ['AQI','PM2.5','PM10','O3','CO','SO2','NO2']
+
+def load_dataframe(csv_path, scaler_path=None):
+    """
+    Read the labels CSV. With scaler_path, the label columns are scaled with
+    the saved MinMaxScaler, which is what the models are trained on.
+    """
+    import pandas as pd  # training-only dependency, not in the serving image
+
+    df = pd.read_csv(csv_path)
+    if scaler_path:
+        scaler = joblib.load(scaler_path)
+        df[LABEL_COLS] = scaler.transform(df[LABEL_COLS].astype(float))
+    return df
 
 class AirQualityDataset(Dataset):
     def __init__(self, df, img_dir, transform=None):
         self.df = df.reset_index(drop=True)
         self.img_dir = img_dir
         self.transform = transform
-        self.label_cols = ['AQI','PM2.5','PM10','O3','CO','SO2','NO2']
+        self.label_cols = LABEL_COLS
 
     def __len__(self):
         return len(self.df)
@@ -22,7 +42,8 @@ class AirQualityDataset(Dataset):
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"File not found: {img_path}")
 
-        img = Image.open(img_path).convert("RGB")
+        # Same decode stage as serving, so training sees what /predict sees
+        img = decode(img_path)
         if self.transform:
             img = self.transform(img)
 
@@ -33,6 +54,130 @@ class AirQualityDataset(Dataset):
 
         return img, labels
 
-def get_loader(df, img_dir, batch_size=32, shuffle=False, transform=None):
+# -------------------------------
+# PRE-DECODED, MEMORY-MAPPED CACHE
+# -------------------------------
+def cache_paths(cache_dir):
+    return {
+        "images": os.path.join(cache_dir, "images.npy"),
+        "labels": os.path.join(cache_dir, "labels.npy"),
+        "filenames": os.path.join(cache_dir, "filenames.txt"),
+    }
+
+
+def build_cache(df, img_dir, cache_dir, size=224, workers=None):
+    """
+    Decode and resize every image once and write them to cache_dir as an
+    N x size x size x 3 uint8 .npy file, with the labels as N x 7 float32.
+    Both are memory-mapped by CachedAirQualityDataset.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    paths = cache_paths(cache_dir)
+    df = df.reset_index(drop=True)
+    filenames = [f.strip() for f in df["Filename"]]
+
+    images = np.lib.format.open_memmap(paths["images"], mode="w+", dtype=np.uint8, shape=(len(df), size, size, 3))
+    tasks = ((i, os.path.join(img_dir, name), size) for i, name in enumerate(filenames))
+    with Pool(workers or os.cpu_count()) as pool:
+        for i, array, error in pool.imap(load_resized, tasks, chunksize=16):
+            if error is not None:
+                raise FileNotFoundError(f"Could not load {filenames[i]}: {error}")
+            images[i] = array
+    images.flush()
+    del images
+
+    np.save(paths["labels"], df[LABEL_COLS].to_numpy(dtype=np.float32))
+    with open(paths["filenames"], "w") as f:
+        f.write("\n".join(filenames) + "\n")
+
+
+class CachedAirQualityDataset(Dataset):
+    """
+    Serves samples from a build_cache() directory without decoding.
+
+    Images come back as float 3 x H x W tensors in [0, 1], i.e. what
+    Resize + ToTensor produce, so transform only needs the remaining steps
+    (normally transforms.Normalize). The image file is memory-mapped per
+    process, so DataLoader workers share the OS page cache.
+    """
+
+    def __init__(self, cache_dir, transform=None, indices=None):
+        self.paths = cache_paths(cache_dir)
+        self.transform = transform
+        self.labels = torch.from_numpy(np.load(self.paths["labels"]))
+        self.indices = np.arange(len(self.labels)) if indices is None else np.asarray(indices)
+        self._images = None
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getstate__(self):
+        # Never pickle the mapped array into worker processes; each reopens it
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+    @property
+    def images(self):
+        if self._images is None:
+            # Copy-on-write mapping: writable for torch.from_numpy, but nothing is copied
+            self._images = np.load(self.paths["images"], mmap_mode="c")
+        return self._images
+
+    def __getitem__(self, idx):
+        i = self.indices[idx]
+        img = torch.from_numpy(self.images[i]).permute(2, 0, 1).float().div_(255)
+        if self.transform:
+            img = self.transform(img)
+        return img, self.labels[i]
+
+
+# -------------------------------
+# LOADERS
+# -------------------------------
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))  # respects container CPU limits
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def loader_kwargs(num_workers=None, pin_memory=None, prefetch_factor=None, persistent_workers=None):
+    """
+    DataLoader options with defaults picked from the machine: one decode
+    worker per core minus one for the training loop (at most 8), pinned
+    memory only when batches go to a GPU, and workers kept alive between
+    epochs. Any argument that is not None overrides its default.
+    """
+    if num_workers is None:
+        num_workers = min(8, max(0, available_cores() - 1))
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    kwargs = {"num_workers": num_workers, "pin_memory": pin_memory}
+    if num_workers > 0:
+        kwargs["persistent_workers"] = True if persistent_workers is None else persistent_workers
+        kwargs["prefetch_factor"] = prefetch_factor or 4
+    return kwargs
+
+
+def get_loader(df, img_dir, batch_size=32, shuffle=False, transform=None, **loader_options):
+    """
+    loader_options are passed to loader_kwargs (num_workers, pin_memory, ...).
+    """
     dataset = AirQualityDataset(df, img_dir, transform)
-    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle)
\ No newline at end of file
+    return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, **loader_kwargs(**loader_options))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-decode a labelled image set into a memory-mapped cache.")
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--img-dir", required=True)
+    parser.add_argument("--out", required=True, help="cache directory")
+    parser.add_argument("--scaler", default="models/label_scaler.save", help="scale labels as in training")
+    parser.add_argument("--size", type=int, default=224)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    build_cache(load_dataframe(args.csv, args.scaler), args.img_dir, args.out, args.size, args.workers)
+    print(f"Cache written to {args.out}")
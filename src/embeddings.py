@@ -0,0 +1,286 @@
+"""
+On-disk nearest-neighbour index over image embeddings (the penultimate-layer
+features from inference.predict_embeddings).
+
+An index is a directory:
+    index.json      vector dimension and format version
+    vectors.f16     N x D float16 unit vectors, row-major, append-only
+    meta.jsonl      one JSON object per row (filename, predictions, ...)
+    offsets.u64     end offset of each row's line in meta.jsonl
+    centroids.npy   optional IVF coarse quantizer (see EmbeddingIndex.train)
+    lists.i32       the IVF list of each row, appended alongside the vectors
+
+Train the IVF quantizer once the index is large (hundreds of thousands of
+rows); rows appended later are assigned to a list as they arrive:
+
+    python -m src.embeddings data/embeddings --train
+"""
+import os
+import json
+import argparse
+import threading
+import numpy as np
+
+FORMAT_VERSION = 1
+SCAN_CHUNK_ROWS = 32768  # rows converted to float32 at a time by an exact scan
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """
+    Append-only cosine-similarity index over a directory of memory-mapped
+    float16 vectors (2 bytes per dimension, 1 KB per resnet embedding).
+
+    Before train(), a search is an exact scan of every row in chunks. After
+    it, a search scores only the rows in the nprobe inverted lists whose
+    centroids are closest to the query, so its cost follows the list sizes
+    rather than the index size. One process appends; other processes see
+    the new rows after refresh(). Training may run in another process: the
+    appender picks up the new quantizer on its next add(). Safe to use from
+    several threads.
+    """
+
+    def __init__(self, path, nprobe=16):
+        self.path = path
+        self.nprobe = nprobe
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __len__(self):
+        return self._size
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def refresh(self):
+        """
+        (Re)read the index from disk. A row is only counted once every file
+        holds it, so a crash mid-append leaves a partial row that is ignored
+        and overwritten by the next append.
+        """
+        with self._lock:
+            self.dim, self.centroids, self._lists, self._vectors = None, None, None, None
+            self._size, self._ivf_version = 0, None
+            if not os.path.exists(self._file("index.json")):
+                return
+            with open(self._file("index.json")) as f:
+                self.dim = json.load(f)["dim"]
+            self._size = min(self._rows("vectors.f16", 2 * self.dim), self._rows("offsets.u64", 8))
+            self._load_ivf()
+
+    def _centroids_version(self):
+        # train() replaces the file, so a new inode also marks a retrain on coarse-mtime filesystems
+        try:
+            stat = os.stat(self._file("centroids.npy"))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load_ivf(self):
+        """
+        Read the IVF quantizer, if trained. Rows past the end of lists.i32
+        (appended by a process that had not seen the training yet) are
+        assigned here rather than dropped; the next add() writes them.
+        """
+        self.centroids, self._lists = None, None
+        self._ivf_version = self._centroids_version()
+        if self._ivf_version is None:
+            return
+        self.centroids = np.load(self._file("centroids.npy"))
+        assigned = min(self._rows("lists.i32", 4), self._size)
+        assignments = np.empty(0, np.int32)
+        if assigned:
+            assignments = np.fromfile(self._file("lists.i32"), dtype=np.int32, count=assigned)
+        if assigned < self._size:
+            assignments = np.concatenate([assignments, self._assign(self._mapped()[assigned:])])
+        self._lists = self._group(assignments)
+
+    def _rows(self, name, row_bytes):
+        path = self._file(name)
+        return os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+
+    def _write_at(self, name, offset, data):
+        path = self._file(name)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(offset)
+            f.write(data)
+            f.truncate()
+
+    def _mapped(self):
+        if self._vectors is None and self._size:
+            self._vectors = np.memmap(self._file("vectors.f16"), dtype=np.float16, mode="r",
+                                      shape=(self._size, self.dim))
+        return self._vectors
+
+    def _group(self, assignments, first_row=0):
+        """
+        Row ids per IVF list, as one sorted int64 array per centroid.
+        """
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(self.centroids) + 1))
+        return [order[bounds[i]:bounds[i + 1]] + first_row for i in range(len(self.centroids))]
+
+    def _assign(self, vectors, centroids=None):
+        centroids = self.centroids if centroids is None else centroids
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), SCAN_CHUNK_ROWS):
+            chunk = np.asarray(vectors[start:start + SCAN_CHUNK_ROWS], dtype=np.float32)
+            assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignments
+
+    # -------------------------------
+    # APPEND
+    # -------------------------------
+    def add(self, vectors, metadata):
+        """
+        Append N x D vectors (normalized here) with one JSON-serializable
+        metadata dict per row. Returns the new row ids.
+        """
+        vectors = normalize(np.asarray(vectors, dtype=np.float32).reshape(len(metadata), -1))
+        lines = [(json.dumps(m) + "\n").encode("utf-8") for m in metadata]
+        with self._lock:
+            if self.dim is None:
+                os.makedirs(self.path, exist_ok=True)
+                with open(self._file("index.json"), "w") as f:
+                    json.dump({"dim": vectors.shape[1], "version": FORMAT_VERSION}, f)
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+            if self._centroids_version() != self._ivf_version:
+                self._load_ivf()  # trained by another process since this one loaded
+
+            start = self._size
+            meta_end = int(self._meta_ends()[start - 1]) if start else 0
+            ends = meta_end + np.cumsum([len(line) for line in lines], dtype=np.uint64)
+            self._write_at("meta.jsonl", meta_end, b"".join(lines))
+            self._write_at("offsets.u64", start * 8, ends.tobytes())
+            if self.centroids is not None:
+                assignments = self._assign(vectors)
+                assigned = min(self._rows("lists.i32", 4), start)
+                gap = self._assign(self._mapped()[assigned:start]) if assigned < start else np.empty(0, np.int32)
+                self._write_at("lists.i32", assigned * 4, np.concatenate([gap, assignments]).tobytes())
+            # Written last: a row counts once its vector is on disk
+            self._write_at("vectors.f16", start * 2 * self.dim, vectors.astype(np.float16).tobytes())
+
+            rows = np.arange(start, start + len(vectors))
+            if self.centroids is not None:
+                for i in np.unique(assignments):
+                    self._lists[i] = np.concatenate([self._lists[i], rows[assignments == i]])
+            self._size += len(vectors)
+            self._vectors = None  # remapped at the new size on next use
+        return rows
+
+    # -------------------------------
+    # SEARCH
+    # -------------------------------
+    def _meta_ends(self):
+        return np.memmap(self._file("offsets.u64"), dtype=np.uint64, mode="r", shape=(self._size,))
+
+    def metadata(self, rows):
+        """
+        The metadata dicts of the given row ids, read from meta.jsonl.
+        """
+        if not len(rows):
+            return []
+        ends = self._meta_ends()
+        results = []
+        with open(self._file("meta.jsonl"), "rb") as f:
+            for row in rows:
+                start = int(ends[row - 1]) if row else 0
+                f.seek(start)
+                results.append(json.loads(f.read(int(ends[row]) - start)))
+        return results
+
+    def search(self, query, k=10, nprobe=None, exact=False):
+        """
+        The k rows most similar to a D-dimensional query vector, as
+        (cosine similarity, row id, metadata) tuples, most similar first.
+        exact=True scans every row even when the index is trained.
+        """
+        query = normalize(np.asarray(query, dtype=np.float32).reshape(-1))
+        with self._lock:
+            size, vectors, centroids, lists = self._size, self._mapped(), self.centroids, self._lists
+        if not size:
+            return []
+
+        if centroids is None or exact:
+            rows = None
+            scores = np.empty(size, dtype=np.float32)
+            for start in range(0, size, SCAN_CHUNK_ROWS):
+                chunk = vectors[start:start + SCAN_CHUNK_ROWS]
+                scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        else:
+            probe = np.argsort(centroids @ query)[-(nprobe or self.nprobe):]
+            # Sorted so the memory-mapped rows are read in file order
+            rows = np.sort(np.concatenate([lists[i] for i in probe]))
+            rows = rows[:np.searchsorted(rows, size)]  # appended after the snapshot
+            scores = vectors[rows].astype(np.float32) @ query
+
+        top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        ids = top if rows is None else rows[top]
+        return [(float(scores[i]), int(row), meta) for i, row, meta in zip(top, ids, self.metadata(ids))]
+
+    # -------------------------------
+    # IVF TRAINING
+    # -------------------------------
+    def train(self, nlist=None, sample_size=None, iterations=10, seed=0):
+        """
+        Fit nlist centroids (default sqrt(N)) with spherical k-means on a
+        sample of the rows, then assign every row to its nearest centroid.
+        Appends and searches wait until training finishes.
+        """
+        with self._lock:
+            if not self._size:
+                raise ValueError("Cannot train an empty index")
+            vectors = self._mapped()
+            nlist = min(nlist or max(1, int(np.sqrt(self._size))), self._size)
+            rng = np.random.default_rng(seed)
+            sample_size = min(self._size, sample_size or 64 * nlist)
+            sample = vectors[np.sort(rng.choice(self._size, sample_size, replace=False))].astype(np.float32)
+
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+            for _ in range(iterations):
+                assignments = np.argmax(sample @ centroids.T, axis=1)
+                order = np.argsort(assignments, kind="stable")
+                used, starts = np.unique(assignments[order], return_index=True)
+                sums = sample[rng.choice(len(sample), nlist)]  # reseeds empty clusters
+                sums[used] = np.add.reduceat(sample[order], starts, axis=0)
+                centroids = normalize(sums)
+
+            assignments = self._assign(vectors, centroids)
+            tmp = self._file("lists.i32.tmp")
+            assignments.tofile(tmp)
+            os.replace(tmp, self._file("lists.i32"))
+            tmp = self._file("centroids.tmp.npy")
+            np.save(tmp, centroids.astype(np.float32))
+            os.replace(tmp, self._file("centroids.npy"))
+
+            self.centroids = centroids.astype(np.float32)
+            self._lists = self._group(assignments)
+            self._ivf_version = self._centroids_version()
+        return nlist
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("index_dir")
+    parser.add_argument("--train", action="store_true", help="fit the IVF centroids and assign every row")
+    parser.add_argument("--lists", type=int, default=None, help="number of IVF lists (default sqrt(N))")
+    args = parser.parse_args()
+
+    index = EmbeddingIndex(args.index_dir)
+    print(f"{len(index)} rows, dim {index.dim}, "
+          f"{'IVF with %d lists' % len(index.centroids) if index.centroids is not None else 'exact search'}")
+    if args.train:
+        nlist = index.train(args.lists)
+        sizes = np.array([len(rows) for rows in index._lists])
+        print(f"Trained {nlist} lists: {sizes.mean():.0f} rows on average, largest {sizes.max()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Export a trained checkpoint to TorchScript and ONNX for faster CPU serving.
+
+    python -m src.export --checkpoint models/resnet34_aqi.pth --model-name resnet34
+
+Writes <model>_aqi.torchscript.pt, <model>_aqi.onnx and a copy of the label
+scaler into --out-dir, then checks that every backend gives the same outputs
+as the eager model on a random batch. Serve the artifacts with
+INFERENCE_BACKEND=torchscript or INFERENCE_BACKEND=onnx.
+"""
+import os
+import shutil
+import argparse
+import numpy as np
+import torch
+from model import load_model
+from backends import export_paths, EagerBackend, TorchScriptBackend, OnnxBackend
+from inference import IMAGE_SIZE
+
+
+def export_model(model_name, checkpoint, scaler_path, out_dir, onnx=True):
+    os.makedirs(out_dir, exist_ok=True)
+    paths = export_paths(out_dir, model_name)
+    device = torch.device("cpu")
+
+    model = load_model(model_name, checkpoint, device)
+    example = torch.randn(1, 3, IMAGE_SIZE, IMAGE_SIZE)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+    traced = torch.jit.freeze(traced)
+    traced.save(paths["torchscript"])
+    print(f"Saved {paths['torchscript']}")
+
+    if onnx:
+        torch.onnx.export(
+            model, (example,), paths["onnx"],
+            input_names=["image"], output_names=["scaled_labels"],
+            dynamic_axes={"image": {0: "batch"}, "scaled_labels": {0: "batch"}},
+            dynamo=False,
+        )
+        print(f"Saved {paths['onnx']}")
+
+    shutil.copyfile(scaler_path, paths["scaler"])
+    print(f"Saved {paths['scaler']}")
+    return model, paths
+
+
+def check_parity(model, paths, onnx=True, batch_size=4, atol=1e-3):
+    """
+    Compare exported backends against the eager model on one random batch.
+    Returns {backend: max absolute difference} and raises if any exceeds atol.
+    """
+    device = torch.device("cpu")
+    batch = torch.randn(batch_size, 3, IMAGE_SIZE, IMAGE_SIZE)
+    reference = EagerBackend(model, device)(batch)
+
+    backends = {"torchscript": TorchScriptBackend(paths["torchscript"], device)}
+    if onnx:
+        backends["onnx"] = OnnxBackend(paths["onnx"])
+
+    diffs = {}
+    for name, backend in backends.items():
+        diffs[name] = float(np.abs(backend(batch) - reference).max())
+        print(f"{name}: max abs diff vs eager = {diffs[name]:.2e}")
+    bad = {name: d for name, d in diffs.items() if d > atol}
+    if bad:
+        raise RuntimeError(f"Exported outputs differ from eager model beyond {atol}: {bad}")
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--checkpoint", default="models/resnet34_aqi.pth")
+    parser.add_argument("--model-name", default="resnet34", choices=["resnet18", "resnet34", "mobilenet_v2"])
+    parser.add_argument("--scaler", default="models/label_scaler.save")
+    parser.add_argument("--out-dir", default="models/export")
+    parser.add_argument("--skip-onnx", action="store_true", help="only write the TorchScript artifact")
+    args = parser.parse_args()
+
+    onnx = not args.skip_onnx
+    model, paths = export_model(args.model_name, args.checkpoint, args.scaler, args.out_dir, onnx=onnx)
+    check_parity(model, paths, onnx=onnx)
+
+
+if __name__ == "__main__":
+    main()
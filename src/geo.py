@@ -0,0 +1,168 @@
+import math
+import bisect
+import threading
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+GEOHASH_PRECISION = 6  # ~1.2 x 0.6 km cells
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distance from (lat, lon) to each of lats/lons, in km.
+    Works on scalars or numpy arrays.
+    """
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# -------------------------------
+# GEOHASH (stored per reading, indexed in the DB)
+# -------------------------------
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, x = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if x >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision):
+    """
+    (lat, lon) size in degrees of a geohash cell at this precision.
+    """
+    lon_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_geohashes(lat, lon, radius_km, max_cells=32):
+    """
+    Geohash prefixes whose cells together cover the circle of radius_km
+    around (lat, lon). Uses the longest prefix that needs at most max_cells
+    cells, so a DB query is a handful of index range scans.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_lat, cell_lon = geohash_cell_size(precision)
+        rows = math.floor((lat + dlat) / cell_lat) - math.floor((lat - dlat) / cell_lat) + 1
+        cols = math.floor((lon + dlon) / cell_lon) - math.floor((lon - dlon) / cell_lon) + 1
+        if rows * cols <= max_cells or precision == 1:
+            break
+    cells = set()
+    for i in range(rows):
+        for j in range(cols):
+            y = min(lat - dlat + i * cell_lat, lat + dlat)
+            x = min(lon - dlon + j * cell_lon, lon + dlon)
+            cells.add(geohash(max(min(y, 90.0), -90.0), (x + 180.0) % 360.0 - 180.0, precision))
+    return sorted(cells)
+
+
+# -------------------------------
+# IN-MEMORY POINT INDEX
+# -------------------------------
+class PointIndex:
+    """
+    Grid-bucketed in-memory index of located items (readings, stations).
+
+    Items live in cell_deg x cell_deg buckets, kept in timestamp order, so a
+    radius query only computes the vectorized haversine over the few buckets
+    the circle touches. Entries older than max_age_s are dropped from a
+    bucket when it is next added to or queried; sweep() clears buckets that
+    see neither. Safe to use from several threads.
+    """
+
+    def __init__(self, cell_deg=0.05, max_age_s=None):
+        self.cell_deg = cell_deg
+        self.max_age_s = max_age_s
+        self._cells = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(cell[0]) for cell in self._cells.values())
+
+    def _cell(self, lat, lon):
+        return math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)
+
+    @staticmethod
+    def _expire(cell, cutoff):
+        expired = bisect.bisect_left(cell[0], cutoff)
+        if expired:
+            for column in cell:
+                del column[:expired]
+
+    def add(self, lat, lon, timestamp, item):
+        """
+        timestamp is in seconds (e.g. datetime.timestamp()).
+        """
+        with self._lock:
+            times, lats, lons, items = self._cells.setdefault(self._cell(lat, lon), ([], [], [], []))
+            # Usually an append; back-filled (offline) items are inserted in order
+            i = bisect.bisect_right(times, timestamp)
+            times.insert(i, timestamp)
+            lats.insert(i, lat)
+            lons.insert(i, lon)
+            items.insert(i, item)
+            if self.max_age_s is not None:
+                # Items arrive roughly in time order, so this trims a busy cell as it grows
+                self._expire((times, lats, lons, items), timestamp - self.max_age_s)
+
+    def sweep(self, now):
+        """
+        Drop entries older than max_age_s from every bucket, and empty buckets.
+        """
+        if self.max_age_s is None:
+            return
+        with self._lock:
+            for key, cell in list(self._cells.items()):
+                self._expire(cell, now - self.max_age_s)
+                if not cell[0]:
+                    del self._cells[key]
+
+    def query(self, lat, lon, radius_km, since=None, now=None, limit=None):
+        """
+        Items within radius_km of (lat, lon), added at or after since,
+        nearest first, as (distance_km, item) pairs.
+        """
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+        (row0, col0), (row1, col1) = self._cell(lat - dlat, lon - dlon), self._cell(lat + dlat, lon + dlon)
+        cutoff = now - self.max_age_s if self.max_age_s is not None and now is not None else None
+
+        lats, lons, items = [], [], []
+        with self._lock:
+            for row in range(row0, row1 + 1):
+                for col in range(col0, col1 + 1):
+                    cell = self._cells.get((row, col))
+                    if cell is None:
+                        continue
+                    times, cell_lats, cell_lons, cell_items = cell
+                    if cutoff is not None:
+                        self._expire(cell, cutoff)
+                    start = bisect.bisect_left(times, since) if since is not None else 0
+                    lats += cell_lats[start:]
+                    lons += cell_lons[start:]
+                    items += cell_items[start:]
+
+        if not items:
+            return []
+        distances = haversine_km(lat, lon, np.array(lats), np.array(lons))
+        hits = np.flatnonzero(distances <= radius_km)
+        hits = hits[np.argsort(distances[hits], kind="stable")][:limit]
+        return [(float(distances[i]), items[i]) for i in hits]
@@ -0,0 +1,94 @@
+import io
+import os
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+# -------------------------------
+# CONFIG
+# -------------------------------
+# Uploads and dataset files above either limit are rejected before any
+# pixel data is decoded. 32 MB fits a 12 MP PNG; 50 MP covers current
+# phone cameras.
+MAX_IMAGE_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(32 * 1024 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+# Formats tried when identifying a file (phone MPO files open as JPEG)
+IMAGE_FORMATS = [f for f in os.getenv("IMAGE_FORMATS", "JPEG,PNG,WEBP,BMP,GIF,TIFF").split(",") if f]
+
+# The model input size (see inference.IMAGE_SIZE)
+TARGET_SIZE = 224
+# Non-JPEG images are box-reduced to no less than this multiple of the
+# target size, leaving the final resize a small, antialiased step
+REDUCING_GAP = 2
+
+
+class ImageTooLarge(ValueError):
+    """
+    Raised when an image is over MAX_IMAGE_BYTES or MAX_IMAGE_PIXELS.
+    """
+
+
+# Everything decode() raises for a bad or oversized image
+DECODE_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError, ImageTooLarge, OSError)
+
+
+def check_size(num_bytes, max_bytes=None):
+    max_bytes = MAX_IMAGE_BYTES if max_bytes is None else max_bytes
+    if num_bytes > max_bytes:
+        raise ImageTooLarge(f"Image is {num_bytes} bytes, the limit is {max_bytes}")
+
+
+def open_image(source, max_bytes=None, max_pixels=None):
+    """
+    Open encoded image bytes or a file path lazily, reading only the header.
+    Raises ImageTooLarge before decoding if either limit is exceeded.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        check_size(len(source), max_bytes)
+        source = io.BytesIO(source)
+    else:
+        check_size(os.path.getsize(source), max_bytes)
+
+    img = Image.open(source, formats=IMAGE_FORMATS or None)
+    max_pixels = MAX_IMAGE_PIXELS if max_pixels is None else max_pixels
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLarge(f"Image is {width} x {height} pixels, the limit is {max_pixels}")
+    return img
+
+
+def decode(source, size=TARGET_SIZE, max_bytes=None, max_pixels=None):
+    """
+    Decode encoded image bytes or a file path into an RGB image that is
+    still at least size x size, skipping work the final resize would
+    throw away:
+        JPEG      - draft mode: the decoder scales by 1/2, 1/4 or 1/8 in
+                    the DCT domain, so most pixels are never produced
+        other     - full decode (first frame only), then an integer box
+                    reduce down to about REDUCING_GAP x size
+    """
+    img = open_image(source, max_bytes, max_pixels)
+    if img.format in ("JPEG", "MPO"):
+        img.draft("RGB", (size, size))
+    img.load()  # decode here rather than lazily inside the first resize
+
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")  # palette, alpha, CMYK, 16-bit
+    factor = min(img.width, img.height) // (REDUCING_GAP * size)
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def load_resized(task):
+    """
+    Decode one image (see decode) and resize it to size x size.
+    Returns (name, uint8 HWC array or None, error message or None).
+    Takes a single tuple so it can be mapped over a process pool.
+    """
+    name, path, size = task
+    try:
+        img = decode(path, size).resize((size, size), Image.BILINEAR)
+        return name, np.asarray(img, dtype=np.uint8), None
+    except Exception as e:
+        return name, None, str(e)
@@ -1,19 +1,75 @@
+import os
+import hashlib
+import threading
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torchvision import transforms
-from PIL import Image
 import joblib
-from model import get_model  # your custom model loader
+from backends import BACKENDS, load_backend, export_paths
+from batching import BatchScheduler
+from imaging import DECODE_ERRORS, decode
+from metrics import stage
+from workers import InferencePool
 
 
 # -------------------------------
 # CONFIG
 # -------------------------------
-MODEL_PATH = "models/resnet34_aqi.pth"
+MODEL_NAME = os.getenv("MODEL_NAME", "resnet34")  # a model.get_model architecture
+MODEL_PATH = os.getenv("MODEL_PATH", "models/resnet34_aqi.pth")
 SCALER_PATH = "models/label_scaler.save"
+
+# Which runtime executes the forward pass: "eager" (the .pth checkpoint),
+# "torchscript" or "onnx" (artifacts written by `python -m src.export`),
+# or "int8" (static-quantized artifact written by `python -m src.quantize`)
+BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+EXPORT_DIR = os.getenv("INFERENCE_EXPORT_DIR", "models/export")
+if BACKEND not in BACKENDS:
+    raise ValueError(f"INFERENCE_BACKEND must be one of {', '.join(BACKENDS)}, got {BACKEND!r}")
+
+# CPU tuning for the eager backend: int8 dynamic quantization of the head,
+# NHWC memory format, and the torch intra-op thread count (0 = torch default).
+# Static int8 needs calibration data and is served via INFERENCE_BACKEND=int8
+QUANTIZE = os.getenv("INFERENCE_QUANTIZE") or None  # "dynamic"
+CHANNELS_LAST = os.getenv("INFERENCE_CHANNELS_LAST") == "1"
+NUM_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+if QUANTIZE not in (None, "dynamic"):
+    raise ValueError("INFERENCE_QUANTIZE only supports 'dynamic'; use INFERENCE_BACKEND=int8 for static int8")
 DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Process-pool serving: INFERENCE_WORKERS=N runs the forward pass in N
+# processes sharing one read-only copy of the weights (see workers.py); this
+# process then only decodes, batches and scales. INFERENCE_MMAP_WEIGHTS=1
+# instead maps the checkpoint in-process, so several uvicorn workers on one
+# host share the weight pages. Both need the eager backend on CPU
+WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+MMAP_WEIGHTS = os.getenv("INFERENCE_MMAP_WEIGHTS") == "1"
+if (WORKERS or MMAP_WEIGHTS) and (BACKEND != "eager" or CHANNELS_LAST):
+    raise ValueError("INFERENCE_WORKERS and INFERENCE_MMAP_WEIGHTS need INFERENCE_BACKEND=eager "
+                     "without INFERENCE_CHANNELS_LAST, which copies the weights")
 LABEL_COLS = ['AQI','PM2.5','PM10','O3','CO','SO2','NO2']
 
+# Micro-batching: largest batch per forward pass, and how long the first
+# request in a batch may wait for others to join it
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+# Test-time augmentation for /predict?tta=true: each image is also scored
+# horizontally flipped and/or on five crops, and optionally by extra
+# architectures listed as "name:path,name:path". The mean over all variants
+# is returned with the per-label standard deviation as an uncertainty
+TTA = [t for t in os.getenv("INFERENCE_TTA", "flip,crop").split(",") if t]
+TTA_CROP_SCALE = float(os.getenv("INFERENCE_TTA_CROP_SCALE", "0.875"))
+ENSEMBLE = [entry.split(":", 1) for entry in os.getenv("INFERENCE_ENSEMBLE", "").split(",") if entry]
+if not set(TTA) <= {"flip", "crop"}:
+    raise ValueError(f"INFERENCE_TTA may only list 'flip' and 'crop', got {TTA}")
+if not 0 < TTA_CROP_SCALE <= 1:
+    raise ValueError("INFERENCE_TTA_CROP_SCALE must be in (0, 1]")
+if any(len(entry) != 2 for entry in ENSEMBLE):
+    raise ValueError("INFERENCE_ENSEMBLE entries must look like model_name:weights_path")
+
 # Units for each label
 UNITS = {
     'AQI': '',
@@ -24,60 +80,358 @@ UNITS = {
     'SO2': 'ppb',
     'NO2': 'ppb'
 }
+AQI_INDEX = LABEL_COLS.index('AQI')
+
+# Sent once with numeric responses instead of repeating units in every value
+RESPONSE_METADATA = {"labels": LABEL_COLS, "units": [UNITS[label] for label in LABEL_COLS]}
 
 # -------------------------------
 # IMAGE TRANSFORMS (same as training)
 # -------------------------------
+IMAGE_SIZE = 224
+NORM_MEAN = [0.485, 0.456, 0.406]
+NORM_STD = [0.229, 0.224, 0.225]
+
 img_transforms = transforms.Compose([
-    transforms.Resize((224, 224)),
+    transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
     transforms.ToTensor(),
-    transforms.Normalize(
-        [0.485, 0.456, 0.406],
-        [0.229, 0.224, 0.225]
-    )
+    transforms.Normalize(NORM_MEAN, NORM_STD)
 ])
 
 # -------------------------------
-# LOAD MODEL & SCALER
+# LABEL SCALING
 # -------------------------------
-model = get_model("resnet34").to(DEVICE)
-model.load_state_dict(torch.load(MODEL_PATH, map_location=DEVICE))
-model.eval()
+class LabelScaler:
+    """
+    Inverse of the training MinMaxScaler as a precomputed affine map,
+    x * scale + offset, applied to a whole N x 7 batch at once.
+    """
+
+    def __init__(self, scale, offset):
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.offset = np.asarray(offset, dtype=np.float64)
+
+    @classmethod
+    def from_minmax(cls, scaler):
+        # MinMaxScaler.transform is x * scale_ + min_
+        return cls(1.0 / scaler.scale_, -scaler.min_ / scaler.scale_)
 
-scaler = joblib.load(SCALER_PATH)  # saved MinMaxScaler
+    def inverse_transform(self, x):
+        return np.asarray(x) * self.scale + self.offset
 
 # -------------------------------
-# INFERENCE FUNCTION
+# LOAD MODEL & SCALER (lazily, on first use)
 # -------------------------------
-def predict_image(img_path):
+_model = None
+_scaler = None
+_ensemble = None
+_load_lock = threading.Lock()
+
+
+def load():
     """
-    Predict AQI and pollutant values for a single image.
-    Returns a dict with values converted back to original scale and units.
+    Load the trained model and label scaler once and return them.
+    Safe to call from several threads; later calls return immediately.
+    """
+    global _model, _scaler
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                # Exported artifacts carry their own copy of the scaler
+                scaler_path = SCALER_PATH if BACKEND == "eager" else export_paths(EXPORT_DIR, MODEL_NAME)["scaler"]
+                _scaler = LabelScaler.from_minmax(joblib.load(scaler_path))  # saved MinMaxScaler
+                if WORKERS:
+                    # Split the cores between the workers unless told otherwise
+                    threads = NUM_THREADS or max(1, (os.cpu_count() or 1) // WORKERS)
+                    _model = InferencePool(WORKERS, MODEL_NAME, MODEL_PATH, quantize=QUANTIZE, num_threads=threads)
+                else:
+                    _model = load_backend(
+                        BACKEND, MODEL_NAME, MODEL_PATH, EXPORT_DIR, DEVICE,
+                        quantize=QUANTIZE, channels_last=CHANNELS_LAST, num_threads=NUM_THREADS,
+                        mmap=MMAP_WEIGHTS,
+                    )
+    return _model, _scaler
+
+
+def load_ensemble():
+    """
+    The serving model plus the INFERENCE_ENSEMBLE members (eager), loaded once.
+    All members share the serving model's label scaler.
+    """
+    global _ensemble
+    model, scaler = load()
+    if _ensemble is None:
+        with _load_lock:
+            if _ensemble is None:
+                members = [model]
+                for name, path in ENSEMBLE:
+                    members.append(load_backend(
+                        "eager", name, path, EXPORT_DIR, DEVICE,
+                        quantize=QUANTIZE, channels_last=CHANNELS_LAST, num_threads=NUM_THREADS,
+                    ))
+                _ensemble = members
+    return _ensemble, scaler
+
+
+def is_ready():
+    # An inference pool turns unhealthy when one of its workers dies
+    return _model is not None and getattr(_model, "healthy", True)
+
+
+def close():
+    """
+    Stop the inference worker processes, if the model runs in a pool.
+    """
+    global _model
+    with _load_lock:
+        if isinstance(_model, InferencePool):
+            _model.close()
+            _model = None
+
+
+def load_in_background():
+    """
+    Start loading the model on a daemon thread so startup is not blocked.
+    """
+    thread = threading.Thread(target=load, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+# -------------------------------
+# INFERENCE FUNCTIONS
+# -------------------------------
+def preprocess(img):
+    """
+    Turn a decoded PIL image into a normalized 3 x 224 x 224 tensor.
     """
-    # Load and preprocess image
-    img = Image.open(img_path).convert("RGB")
-    img_tensor = img_transforms(img).unsqueeze(0).to(DEVICE)  # add batch dim
+    return img_transforms(img.convert("RGB"))
 
-    # Model prediction
-    with torch.no_grad():
-        pred_scaled = model(img_tensor).cpu().numpy()  # 1 x 7
 
-    # Inverse transform to original scale
-    pred_unscaled = scaler.inverse_transform(pred_scaled)
+def preprocess_bytes(data):
+    """
+    Decode raw encoded image bytes in memory and preprocess them. The
+    decode stage (imaging.py) enforces the size limits and downscales
+    large JPEGs while decoding.
+    """
+    with stage("decode"):
+        img = decode(data, IMAGE_SIZE)
+    with stage("transform"):
+        return preprocess(img)
+
+
+def normalize_uint8(images):
+    """
+    Turn an N x 224 x 224 x 3 uint8 array of already resized RGB images into
+    a normalized N x 3 x 224 x 224 batch, matching img_transforms.
+    """
+    batch = torch.from_numpy(images).permute(0, 3, 1, 2).float().div_(255)
+    mean = torch.tensor(NORM_MEAN).view(1, 3, 1, 1)
+    std = torch.tensor(NORM_STD).view(1, 3, 1, 1)
+    return batch.sub_(mean).div_(std)
+
 
-    # Format results with units
+def predict_batch(batch):
+    """
+    Run a N x 3 x 224 x 224 batch through the model.
+    Returns an N x 7 numpy array in the original label scale.
+    """
+    model, scaler = load()
+    with stage("forward"):
+        pred_scaled = model(batch)
+    with stage("inverse_scale"):
+        return scaler.inverse_transform(pred_scaled)
+
+
+def tta_views(batch, augmentations=TTA):
+    """
+    Expand an N x 3 x 224 x 224 batch into its TTA variants, V per image.
+    Returns an (N * V) x 3 x 224 x 224 batch ordered view-major.
+    """
+    views = [batch]
+    if "crop" in augmentations:
+        # Four corners and the centre, resized back up to the model input size
+        size = int(IMAGE_SIZE * TTA_CROP_SCALE)
+        for crop in transforms.functional.five_crop(batch, [size, size]):
+            views.append(F.interpolate(crop, size=(IMAGE_SIZE, IMAGE_SIZE), mode="bilinear", align_corners=False))
+    if "flip" in augmentations:
+        views += [view.flip(-1) for view in views]
+    return torch.cat(views)
+
+
+def predict_tta(batch):
+    """
+    Predict an N x 3 x 224 x 224 batch with test-time augmentation and the
+    ensemble. Every model sees all variants of all images in one forward pass.
+    Returns (mean, std), each an N x 7 numpy array in the original label scale.
+    """
+    members, scaler = load_ensemble()
+    with stage("tta_views"):
+        variants = tta_views(batch)
+    with stage("forward_tta"):
+        preds = np.stack([scaler.inverse_transform(member(variants)) for member in members])
+    # (members * views) x images x labels: statistics over every variant of an image
+    preds = preds.reshape(-1, len(batch), len(LABEL_COLS))
+    return preds.mean(axis=0), preds.std(axis=0)
+
+
+def predict_embeddings(batch):
+    """
+    Like predict_batch, but also returns the penultimate-layer features of
+    the backbone (see model.forward_with_features), for similarity search.
+    Returns (N x 7 predictions in the original scale, N x D float32 features).
+    """
+    model, scaler = load()
+    if getattr(model, "embed", None) is None:
+        raise RuntimeError(f"Embeddings need INFERENCE_BACKEND=eager, not {BACKEND}")
+    with stage("forward_embed"):
+        pred_scaled, features = model.embed(batch)
+    return scaler.inverse_transform(pred_scaled), features
+
+
+def format_predictions(row):
+    """
+    Format one row of unscaled predictions as display strings with units.
+    """
     pred_dict = {}
     for i, label in enumerate(LABEL_COLS):
-        value = float(pred_unscaled[0, i])
+        value = float(row[i])
         unit = UNITS[label]
         # Round for nicer display
         if label == 'AQI':
             pred_dict[label] = f"{int(round(value))} {unit}"
         else:
             pred_dict[label] = f"{round(value, 2)} {unit}"
-    
+
     return pred_dict
 
+
+def numeric_predictions(rows):
+    """
+    Round an N x 7 array of unscaled predictions for numeric responses (AQI to
+    a whole number, pollutants to 2 decimals) and return plain float lists.
+    """
+    rows = np.round(np.asarray(rows, dtype=np.float64), 2)
+    rows[..., AQI_INDEX] = np.round(rows[..., AQI_INDEX])
+    return rows.tolist()
+
+
+def content_key(data):
+    """
+    Cache key for an upload: a hash of its raw bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def predict_chunk(items, cache=None, numeric=False):
+    """
+    Predict a list of (name, encoded image bytes) pairs in one forward pass.
+    Images that fail to decode are reported per item instead of failing the chunk.
+    The bytes may instead be the exception raised while reading that item,
+    which is reported the same way. With a cache (see cache.py), repeated
+    uploads skip decoding and the forward pass. numeric=True reports a
+    "values" float list per image (see RESPONSE_METADATA) instead of
+    display strings.
+    """
+    results, rows, tensors, pending = [], {}, [], []
+    for name, data in items:
+        index = len(results)
+        results.append({"filename": name})
+        if isinstance(data, Exception):
+            results[index]["error"] = f"Could not read file: {data}"
+            continue
+
+        key = content_key(data) if cache is not None else None
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            rows[index] = cached
+            continue
+
+        try:
+            tensors.append(preprocess_bytes(data))
+            pending.append((index, key))
+        except DECODE_ERRORS as e:
+            results[index]["error"] = f"Could not decode image: {e}"
+
+    if tensors:
+        for (index, key), row in zip(pending, predict_batch(torch.stack(tensors))):
+            if cache is not None:
+                cache.set(key, row.tolist())
+            rows[index] = row
+
+    if rows:
+        indices = list(rows)
+        values = np.array([rows[i] for i in indices])
+        if numeric:
+            for index, row in zip(indices, numeric_predictions(values)):
+                results[index]["values"] = row
+        else:
+            for index, row in zip(indices, values):
+                results[index]["predictions"] = format_predictions(row)
+
+    return results
+
+
+def predict_pil(img):
+    """
+    Predict AQI and pollutant values for an already decoded PIL image.
+    Returns a dict with values converted back to original scale and units.
+    """
+    with stage("transform"):
+        batch = preprocess(img).unsqueeze(0)  # add batch dim
+    pred_unscaled = predict_batch(batch)
+    return format_predictions(pred_unscaled[0])
+
+
+def predict_bytes(data):
+    """
+    Predict from raw encoded image bytes (e.g. an upload body).
+    Decodes once in memory, without touching the filesystem.
+    """
+    with stage("decode"):
+        img = decode(data, IMAGE_SIZE)
+    return predict_pil(img)
+
+
+def predict_image(img_path):
+    """
+    Predict AQI and pollutant values for a single image file.
+    """
+    with stage("decode"):
+        img = decode(img_path, IMAGE_SIZE)
+    return predict_pil(img)
+
+# -------------------------------
+# MICRO-BATCHING SCHEDULER
+# -------------------------------
+def predict_tensors(tensors):
+    """
+    Stack a list of preprocessed image tensors and predict them as one batch.
+    """
+    return predict_batch(torch.stack(tensors))
+
+
+def predict_tta_tensors(tensors):
+    """
+    Like predict_tensors with TTA; each output row is a 2 x 7 (mean, std) array.
+    """
+    mean, std = predict_tta(torch.stack(tensors))
+    return np.stack([mean, std], axis=1)
+
+
+def predict_embedding_tensors(tensors):
+    """
+    Like predict_tensors; each output row is a (predictions, features) pair.
+    """
+    preds, features = predict_embeddings(torch.stack(tensors))
+    return list(zip(preds, features))
+
+
+scheduler = BatchScheduler(predict_tensors, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name="predict")
+tta_scheduler = BatchScheduler(predict_tta_tensors, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name="tta")
+embedding_scheduler = BatchScheduler(
+    predict_embedding_tensors, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name="embedding",
+)
+
 # # -------------------------------
 # # EXAMPLE USAGE
 # # -------------------------------
@@ -0,0 +1,145 @@
+import time
+import threading
+from sqlalchemy import insert
+
+
+def bulk_insert(session, model, rows):
+    """
+    Insert a list of row dicts in one executemany INSERT and commit.
+    Returns the new primary keys in row order.
+    """
+    if not rows:
+        return []
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    ids = session.execute(statement, rows).scalars().all()
+    session.commit()
+    return ids
+
+
+class BufferedWriter:
+    """
+    Collects rows for one table and writes them with a single bulk INSERT
+    once max_rows are waiting or the oldest has waited max_delay_s.
+
+    Flushing happens on a background thread, so add() never touches the
+    database. on_flush(rows) is called after each successful write with the
+    rows, their "id" filled in; an exception from it is printed and does not
+    stop the writer. A failed flush keeps its rows for the next attempt, up
+    to max_pending rows (the oldest are dropped beyond that).
+    """
+
+    def __init__(self, session_factory, model, max_rows=200, max_delay_s=1.0, max_pending=None, on_flush=None):
+        if max_rows < 1:
+            raise ValueError("max_rows must be at least 1")
+        if max_delay_s <= 0:
+            raise ValueError("max_delay_s must be positive")
+        self.session_factory = session_factory
+        self.model = model
+        self.max_rows = max_rows
+        self.max_delay_s = max_delay_s
+        self.max_pending = max_pending or max_rows * 50
+        self.on_flush = on_flush
+        self.dropped = 0
+        self._rows = []
+        self._first_added = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def add(self, row):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("BufferedWriter is closed")
+            if not self._rows:
+                self._first_added = time.monotonic()
+            self._rows.append(row)
+            if len(self._rows) >= self.max_rows:
+                self._cond.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def pending(self):
+        with self._cond:
+            return len(self._rows)
+
+    def flush(self):
+        """
+        Write everything buffered so far; returns the number of rows written.
+        """
+        with self._flush_lock:
+            with self._cond:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            try:
+                session = self.session_factory()
+            except Exception:
+                self._requeue(rows)
+                raise
+            try:
+                ids = bulk_insert(session, self.model, rows)
+            except Exception as e:
+                session.rollback()
+                self._requeue(rows)
+                print(f"[db-writer] Flush of {len(rows)} rows failed, will retry: {e}")
+                return 0
+            finally:
+                session.close()
+            for row, row_id in zip(rows, ids):
+                row["id"] = row_id
+            if self.on_flush is not None:
+                try:
+                    self.on_flush(rows)
+                except Exception as e:
+                    # The rows are in the database; a broken callback must not stop the writer
+                    print(f"[db-writer] on_flush failed for {len(rows)} written rows: {e!r}")
+            return len(rows)
+
+    def _requeue(self, rows):
+        with self._cond:
+            self._rows = rows + self._rows
+            overflow = len(self._rows) - self.max_pending
+            if overflow > 0:
+                del self._rows[:overflow]
+                self.dropped += overflow
+            if self._rows:
+                self._first_added = time.monotonic()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._rows) >= self.max_rows:
+                        break
+                    if self._rows:
+                        remaining = self._first_added + self.max_delay_s - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                closed = self._closed
+            try:
+                written = self.flush()
+            except Exception as e:
+                print(f"[db-writer] Unexpected flush error, will retry: {e!r}")
+                written = 0
+            if closed:
+                return
+            if not written and self.pending():
+                time.sleep(self.max_delay_s)  # the flush failed; do not hammer the database
+
+    def close(self):
+        """
+        Stop the background thread after writing what is still buffered.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        else:
+            self.flush()
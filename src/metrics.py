@@ -0,0 +1,371 @@
+"""
+In-process, Prometheus-style metrics and runtime-toggleable sampling
+profilers. No client library is needed: REGISTRY.render() produces the
+Prometheus text exposition format served by GET /metrics.
+
+    with stage("decode"):            # aqi_stage_seconds{stage="decode"}
+        img = decode(data)
+
+Metrics are per process; with several uvicorn workers, scrape each worker
+(or run one worker per container).
+"""
+import os
+import sys
+import time
+import bisect
+import threading
+from collections import Counter as _Tally
+
+# Request and stage latencies, 0.5 ms to 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# -------------------------------
+# METRIC TYPES
+# -------------------------------
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, pairs, value in metric.samples():
+                lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._labelset = frozenset(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if labels.keys() != self._labelset:
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _pairs(self, key):
+        return list(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    """
+    Monotonic count; name it with a _total suffix.
+    """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._pairs(key), value
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down. With fn, the value is read when the
+    metrics are rendered: fn() returns a number, or for a labelled gauge a
+    dict of label-value tuples to numbers.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, fn=None):
+        super().__init__(name, help, labelnames, registry)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.fn is not None:
+            values = self.fn()
+            items = values.items() if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield self.name, self._pairs(key), value
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram with _bucket, _sum and _count series.
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def time(self, **labels):
+        """
+        Context manager observing the time spent inside it.
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+        return sum(counts)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+        for key, (counts, total) in items:
+            pairs = self._pairs(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", pairs + [("le", _format_value(float(bound)))], cumulative
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, cumulative
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+# -------------------------------
+# STAGE TIMING
+# -------------------------------
+STAGE_SECONDS = Histogram(
+    "aqi_stage_seconds", "Time spent in each stage of request handling and inference", ["stage"],
+)
+
+
+def stage(name):
+    """
+    Context manager timing one stage into aqi_stage_seconds{stage=name}.
+    """
+    return STAGE_SECONDS.time(stage=name)
+
+
+# -------------------------------
+# HTTP MIDDLEWARE
+# -------------------------------
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route and status", ["method", "route", "status"])
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last body byte is sent", ["method", "route"],
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being handled")
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts and latency per route
+    template (e.g. /readings/nearby), so path parameters and unknown paths
+    do not create new series. Streaming responses are timed to their end.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status)
+            HTTP_SECONDS.observe(time.perf_counter() - start, method=scope["method"], route=route)
+
+
+# -------------------------------
+# SAMPLING PROFILERS
+# -------------------------------
+class StackSampler:
+    """
+    Dependency-free sampling profiler. A daemon thread records the stack of
+    every other thread each interval_s; report() returns collapsed stacks
+    ("outer;inner;leaf count" per line) for flamegraph.pl or speedscope.
+    """
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.samples = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_s):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.report()
+
+    def report(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class PyinstrumentProfiler:
+    """
+    pyinstrument (optional dependency) on the thread that starts it, which
+    for an async endpoint is the event loop thread.
+    """
+
+    def __init__(self, interval_s=0.001):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError("The pyinstrument profiler needs pyinstrument: pip install pyinstrument")
+        self._profiler = Profiler(interval=interval_s, async_mode="disabled")
+
+    def start(self):
+        self._profiler.start()
+
+    def stop(self):
+        self._profiler.stop()
+        return self._profiler.output_text(unicode=True)
+
+
+PROFILERS = {"stacks": StackSampler, "pyinstrument": PyinstrumentProfiler}
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def start_profiler(kind="stacks", interval_ms=5.0):
+    """
+    Start one process-wide sampling profiler. Raises RuntimeError if one is
+    already running or its dependency is missing.
+    """
+    global _profiler
+    if kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler {kind}; choose from {', '.join(PROFILERS)}")
+    with _profiler_lock:
+        if _profiler is not None:
+            raise RuntimeError("A profiler is already running")
+        profiler = PROFILERS[kind](interval_ms / 1000.0)
+        profiler.start()
+        _profiler = profiler
+
+
+def stop_profiler():
+    """
+    Stop the running profiler and return its text report.
+    """
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            raise RuntimeError("No profiler is running")
+        profiler, _profiler = _profiler, None
+    return profiler.stop()
+
+
+def profiler_running():
+    return _profiler is not None
@@ -2,17 +2,19 @@ import torch
 import torch.nn as nn
 from torchvision import models
 
-def get_model(model_name, num_outputs=7):
+def get_model(model_name, num_outputs=7, pretrained=True):
+    # pretrained=False skips the ImageNet download; use it whenever a trained
+    # checkpoint is about to overwrite the weights anyway
     if model_name == "resnet18":
-        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1)
+        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
         model.fc = nn.Linear(512, num_outputs)
 
     elif model_name == "resnet34":
-        model = models.resnet34(weights=models.ResNet34_Weights.IMAGENET1K_V1)
+        model = models.resnet34(weights=models.ResNet34_Weights.IMAGENET1K_V1 if pretrained else None)
         model.fc = nn.Linear(512, num_outputs)
 
     elif model_name == "mobilenet_v2":
-        model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1)
+        model = models.mobilenet_v2(weights=models.MobileNet_V2_Weights.IMAGENET1K_V1 if pretrained else None)
         model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_outputs)
 
     else:
@@ -20,8 +22,87 @@ def get_model(model_name, num_outputs=7):
 
     return model
 
-def load_model(model_name, model_path, device):
-    model = get_model(model_name).to(device)
-    model.load_state_dict(torch.load(model_path, map_location=device))
+def head_layer(model):
+    """
+    The final Linear layer of a get_model() network (fc or classifier[-1]).
+    """
+    if hasattr(model, "fc"):
+        return model.fc
+    if hasattr(model, "classifier"):
+        return model.classifier[-1]
+    raise ValueError(f"No prediction head found on {type(model).__name__}")
+
+
+def forward_with_features(model, batch):
+    """
+    Run the model and also capture the penultimate-layer features, i.e. the
+    input of the final Linear layer (N x 512 for the resnets, N x 1280 for
+    mobilenet_v2). Returns (outputs, features).
+    """
+    captured = []
+    handle = head_layer(model).register_forward_pre_hook(lambda module, inputs: captured.append(inputs[0]))
+    try:
+        outputs = model(batch)
+    finally:
+        handle.remove()
+    return outputs, captured[0]
+
+def quantize_model(model, mode, calibration_batches=None):
+    """
+    Post-training int8 quantization for CPU inference.
+    "dynamic" quantizes only the Linear head; "static" also quantizes every
+    conv layer and needs a few batches of representative images to calibrate.
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    if mode == "dynamic":
+        return quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    if mode == "static":
+        if calibration_batches is None:
+            raise ValueError("Static quantization needs calibration_batches")
+        torch.backends.quantized.engine = "x86"
+        example = torch.randn(1, 3, 224, 224)
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+        with torch.no_grad():
+            for batch in calibration_batches:
+                prepared(batch)
+        return convert_fx(prepared)
+
+    raise ValueError(f"Unknown quantization mode: {mode}")
+
+
+def load_model(model_name, model_path, device, quantize=None, calibration_batches=None,
+               channels_last=False, num_threads=None, mmap=False):
+    """
+    Load a trained checkpoint for inference.
+    quantize: None, "dynamic" or "static" (CPU only, see quantize_model)
+    channels_last: store conv weights NHWC, which is faster for CPU convolutions
+    num_threads: intra-op thread count for torch (process-wide)
+    mmap: use the weights in place from a read-only mapping of the checkpoint,
+          so every process loading the same file shares one copy in the page cache
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if quantize and device.type != "cpu":
+        raise ValueError("Quantized models only run on CPU")
+    if mmap and (device.type != "cpu" or channels_last):
+        raise ValueError("Memory-mapped weights are only used in place on CPU without channels_last")
+
+    if mmap:
+        # Built on the meta device so no throwaway weights are allocated;
+        # assign=True keeps the mapped tensors instead of copying them
+        with torch.device("meta"):
+            model = get_model(model_name, pretrained=False)
+        model.load_state_dict(torch.load(model_path, map_location=device, mmap=True, weights_only=True), assign=True)
+    else:
+        model = get_model(model_name, pretrained=False).to(device)
+        model.load_state_dict(torch.load(model_path, map_location=device))
     model.eval()
-    return model
\ No newline at end of file
+
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    if quantize:
+        model = quantize_model(model, quantize, calibration_batches)
+    return model
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from datetime import datetime
 
 from database import Base
@@ -16,6 +16,9 @@ class PollutionData(Base):
     id = Column(Integer, primary_key=True)
     latitude = Column(Float)
     longitude = Column(Float)
+    station_lat = Column(Float)  # WAQI station the readings came from
+    station_lon = Column(Float)
+    distance_km = Column(Float)  # from the reported position to the station
     aqi = Column(Float)
     pm25 = Column(Float)
     pm10 = Column(Float)
@@ -23,4 +26,8 @@ class PollutionData(Base):
     co = Column(Float)
     so2 = Column(Float)
     no2 = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    geohash = Column(String(12))  # of latitude/longitude, see geo.geohash
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+
+    # "Readings near here since T" is a few geohash-prefix range scans
+    __table_args__ = (Index("ix_pollution_data_geohash_timestamp", "geohash", "timestamp"),)
@@ -0,0 +1,132 @@
+"""
+Calibrate int8 models and report their accuracy/latency against fp32.
+
+    python -m src.quantize --csv data/final_data.csv --img-dir data/All_img \
+        --checkpoint models/resnet34_aqi.pth --model-name resnet34 --save
+
+Static quantization is calibrated on a random sample of the labelled images
+and evaluated on a disjoint sample. The report lists MAE per pollutant in
+original units for fp32 and each int8 mode, next to the batch latency.
+With --save the static int8 model is written as TorchScript for
+INFERENCE_BACKEND=int8.
+"""
+import os
+import time
+import shutil
+import argparse
+import joblib
+import numpy as np
+import torch
+from torch.utils.data import Subset, DataLoader
+from model import load_model
+from dataset import AirQualityDataset, load_dataframe, LABEL_COLS
+from backends import export_paths
+from inference import img_transforms
+
+
+def collect_predictions(model, loader, channels_last=False):
+    preds, labels = [], []
+    with torch.no_grad():
+        for imgs, y in loader:
+            if channels_last:
+                imgs = imgs.contiguous(memory_format=torch.channels_last)
+            preds.append(model(imgs).numpy())
+            labels.append(y.numpy())
+    return np.vstack(preds), np.vstack(labels)
+
+
+def per_label_mae(preds, labels, scaler):
+    errors = np.abs(scaler.inverse_transform(preds) - scaler.inverse_transform(labels))
+    return dict(zip(LABEL_COLS, errors.mean(axis=0)))
+
+
+def batch_latency(model, batch_size, channels_last=False, iters=10):
+    batch = torch.randn(batch_size, 3, 224, 224)
+    if channels_last:
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    with torch.no_grad():
+        model(batch)
+        start = time.perf_counter()
+        for _ in range(iters):
+            model(batch)
+    return (time.perf_counter() - start) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", required=True)
+    parser.add_argument("--img-dir", required=True)
+    parser.add_argument("--checkpoint", default="models/resnet34_aqi.pth")
+    parser.add_argument("--model-name", default="resnet34", choices=["resnet18", "resnet34", "mobilenet_v2"])
+    parser.add_argument("--scaler", default="models/label_scaler.save")
+    parser.add_argument("--modes", nargs="+", default=["dynamic", "static"], choices=["dynamic", "static"])
+    parser.add_argument("--calibration-images", type=int, default=256)
+    parser.add_argument("--eval-images", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--save", action="store_true", help="write the static int8 TorchScript artifact")
+    parser.add_argument("--out-dir", default="models/export")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    scaler = joblib.load(args.scaler)
+    df = load_dataframe(args.csv, args.scaler)
+    dataset = AirQualityDataset(df, args.img_dir, transform=img_transforms)
+
+    order = np.random.default_rng(0).permutation(len(dataset))
+    calib_idx = order[:args.calibration_images]
+    eval_idx = order[args.calibration_images:args.calibration_images + args.eval_images]
+    calib_loader = DataLoader(Subset(dataset, calib_idx), batch_size=args.batch_size)
+    eval_loader = DataLoader(Subset(dataset, eval_idx), batch_size=args.batch_size)
+
+    def load(quantize=None):
+        calibration = (imgs for imgs, _ in calib_loader)
+        return load_model(
+            args.model_name, args.checkpoint, device, quantize=quantize,
+            calibration_batches=calibration if quantize == "static" else None,
+            channels_last=args.channels_last, num_threads=args.threads,
+        )
+
+    variants = {"fp32": load()}
+    for mode in args.modes:
+        print(f"Quantizing ({mode})...")
+        variants[f"int8-{mode}"] = load(mode)
+
+    results = {}
+    for name, model in variants.items():
+        preds, labels = collect_predictions(model, eval_loader, args.channels_last)
+        results[name] = {
+            "mae": per_label_mae(preds, labels, scaler),
+            "latency_1": batch_latency(model, 1, args.channels_last),
+            "latency_8": batch_latency(model, 8, args.channels_last),
+        }
+
+    base = results["fp32"]
+    print(f"\nMAE on {len(eval_idx)} held-out images (original units); delta vs fp32 in brackets")
+    print(f"{'label':>10} " + " ".join(f"{name:>22}" for name in results))
+    for label in LABEL_COLS:
+        cells = []
+        for name, r in results.items():
+            delta = r["mae"][label] - base["mae"][label]
+            cells.append(f"{r['mae'][label]:>10.3f} ({delta:+8.3f})" if name != "fp32" else f"{r['mae'][label]:>22.3f}")
+        print(f"{label:>10} " + " ".join(f"{c:>22}" for c in cells))
+    for key, title in (("latency_1", "batch 1 ms"), ("latency_8", "batch 8 ms")):
+        cells = [f"{r[key] * 1000:.1f} (x{base[key] / r[key]:.2f})" for r in results.values()]
+        print(f"{title:>10} " + " ".join(f"{c:>22}" for c in cells))
+
+    if args.save:
+        if "int8-static" not in variants:
+            parser.error("--save needs the static mode")
+        paths = export_paths(args.out_dir, args.model_name)
+        os.makedirs(args.out_dir, exist_ok=True)
+        example = torch.randn(1, 3, 224, 224)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(variants["int8-static"], example))
+        traced.save(paths["int8"])
+        shutil.copyfile(args.scaler, paths["scaler"])
+        print(f"\nSaved {paths['int8']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Bulk-score a directory of sky images.
+
+    python -m src.score <image_dir> --out results.parquet
+    python -m src.score <image_dir> --out results.csv --workers 8 --batch-size 64
+
+Images are decoded and resized in a process pool and fed to the model in
+fixed-size batches. Results are appended as they are produced, and files
+already present in the output are skipped, so an interrupted run can be
+restarted with the same command.
+
+A .parquet output is written as a directory of part files (needs pyarrow);
+any other extension is written as CSV. With --index, the backbone features
+of every scored image are also appended to an embedding index for /similar
+(see embeddings.py; needs the eager backend).
+"""
+import os
+import csv
+import glob
+import argparse
+import numpy as np
+from multiprocessing import Pool
+from imaging import load_resized
+from embeddings import EmbeddingIndex
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+# -------------------------------
+# INPUT
+# -------------------------------
+def find_images(image_dir):
+    paths = []
+    for root, _, files in os.walk(image_dir):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(root, name), image_dir))
+    return sorted(paths)
+
+
+# -------------------------------
+# OUTPUT SINKS
+# -------------------------------
+class CsvSink:
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def scored(self):
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline="") as f:
+            return {row["filename"] for row in csv.DictReader(f)}
+
+    def write(self, rows):
+        new_file = not os.path.exists(self.path)
+        with open(self.path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class ParquetSink:
+    """
+    Appends rows to a parquet dataset directory, one part file per
+    rows_per_file rows, so earlier parts are never rewritten.
+    """
+
+    def __init__(self, path, columns, rows_per_file=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow (or use a .csv --out)")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        # Fixed schema so every part matches, even one holding only errors
+        self.schema = pa.schema([
+            (c, pa.string() if c in ("filename", "error") else pa.float64()) for c in columns
+        ])
+        self.rows_per_file = rows_per_file
+        self.buffer = []
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return sorted(glob.glob(os.path.join(self.path, "part-*.parquet")))
+
+    def scored(self):
+        done = set()
+        for part in self._parts():
+            done.update(self.pq.read_table(part, columns=["filename"]).column("filename").to_pylist())
+        return done
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= self.rows_per_file:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        table = self.pa.Table.from_pylist(self.buffer, schema=self.schema)
+        part = os.path.join(self.path, f"part-{len(self._parts()):06d}.parquet")
+        tmp = part + ".tmp"
+        self.pq.write_table(table, tmp)
+        os.replace(tmp, part)  # a crash never leaves a half-written part behind
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+# -------------------------------
+# SCORING LOOP
+# -------------------------------
+def score_directory(image_dir, out, batch_size=32, workers=None, rows_per_file=10000, index_dir=None):
+    # Imported here so decode workers never load the model
+    from inference import IMAGE_SIZE, LABEL_COLS, normalize_uint8, numeric_predictions, predict_batch, predict_embeddings
+
+    columns = ["filename"] + LABEL_COLS + ["error"]
+    if out.endswith(".parquet"):
+        sink = ParquetSink(out, columns, rows_per_file=rows_per_file)
+    else:
+        sink = CsvSink(out, columns)
+
+    done = sink.scored()
+    todo = [p for p in find_images(image_dir) if p not in done]
+    print(f"{len(done)} already scored, {len(todo)} to score")
+    index = EmbeddingIndex(index_dir) if index_dir else None
+    # The sink buffers rows, so a crash can leave images indexed but not
+    # recorded as scored; a resumed run rescores them but must not re-add them
+    indexed = {meta.get("filename") for meta in index.metadata(range(len(index)))} if index is not None else set()
+
+    def flush_batch(names, images, rows):
+        if images:
+            batch = normalize_uint8(np.stack(images))
+            if index is None:
+                preds = predict_batch(batch)
+            else:
+                preds, features = predict_embeddings(batch)
+            for name, pred in zip(names, preds):
+                rows.append({"filename": name, **dict(zip(LABEL_COLS, pred.tolist())), "error": None})
+        sink.write(rows)
+        if images and index is not None:
+            new = [i for i, name in enumerate(names) if name not in indexed]
+            if new:
+                values = numeric_predictions(preds[new])
+                index.add(features[new], [{"filename": names[i], "values": v} for i, v in zip(new, values)])
+                indexed.update(names[i] for i in new)
+
+    tasks = ((p, os.path.join(image_dir, p), IMAGE_SIZE) for p in todo)
+    names, images, rows = [], [], []
+    scored, batches = 0, 0
+    with Pool(workers or os.cpu_count()) as pool:
+        for rel_path, array, error in pool.imap(load_resized, tasks, chunksize=16):
+            if error is not None:
+                # Recorded so a resumed run does not retry it
+                rows.append({"filename": rel_path, **{c: None for c in LABEL_COLS}, "error": error})
+            else:
+                names.append(rel_path)
+                images.append(array)
+
+            if len(images) == batch_size:
+                flush_batch(names, images, rows)
+                scored += len(rows)
+                batches += 1
+                names, images, rows = [], [], []
+                if batches % 50 == 0:
+                    print(f"scored {scored}/{len(todo)}")
+
+        flush_batch(names, images, rows)
+        scored += len(rows)
+
+    sink.close()
+    print(f"Done: {scored} images written to {out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--out", required=True, help="results.parquet (directory of parts) or results.csv")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None, help="decode processes (default: all cores)")
+    parser.add_argument("--rows-per-file", type=int, default=10000, help="rows per parquet part file")
+    parser.add_argument("--index", default=None, help="also append embeddings to this index directory")
+    args = parser.parse_args()
+
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    score_directory(args.image_dir, args.out, args.batch_size, args.workers, args.rows_per_file, args.index)
+
+
+if __name__ == "__main__":
+    main()
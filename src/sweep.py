@@ -0,0 +1,117 @@
+"""
+Train several models / hyperparameter combinations in parallel and compare them.
+
+    python -m src.dataset --csv data/final_data.csv --img-dir data/All_img --out data/cache
+    python -m src.sweep --cache-dir data/cache --models resnet18 resnet34 mobilenet_v2 \
+        --lrs 1e-4 3e-4 --epochs 10 --parallel 3 --out sweep_results.csv
+
+Every trial reads the same pre-decoded cache. The CPU cores are split evenly
+between the --parallel worker processes. The results table has the held-out
+MSE per pollutant, wall time and training images/sec for each trial.
+"""
+import os
+import csv
+import time
+import argparse
+import itertools
+import multiprocessing
+import torch
+from src.dataset import LABEL_COLS, available_cores
+from src.train import train_model
+
+
+def build_grid(models, lrs, batch_sizes):
+    return [
+        {"model_name": m, "lr": lr, "batch_size": bs}
+        for m, lr, bs in itertools.product(models, lrs, batch_sizes)
+    ]
+
+
+def threads_per_worker(parallel, cores=None):
+    return max(1, (cores or available_cores()) // parallel)
+
+
+def run_trial(trial):
+    """
+    Train one configuration in a worker process and return its results row.
+    """
+    torch.set_num_threads(trial["threads"])
+    name = f"{trial['model_name']}_lr{trial['lr']:g}_bs{trial['batch_size']}"
+    start = time.perf_counter()
+    result = train_model(
+        None, None, trial["model_name"], os.path.join(trial["out_dir"], f"{name}.pth"), torch.device("cpu"),
+        num_epochs=trial["epochs"], batch_size=trial["batch_size"], cache_dir=trial["cache_dir"],
+        num_workers=0, amp=trial["amp"], patience=trial["patience"], pretrained=trial["pretrained"],
+        lr=trial["lr"], seed=trial["seed"],
+    )
+    row = {
+        "trial": name,
+        "model_name": trial["model_name"],
+        "lr": trial["lr"],
+        "batch_size": trial["batch_size"],
+        "epochs": result["epochs"],
+        "val_mse": result["val_mse"],
+        "test_mse": result["test_mse"],
+    }
+    row.update({f"mse_{label}": mse for label, mse in zip(LABEL_COLS, result["test_mse_per_label"])})
+    row["wall_time_s"] = time.perf_counter() - start
+    row["images_per_sec"] = result["images_per_sec"]
+    return row
+
+
+def run_sweep(trials, parallel):
+    # spawn: forking a process that already started torch thread pools can deadlock
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(parallel, maxtasksperchild=1) as pool:
+        rows = pool.map(run_trial, trials, chunksize=1)
+    # Pick by validation MSE when early stopping produced one, so the test
+    # set stays out of model selection
+    key = "val_mse" if all(r["val_mse"] is not None for r in rows) else "test_mse"
+    return sorted(rows, key=lambda r: r[key])
+
+
+def write_results(rows, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cache-dir", required=True, help="pre-decoded cache from `python -m src.dataset`")
+    parser.add_argument("--models", nargs="+", default=["resnet18", "resnet34", "mobilenet_v2"])
+    parser.add_argument("--lrs", type=float, nargs="+", default=[1e-4])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32])
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--patience", type=int, default=None)
+    parser.add_argument("--amp", action="store_true", help="bfloat16 autocast")
+    parser.add_argument("--no-pretrained", action="store_true")
+    parser.add_argument("--parallel", type=int, default=None, help="worker processes (default: one per trial, up to the core count)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="sweep_results.csv")
+    parser.add_argument("--out-dir", default="models/sweep", help="where each trial's weights are saved")
+    args = parser.parse_args()
+
+    grid = build_grid(args.models, args.lrs, args.batch_sizes)
+    parallel = args.parallel or min(len(grid), available_cores())
+    threads = threads_per_worker(parallel)
+    os.makedirs(args.out_dir, exist_ok=True)
+    trials = [
+        dict(config, threads=threads, epochs=args.epochs, patience=args.patience, amp=args.amp,
+             pretrained=not args.no_pretrained, seed=args.seed, cache_dir=args.cache_dir, out_dir=args.out_dir)
+        for config in grid
+    ]
+    print(f"{len(trials)} trials, {parallel} in parallel, {threads} threads each")
+
+    rows = run_sweep(trials, parallel)
+    write_results(rows, args.out)
+
+    print(f"\n{'trial':<32} {'test MSE':>9} {'wall s':>8} {'img/s':>7}")
+    for row in rows:
+        print(f"{row['trial']:<32} {row['test_mse']:>9.4f} {row['wall_time_s']:>8.1f} {row['images_per_sec']:>7.1f}")
+    print(f"\nResults written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,226 @@
+import os
+import time
+import argparse
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from src.dataset import get_loader
+from src.dataset import get_loader, loader_kwargs
 from src.model import get_model
 from torchvision import transforms
 
-def train_model(df, img_dir, model_name, model_path, device, num_epochs=10, batch_size=32):
+
+def evaluate(model, loader, device, non_blocking=False, amp=False):
+    """
+    Mean squared error over a loader, overall and per label (scaled units).
+    """
+    model.eval()
+    sq_error, count = None, 0
+    with torch.no_grad():
+        for imgs, labels in loader:
+            imgs = imgs.to(device, non_blocking=non_blocking)
+            labels = labels.to(device, non_blocking=non_blocking)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=amp):
+                preds = model(imgs)
+            batch_error = ((preds.float() - labels) ** 2).sum(dim=0)
+            sq_error = batch_error if sq_error is None else sq_error + batch_error
+            count += len(labels)
+    per_label = (sq_error / count).cpu()
+    return per_label.mean().item(), per_label.tolist()
+
+
+def save_checkpoint(path, **state):
+    # Write to a temp file first so a crash mid-save never corrupts the last checkpoint
+    tmp = path + ".tmp"
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+
+
+def train_model(df, img_dir, model_name, model_path, device, num_epochs=10, batch_size=32, cache_dir=None,
+                num_workers=None, pin_memory=None, prefetch_factor=None, persistent_workers=None,
+                amp=False, accum_steps=1, checkpoint_path=None, checkpoint_every=1, resume=False,
+                patience=None, val_fraction=0.1, pretrained=True, lr=1e-4, seed=0):
+    """
+    Train one model and save its weights to model_path.
+
+    amp: bfloat16 autocast (CPU or GPU)
+    accum_steps: batches per optimizer step, for a larger effective batch
+    checkpoint_path / checkpoint_every / resume: periodic checkpoints with
+        optimizer state; resume continues from the last one
+    patience: stop when the validation MSE has not improved for this many
+        epochs and keep the best weights (evaluates after every epoch)
+    val_fraction: share of the training split held out for early stopping,
+        so the test set is only used for the final report
+
+    Returns a dict with the test MSE (overall and per label), the best
+    validation MSE (None without patience), the number of epochs run and
+    the mean training throughput in images/sec.
+    """
     # Transform
+    normalize = transforms.Normalize([0.485, 0.456, 0.406],
+                                     [0.229, 0.224, 0.225])
     img_transforms = transforms.Compose([
         transforms.Resize((224, 224)),
         transforms.ToTensor(),
-        transforms.Normalize([0.485, 0.456, 0.406],
-                             [0.229, 0.224, 0.225])
+        normalize
     ])
 
     # DataLoader
-    train_size = int(0.8 * len(df))
-    test_size = len(df) - train_size
     from torch.utils.data import random_split
-    from src.dataset import AirQualityDataset
+    from src.dataset import AirQualityDataset, CachedAirQualityDataset
 
-    full_dataset = AirQualityDataset(df, img_dir, transform=img_transforms)
-    train_dataset, test_dataset = random_split(full_dataset, [train_size, test_size])
+    if cache_dir:
+        # Pre-decoded images from `python -m src.dataset`; df is not needed
+        full_dataset = CachedAirQualityDataset(cache_dir, transform=normalize)
+    else:
+        full_dataset = AirQualityDataset(df, img_dir, transform=img_transforms)
+    train_size = int(0.8 * len(full_dataset))
+    test_size = len(full_dataset) - train_size
+    # Seeded so a resumed run keeps the same validation and test sets
+    split_generator = torch.Generator().manual_seed(seed)
+    train_dataset, test_dataset = random_split(full_dataset, [train_size, test_size], generator=split_generator)
+    val_dataset = None
+    if patience is not None:
+        val_size = max(1, int(val_fraction * train_size))
+        train_size -= val_size
+        train_dataset, val_dataset = random_split(train_dataset, [train_size, val_size], generator=split_generator)
 
-    train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False)
+    loader_options = loader_kwargs(num_workers, pin_memory, prefetch_factor, persistent_workers)
+    train_loader = torch.utils.data.DataLoader(train_dataset, batch_size=batch_size, shuffle=True, **loader_options)
+    test_loader = torch.utils.data.DataLoader(test_dataset, batch_size=batch_size, shuffle=False, **loader_options)
+    if val_dataset is not None:
+        val_loader = torch.utils.data.DataLoader(val_dataset, batch_size=batch_size, shuffle=False, **loader_options)
+    non_blocking = loader_options["pin_memory"]
 
     # Model
-    model = get_model(model_name).to(device)
+    model = get_model(model_name, pretrained=pretrained).to(device)
     criterion = nn.MSELoss()
-    optimizer = optim.Adam(model.parameters(), lr=1e-4)
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+
+    start_epoch = 0
+    best_mse, best_state, stale_epochs = float("inf"), None, 0
+    if resume and checkpoint_path and os.path.exists(checkpoint_path):
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        model.load_state_dict(checkpoint["model"])
+        optimizer.load_state_dict(checkpoint["optimizer"])
+        start_epoch = checkpoint["epoch"] + 1
+        best_mse, best_state, stale_epochs = checkpoint["best_mse"], checkpoint["best_state"], checkpoint["stale_epochs"]
+        print(f"[{model_name}] Resumed from {checkpoint_path} at epoch {start_epoch + 1}")
 
     # Training Loop
-    for epoch in range(num_epochs):
+    throughputs = []
+    epoch = start_epoch - 1
+    for epoch in range(start_epoch, num_epochs):
         model.train()
         total_loss = 0
-        for imgs, labels in train_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            preds = model(imgs)
-            loss = criterion(preds, labels)
-            loss.backward()
-            optimizer.step()
-            total_loss += loss.item()
+        # Split the epoch into time spent waiting on the loader vs. training
+        data_time = compute_time = 0.0
+        optimizer.zero_grad()
+        tick = time.perf_counter()
+        for step, (imgs, labels) in enumerate(train_loader, start=1):
+            loaded = time.perf_counter()
+            data_time += loaded - tick
+
+            imgs = imgs.to(device, non_blocking=non_blocking)
+            labels = labels.to(device, non_blocking=non_blocking)
+            with torch.autocast(device_type=device.type, dtype=torch.bfloat16, enabled=amp):
+                preds = model(imgs)
+            loss = criterion(preds.float(), labels)
+            (loss / accum_steps).backward()
+            if step % accum_steps == 0 or step == len(train_loader):
+                optimizer.step()
+                optimizer.zero_grad()
+            total_loss += loss.item()  # also waits for the GPU, so compute time is accurate
+
+            tick = time.perf_counter()
+            compute_time += tick - loaded
+
+        epoch_time = data_time + compute_time
+        throughputs.append(train_size / epoch_time)
+        message = (f"[{model_name}] Epoch {epoch+1}/{num_epochs}, Train Loss: {total_loss/len(train_loader):.4f}, "
+                   f"{throughputs[-1]:.1f} img/s, data wait {data_time:.1f}s ({100 * data_time / epoch_time:.0f}%), "
+                   f"compute {compute_time:.1f}s")
 
-        print(f"[{model_name}] Epoch {epoch+1}/{num_epochs}, Train Loss: {total_loss/len(train_loader):.4f}")
+        stop = False
+        if patience is not None:
+            val_mse, _ = evaluate(model, val_loader, device, non_blocking, amp)
+            message += f", Val MSE: {val_mse:.4f}"
+            if val_mse < best_mse:
+                best_mse, stale_epochs = val_mse, 0
+                best_state = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+            else:
+                stale_epochs += 1
+                stop = stale_epochs >= patience
+        print(message)
+
+        if checkpoint_path and ((epoch + 1) % checkpoint_every == 0 or stop or epoch + 1 == num_epochs):
+            save_checkpoint(
+                checkpoint_path, epoch=epoch, model=model.state_dict(), optimizer=optimizer.state_dict(),
+                best_mse=best_mse, best_state=best_state, stale_epochs=stale_epochs,
+            )
+        if stop:
+            print(f"[{model_name}] Early stopping: no improvement for {patience} epochs")
+            break
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
 
     # Evaluation
-    model.eval()
-    test_loss = 0
-    with torch.no_grad():
-        for imgs, labels in test_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            preds = model(imgs)
-            loss = criterion(preds, labels)
-            test_loss += loss.item()
-    print(f"[{model_name}] Test MSE: {test_loss/len(test_loader):.4f}")
+    test_mse, test_mse_per_label = evaluate(model, test_loader, device, non_blocking, amp)
+    print(f"[{model_name}] Test MSE: {test_mse:.4f}")
 
     # Save model
-    torch.save(model.state_dict(), model_path)
\ No newline at end of file
+    torch.save(model.state_dict(), model_path)
+
+    return {
+        "test_mse": test_mse,
+        "test_mse_per_label": test_mse_per_label,
+        "val_mse": best_mse if patience is not None else None,
+        "epochs": epoch + 1,
+        "images_per_sec": sum(throughputs) / len(throughputs) if throughputs else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train an air-quality regression model.")
+    parser.add_argument("--csv", help="labels CSV (not needed with --cache-dir)")
+    parser.add_argument("--img-dir", help="image directory (not needed with --cache-dir)")
+    parser.add_argument("--cache-dir", help="pre-decoded cache from `python -m src.dataset`")
+    parser.add_argument("--scaler", default="models/label_scaler.save")
+    parser.add_argument("--model-name", default="resnet34", choices=["resnet18", "resnet34", "mobilenet_v2"])
+    parser.add_argument("--out", default=None, help="weights file (default: models/<model>_aqi.pth)")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--accum-steps", type=int, default=1, help="batches per optimizer step")
+    parser.add_argument("--amp", action="store_true", help="bfloat16 autocast")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <out>.ckpt)")
+    parser.add_argument("--checkpoint-every", type=int, default=1, help="epochs between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint if it exists")
+    parser.add_argument("--patience", type=int, default=None, help="early-stopping patience in epochs")
+    parser.add_argument("--num-workers", type=int, default=None)
+    parser.add_argument("--no-pretrained", action="store_true", help="start from random instead of ImageNet weights")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.cache_dir and not (args.csv and args.img_dir):
+        parser.error("pass --cache-dir, or both --csv and --img-dir")
+    if args.accum_steps < 1:
+        parser.error("--accum-steps must be at least 1")
+
+    from src.dataset import load_dataframe
+
+    df = None if args.cache_dir else load_dataframe(args.csv, args.scaler)
+    model_path = args.out or f"models/{args.model_name}_aqi.pth"
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    train_model(
+        df, args.img_dir, args.model_name, model_path, device,
+        num_epochs=args.epochs, batch_size=args.batch_size, cache_dir=args.cache_dir,
+        num_workers=args.num_workers, amp=args.amp, accum_steps=args.accum_steps,
+        checkpoint_path=args.checkpoint or model_path + ".ckpt", checkpoint_every=args.checkpoint_every,
+        resume=args.resume, patience=args.patience, pretrained=not args.no_pretrained,
+        lr=args.lr, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import time
+import random
+import asyncio
+import httpx
+from cache import TTLCache
+from metrics import Counter, Histogram
+
+WAQI_SECONDS = Histogram("waqi_request_seconds", "Latency of each WAQI HTTP attempt", ["outcome"])
+WAQI_LOOKUPS = Counter("waqi_lookups_total", "Station lookups by how they were answered", ["result"])
+
+
+class WaqiUnavailable(RuntimeError):
+    """The WAQI API could not be reached after all retries."""
+
+
+def parse_feed(res):
+    """
+    Station position and pollutant readings from a WAQI /feed response,
+    or None when WAQI reports no data.
+    """
+    if res.get("status") != "ok":
+        return None
+
+    data = res["data"]
+
+    station_lat, station_lon = data["city"]["geo"]
+    iaqi = data.get("iaqi", {})
+
+    return {
+        "station_lat": station_lat,
+        "station_lon": station_lon,
+        "aqi": data.get("aqi"),
+        "pm25": iaqi.get("pm25", {}).get("v"),
+        "pm10": iaqi.get("pm10", {}).get("v"),
+        "o3": iaqi.get("o3", {}).get("v"),
+        "co": iaqi.get("co", {}).get("v"),
+        "so2": iaqi.get("so2", {}).get("v"),
+        "no2": iaqi.get("no2", {}).get("v"),
+    }
+
+
+class WaqiClient:
+    """
+    Async WAQI feed client with one pooled connection set, per-request
+    timeouts, bounded concurrency and retries with exponential backoff.
+
+    Responses are cached per geo bucket (a bucket_deg grid cell, 0.01 deg is
+    about 1 km) for cache_ttl seconds, so pings from nearby positions reuse
+    one station lookup. Concurrent lookups for the same bucket share a request.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, token, base_url="https://api.waqi.info", timeout=5.0, retries=2, backoff=0.25,
+                 max_connections=20, cache_ttl=300, cache_size=4096, bucket_deg=0.01, transport=None):
+        if bucket_deg <= 0:
+            raise ValueError("bucket_deg must be positive")
+        self.token = token
+        self.retries = retries
+        self.backoff = backoff
+        self.bucket_deg = bucket_deg
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.requests = 0
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            transport=transport,
+        )
+        self._slots = asyncio.Semaphore(max_connections)
+        self._inflight = {}
+
+    def bucket(self, lat, lon):
+        return f"{round(lat / self.bucket_deg)}:{round(lon / self.bucket_deg)}"
+
+    async def station(self, lat, lon):
+        """
+        Nearest station data for a position (see parse_feed), or None.
+        Raises WaqiUnavailable when WAQI cannot be reached.
+        """
+        key = self.bucket(lat, lon)
+        cached = self.cache.get(key)
+        if cached is not None:
+            WAQI_LOOKUPS.inc(result="cache_hit")
+            return cached
+
+        task = self._inflight.get(key)
+        if task is None:
+            WAQI_LOOKUPS.inc(result="fetched")
+            task = asyncio.ensure_future(self._lookup(key, lat, lon))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            WAQI_LOOKUPS.inc(result="coalesced")
+        return await asyncio.shield(task)
+
+    async def _lookup(self, key, lat, lon):
+        data = parse_feed(await self._get(f"/feed/geo:{lat};{lon}/"))
+        # "no station" answers are not cached, WAQI may just be catching up
+        if data is not None:
+            self.cache.set(key, data)
+        return data
+
+    async def _get(self, path):
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._slots:
+                    self.requests += 1
+                    start = time.perf_counter()  # excludes the wait for a slot
+                    res = await self._client.get(path, params={"token": self.token})
+                if res.status_code in self.RETRY_STATUS:
+                    WAQI_SECONDS.observe(time.perf_counter() - start, outcome="retryable")
+                    error = f"HTTP {res.status_code}"
+                    retry_after = res.headers.get("Retry-After")
+                elif res.is_error:
+                    WAQI_SECONDS.observe(time.perf_counter() - start, outcome="error")
+                    raise WaqiUnavailable(f"WAQI returned HTTP {res.status_code}")
+                else:
+                    try:
+                        body = res.json()
+                    except ValueError:
+                        # A 200 with an HTML or empty body, e.g. from a proxy or maintenance page
+                        WAQI_SECONDS.observe(time.perf_counter() - start, outcome="invalid_body")
+                        error, retry_after = "HTTP 200 with a body that is not JSON", None
+                    else:
+                        WAQI_SECONDS.observe(time.perf_counter() - start, outcome="ok")
+                        return body
+            except httpx.TransportError as e:
+                WAQI_SECONDS.observe(time.perf_counter() - start, outcome="transport_error")
+                error, retry_after = repr(e), None
+            if attempt == self.retries:
+                break
+            # Full jitter keeps many workers from retrying in lockstep
+            delay = self.backoff * 2 ** attempt * random.random()
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay)
+        raise WaqiUnavailable(f"WAQI request failed after {self.retries + 1} attempts: {error}")
+
+    async def aclose(self):
+        await self._client.aclose()
@@ -0,0 +1,281 @@
+"""
+Process-pool inference: N worker processes run the forward pass while the
+API process decodes, batches and scales. Enabled with INFERENCE_WORKERS=N
+(see inference.py); run a single uvicorn worker in front of the pool.
+
+Memory: every worker maps the checkpoint read-only (load_model(mmap=True)),
+so the weight pages sit once in the OS page cache however many workers
+there are. Each worker still pays for its own torch runtime and
+activations.
+
+Transport: batches travel through a fixed ring of shared-memory slots. The
+API process writes the preprocessed float32 rows into a free slot. A worker
+runs the model on that memory in place and writes the scaled outputs (and
+features, for embed) back into the same slot. Only slot numbers cross the
+process boundary, so nothing is pickled.
+"""
+import math
+import time
+import queue
+import threading
+import collections
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+import numpy as np
+import torch
+from model import get_model, head_layer
+
+IMAGE_SHAPE = (3, 224, 224)
+
+
+def _layout_shapes(slots, slot_rows, num_outputs, feature_dim):
+    return [(slots, slot_rows, *IMAGE_SHAPE), (slots, slot_rows, num_outputs), (slots, slot_rows, feature_dim)]
+
+
+def _views(buf, layout):
+    """
+    The inputs, outputs and features float32 arrays over one shared buffer.
+    """
+    arrays, offset = [], 0
+    for shape in _layout_shapes(*layout):
+        arrays.append(np.ndarray(shape, dtype=np.float32, buffer=buf, offset=offset))
+        offset += math.prod(shape) * 4
+    return arrays
+
+
+def _serve(shm_name, layout, model_name, model_path, quantize, num_threads, tasks, results):
+    """
+    Worker process loop: load the model, report ready, then run (slot, rows,
+    embed) tasks until a None task arrives. Each task is answered with
+    (slot, error message or None).
+    """
+    try:
+        from backends import load_backend
+        backend = load_backend("eager", model_name, model_path, None, torch.device("cpu"),
+                               quantize=quantize, num_threads=num_threads, mmap=True)
+        shm = shared_memory.SharedMemory(name=shm_name)
+        inputs, outputs, features = _views(shm.buf, layout)
+    except Exception as e:
+        results.put((None, f"{type(e).__name__}: {e}"))
+        return
+    results.put((None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        slot, rows, embed = task
+        try:
+            batch = torch.from_numpy(inputs[slot, :rows])  # the shared memory itself, not a copy
+            if embed:
+                preds, feats = backend.embed(batch)
+                features[slot, :rows] = feats
+            else:
+                preds = backend(batch)
+            outputs[slot, :rows] = preds
+            results.put((slot, None))
+        except Exception as e:
+            results.put((slot, f"{type(e).__name__}: {e}"))
+
+
+class InferencePool:
+    """
+    A backend (see backends.py) backed by worker processes running the eager
+    model. Calling it with an N x 3 x 224 x 224 batch returns the scaled
+    N x 7 predictions as a numpy array; embed(batch) also returns the
+    penultimate-layer features. A batch is split across the workers, so one
+    large batch uses several cores. Safe to call from several threads;
+    callers wait for a free slot when every slot is busy.
+
+    If a worker process dies, pending and later calls raise RuntimeError and
+    healthy turns False, so /ready fails and the container is restarted.
+    """
+
+    def __init__(self, workers, model_name, model_path, quantize=None, num_threads=None,
+                 slot_rows=8, slots=None, start_timeout=120.0):
+        if workers < 1:
+            raise ValueError("An inference pool needs at least one worker")
+        if slot_rows < 1:
+            raise ValueError("slot_rows must be at least 1")
+        with torch.device("meta"):
+            head = head_layer(get_model(model_name, pretrained=False))
+        self.workers = workers
+        self.slot_rows = slot_rows
+        self.num_outputs, self.feature_dim = head.out_features, head.in_features
+        slots = slots or 2 * workers
+        layout = (slots, slot_rows, self.num_outputs, self.feature_dim)
+        nbytes = sum(math.prod(shape) for shape in _layout_shapes(*layout)) * 4
+        self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._inputs, self._outputs, self._features = _views(self._shm.buf, layout)
+
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._error = None
+        self._closed = False
+
+        # spawn, not fork: forking a process that has started torch threads is unsafe
+        ctx = mp.get_context("spawn")
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._processes = [
+            ctx.Process(
+                target=_serve, name=f"inference-worker-{i}", daemon=True,
+                args=(self._shm.name, layout, model_name, model_path, quantize, num_threads,
+                      self._tasks, self._results),
+            )
+            for i in range(workers)
+        ]
+        try:
+            for process in self._processes:
+                process.start()
+            self._await_ready(start_timeout)
+        except BaseException:
+            self.close()
+            raise
+        self._reader = threading.Thread(target=self._read_results, name="inference-pool-results", daemon=True)
+        self._reader.start()
+
+    @property
+    def healthy(self):
+        return self._error is None
+
+    def _dead_worker(self):
+        return next((p for p in self._processes if not p.is_alive()), None)
+
+    def _await_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        ready = 0
+        while ready < len(self._processes):
+            try:
+                _, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                dead = self._dead_worker()
+                if dead is not None:
+                    raise RuntimeError(f"{dead.name} exited with code {dead.exitcode} while starting")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"Inference workers did not start within {timeout:.0f} s")
+                continue
+            if error:
+                raise RuntimeError(f"Inference worker failed to start: {error}")
+            ready += 1
+
+    # -------------------------------
+    # RESULTS
+    # -------------------------------
+    def _read_results(self):
+        checked = time.monotonic()
+        while not self._closed:
+            try:
+                slot, error = self._results.get(timeout=0.5)
+                with self._lock:
+                    future = self._pending.pop(slot, None)
+                if future is not None and error:
+                    future.set_exception(RuntimeError(error))
+                elif future is not None:
+                    future.set_result(None)
+            except queue.Empty:
+                pass
+            if time.monotonic() - checked > 0.5:
+                checked = time.monotonic()
+                dead = self._dead_worker()
+                if dead is not None and not self._closed:
+                    self._fail(RuntimeError(f"{dead.name} exited with code {dead.exitcode}"))
+                    return
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(error)
+
+    # -------------------------------
+    # BATCHES
+    # -------------------------------
+    def _submit(self, slot, start, rows, embed):
+        np.copyto(self._inputs[slot, :len(rows)], rows.numpy())
+        future = Future()
+        with self._lock:
+            if self._error is not None:
+                self._free.put(slot)
+                raise self._error
+            self._pending[slot] = future
+        self._tasks.put((slot, len(rows), embed))
+        return start, len(rows), slot, future
+
+    def _collect(self, chunk, preds, features):
+        start, rows, slot, future = chunk
+        try:
+            future.result()
+            preds[start:start + rows] = self._outputs[slot, :rows]
+            if features is not None:
+                features[start:start + rows] = self._features[slot, :rows]
+        finally:
+            self._free.put(slot)
+
+    def _run(self, batch, embed):
+        if self._error is not None:
+            raise self._error
+        batch = batch.detach().to("cpu", torch.float32)
+        if tuple(batch.shape[1:]) != IMAGE_SHAPE:
+            raise ValueError(f"Expected an N x {' x '.join(map(str, IMAGE_SHAPE))} batch, got {tuple(batch.shape)}")
+        preds = np.empty((len(batch), self.num_outputs), dtype=np.float32)
+        features = np.empty((len(batch), self.feature_dim), dtype=np.float32) if embed else None
+        # Spread one batch over every worker, in chunks that fit a slot
+        step = min(self.slot_rows, max(1, math.ceil(len(batch) / self.workers)))
+
+        in_flight = collections.deque()
+        try:
+            for start in range(0, len(batch), step):
+                # Only block on the ring while holding no slots, or callers
+                # holding part of the ring could wait on each other forever
+                while True:
+                    try:
+                        slot = self._free.get(block=not in_flight)
+                        break
+                    except queue.Empty:
+                        self._collect(in_flight.popleft(), preds, features)
+                in_flight.append(self._submit(slot, start, batch[start:start + step], embed))
+            while in_flight:
+                self._collect(in_flight.popleft(), preds, features)
+        finally:
+            # A slot is reused only once its worker is done with it
+            for _, _, slot, future in in_flight:
+                future.exception()
+                self._free.put(slot)
+        return preds, features
+
+    def __call__(self, batch):
+        return self._run(batch, embed=False)[0]
+
+    def embed(self, batch):
+        """
+        (N x 7 scaled predictions, N x D float32 features) as numpy arrays.
+        """
+        return self._run(batch, embed=True)
+
+    def close(self):
+        """
+        Stop the workers and release the shared memory.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        for process in self._processes:
+            if process.is_alive():
+                self._tasks.put(None)
+        for process in self._processes:
+            if process.pid is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        self._fail(RuntimeError("The inference pool is closed"))
+        self._inputs = self._outputs = self._features = None
+        self._shm.unlink()
+        self._shm.close()
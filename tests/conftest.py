@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+# The app imports its modules flat from src/, as src/__init__.py arranges
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+# database.py and api.py read these at import time
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+for name, value in (("SECRET_KEY", "test-secret"), ("MAIL_USERNAME", "test"), ("MAIL_PASSWORD", "test"),
+                    ("MAIL_FROM", "test@example.com"), ("MODEL_LAZY_LOAD", "1")):
+    os.environ.setdefault(name, value)
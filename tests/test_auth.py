@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("fastapi_mail")
+
+import api  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from models import User  # noqa: E402
+
+
+@pytest.fixture
+def username():
+    name = "auth-test-user"
+    with SessionLocal() as db:
+        if db.query(User).filter(User.username == name).first() is None:
+            db.add(User(username=name, hashed_password="x"))
+            db.commit()
+    api.user_cache.clear()
+    api.password_resets.clear()
+    return name
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    calls = []
+    fetch_user = api.fetch_user
+
+    async def counting_fetch_user(username):
+        calls.append(username)
+        return await fetch_user(username)
+
+    monkeypatch.setattr(api, "fetch_user", counting_fetch_user)
+    return calls
+
+
+def resolve(token):
+    return asyncio.run(api.get_current_user(token))
+
+
+def test_resolved_users_are_cached(username, lookups):
+    token = api.create_access_token(username)
+    assert resolve(token).username == username
+    assert resolve(token).username == username
+    assert lookups == [username]
+
+
+def test_password_reset_revokes_older_tokens(username, lookups, monkeypatch):
+    old_token = api.create_access_token(username)
+    resolve(old_token)
+
+    monkeypatch.setattr(api.time, "time", lambda: 2_000_000_000.0)
+    api.revoke_tokens(username)
+    with pytest.raises(HTTPException) as error:
+        resolve(old_token)
+    assert error.value.status_code == 401
+
+    # A token issued after the reset works and resolves the user afresh
+    assert resolve(api.create_access_token(username)).username == username
+    assert lookups == [username, username]
+
+
+def test_token_issued_earlier_in_the_reset_second_is_revoked(username, monkeypatch):
+    monkeypatch.setattr(api.time, "time", lambda: 2_000_000_000.2)
+    old_token = api.create_access_token(username)
+    monkeypatch.setattr(api.time, "time", lambda: 2_000_000_000.7)
+    api.revoke_tokens(username)
+    with pytest.raises(HTTPException) as error:
+        resolve(old_token)
+    assert error.value.status_code == 401
+
+
+def test_stateless_mode_skips_lookup(username, lookups, monkeypatch):
+    monkeypatch.setattr(api, "AUTH_STATELESS", True)
+    assert resolve(api.create_access_token("someone-else")).username == "someone-else"
+    assert lookups == []
+
+
+def test_unknown_user_is_rejected(username):
+    with pytest.raises(HTTPException):
+        resolve(api.create_access_token("nobody"))
+
+
+def test_password_hashing_runs_on_the_bounded_executor(monkeypatch):
+    threads = []
+    hash_ = api.pwd_context.hash
+
+    def recording_hash(password):
+        threads.append(threading.current_thread().name)
+        return hash_(password)
+
+    monkeypatch.setattr(api.pwd_context, "hash", recording_hash)
+
+    async def run():
+        hashed = await api.hash_password("correct horse")
+        return hashed, await api.verify_password("correct horse", hashed), await api.verify_password("wrong", hashed)
+
+    _, good, bad = asyncio.run(run())
+    assert (good, bad) == (True, False)
+    assert threads[0].startswith("bcrypt")
+
+
+def test_registration_otp_flow(monkeypatch):
+    sent = []
+
+    class FakeMail:
+        def __init__(self, conf):
+            pass
+
+        async def send_message(self, message):
+            sent.append(message.body.rsplit(" ", 1)[-1])
+
+    monkeypatch.setattr(api, "FastMail", FakeMail)
+    api.otp_store.clear()
+    with TestClient(api.app) as client:
+        email = "otp-flow@example.com"
+        body = {"username": "otp-flow", "password": "s3cret-pass", "email": email}
+        assert client.post("/register/send-otp", json=body).status_code == 200
+        # Only the hash is kept while the OTP is pending
+        assert "password" not in api.otp_store.get(email)
+
+        assert client.post("/register/verify-otp", json={"email": email, "otp": "000000x"}).json()["success"] is False
+        assert client.post("/register/verify-otp", json={"email": email, "otp": sent[0]}).json()["success"] is True
+        assert api.otp_store.get(email) is None
+
+        login = client.post("/login", data={"username": "otp-flow", "password": "s3cret-pass"})
+        assert login.status_code == 200 and "access_token" in login.json()
+        assert client.post("/login", data={"username": "otp-flow", "password": "nope"}).status_code == 401
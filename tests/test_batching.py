@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+import pytest
+
+from batching import BatchScheduler
+
+
+class GatedRunner:
+    """
+    run_batch stub that records every batch and can hold the worker
+    inside its first call so later requests pile up in the queue.
+    """
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, items):
+        self.batches.append(list(items))
+        if len(self.batches) == 1:
+            self.entered.set()
+            assert self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("forward pass failed")
+        return [item * 10 for item in items]
+
+
+def hold_worker(scheduler, runner):
+    first = scheduler.submit(0)
+    assert runner.entered.wait(5)
+    return first
+
+
+def test_rejects_invalid_config():
+    with pytest.raises(ValueError):
+        BatchScheduler(lambda items: items, max_batch_size=0)
+    with pytest.raises(ValueError):
+        BatchScheduler(lambda items: items, max_wait_ms=-1)
+
+
+def test_batches_are_cut_at_max_batch_size():
+    runner = GatedRunner()
+    scheduler = BatchScheduler(runner, max_batch_size=4, max_wait_ms=50)
+    first = hold_worker(scheduler, runner)
+    futures = [scheduler.submit(i) for i in range(1, 11)]
+    runner.release.set()
+
+    assert [f.result(5) for f in futures] == [i * 10 for i in range(1, 11)]
+    assert first.result(5) == 0
+    assert [len(b) for b in runner.batches] == [1, 4, 4, 2]
+
+
+def test_partial_batch_dispatched_after_max_wait():
+    runner = GatedRunner()
+    runner.release.set()
+    scheduler = BatchScheduler(runner, max_batch_size=32, max_wait_ms=10)
+
+    assert scheduler.submit(3).result(2) == 30
+    assert runner.batches == [[3]]
+
+
+def test_each_caller_gets_its_own_row():
+    scheduler = BatchScheduler(lambda items: [i * 10 for i in items], max_batch_size=8, max_wait_ms=5)
+    futures = {i: scheduler.submit(i) for i in range(50)}
+
+    assert all(f.result(5) == i * 10 for i, f in futures.items())
+
+
+def test_cancelled_requests_are_skipped():
+    runner = GatedRunner()
+    scheduler = BatchScheduler(runner, max_batch_size=8, max_wait_ms=20)
+    hold_worker(scheduler, runner)
+    cancelled = scheduler.submit(1)
+    kept = scheduler.submit(2)
+    assert cancelled.cancel()
+    runner.release.set()
+
+    assert kept.result(5) == 20
+    assert runner.batches[1] == [2]
+
+
+def test_exception_reaches_every_caller_in_batch():
+    runner = GatedRunner(fail=True)
+    scheduler = BatchScheduler(runner, max_batch_size=8, max_wait_ms=20)
+    first = hold_worker(scheduler, runner)
+    futures = [scheduler.submit(i) for i in range(1, 4)]
+    runner.release.set()
+
+    for future in [first] + futures:
+        with pytest.raises(RuntimeError, match="forward pass failed"):
+            future.result(5)
+
+
+def test_predict_is_awaitable():
+    scheduler = BatchScheduler(lambda items: [i + 1 for i in items], max_batch_size=4, max_wait_ms=5)
+
+    async def run():
+        return await asyncio.gather(*(scheduler.predict(i) for i in range(6)))
+
+    assert asyncio.run(run()) == [1, 2, 3, 4, 5, 6]
+
+
+def test_queue_and_batch_metrics_are_recorded():
+    from batching import BATCH_SIZE, QUEUE_DEPTH, QUEUE_WAIT
+
+    runner = GatedRunner()
+    scheduler = BatchScheduler(runner, max_batch_size=4, max_wait_ms=50, name="metrics-test")
+    first = hold_worker(scheduler, runner)
+    futures = [scheduler.submit(i) for i in range(1, 4)]
+    assert dict(QUEUE_DEPTH.fn())[("metrics-test",)] == 3
+    runner.release.set()
+    [f.result(5) for f in [first] + futures]
+
+    assert BATCH_SIZE.count(scheduler="metrics-test") == 2
+    assert QUEUE_WAIT.count(scheduler="metrics-test") == 4
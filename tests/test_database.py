@@ -0,0 +1,49 @@
+import pytest
+
+from database import async_url, pool_options
+
+
+def test_async_url_picks_async_driver():
+    assert str(async_url("postgresql://u:p@db/aqi")) == "postgresql+asyncpg://u:***@db/aqi"
+    assert async_url("postgresql+psycopg2://u@db/aqi").drivername == "postgresql+asyncpg"
+    assert async_url("sqlite:///data.db").drivername == "sqlite+aiosqlite"
+    with pytest.raises(ValueError):
+        async_url("mysql://u@db/aqi")
+
+
+def test_pool_sizing_only_for_server_databases():
+    assert "pool_size" in pool_options("postgresql://u@db/aqi")
+    assert "pool_size" not in pool_options("sqlite:///data.db")
+    assert pool_options("sqlite:///data.db")["pool_pre_ping"] is not None
+
+
+def test_async_engine_round_trip(tmp_path):
+    pytest.importorskip("aiosqlite")
+    import asyncio
+    from sqlalchemy import Column, Integer, String, select
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from sqlalchemy.orm import declarative_base
+
+    Base = declarative_base()
+
+    class Row(Base):
+        __tablename__ = "rows"
+        id = Column(Integer, primary_key=True)
+        name = Column(String)
+
+    url = async_url(f"sqlite:///{tmp_path / 'test.db'}")
+
+    async def run():
+        engine = create_async_engine(url, **pool_options(url))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            db.add(Row(name="a"))
+            await db.commit()
+        async with sessions() as db:
+            row = await db.scalar(select(Row).where(Row.name == "a"))
+        await engine.dispose()
+        return row.name
+
+    assert asyncio.run(run()) == "a"
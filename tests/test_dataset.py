@@ -0,0 +1,58 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pd = pytest.importorskip("pandas")
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+from torchvision import transforms  # noqa: E402
+
+from dataset import AirQualityDataset, CachedAirQualityDataset, LABEL_COLS, build_cache, loader_kwargs  # noqa: E402
+
+
+@pytest.fixture
+def labelled_images(tmp_path):
+    rng = np.random.default_rng(0)
+    names = []
+    for i in range(5):
+        name = f"img{i}.jpg"
+        Image.fromarray((rng.random((90, 120, 3)) * 255).astype(np.uint8)).save(tmp_path / name)
+        names.append(f" {name} ")  # the real CSV has padded filenames
+    df = pd.DataFrame(rng.random((5, len(LABEL_COLS))), columns=LABEL_COLS)
+    df.insert(0, "Filename", names)
+    return df, tmp_path
+
+
+def test_cached_dataset_matches_decoding_dataset(labelled_images, tmp_path):
+    df, img_dir = labelled_images
+    cache_dir = tmp_path / "cache"
+    build_cache(df, str(img_dir), str(cache_dir), workers=1)
+
+    normalize = transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+    full = transforms.Compose([transforms.Resize((224, 224)), transforms.ToTensor(), normalize])
+    decoded = AirQualityDataset(df, str(img_dir), transform=full)
+    cached = CachedAirQualityDataset(str(cache_dir), transform=normalize)
+
+    assert len(cached) == len(decoded)
+    for i in range(len(df)):
+        img_a, labels_a = decoded[i]
+        img_b, labels_b = cached[i]
+        assert img_b.shape == (3, 224, 224)
+        torch.testing.assert_close(img_b, img_a)
+        torch.testing.assert_close(labels_b, labels_a)
+
+
+def test_build_cache_fails_on_missing_file(labelled_images, tmp_path):
+    df, img_dir = labelled_images
+    df.loc[2, "Filename"] = "missing.jpg"
+    with pytest.raises(FileNotFoundError, match="missing.jpg"):
+        build_cache(df, str(img_dir), str(tmp_path / "cache"), workers=1)
+
+
+def test_loader_kwargs_only_sets_worker_options_with_workers():
+    assert loader_kwargs(num_workers=0, pin_memory=False) == {"num_workers": 0, "pin_memory": False}
+    assert loader_kwargs(num_workers=3, pin_memory=True, prefetch_factor=2) == {
+        "num_workers": 3, "pin_memory": True, "persistent_workers": True, "prefetch_factor": 2,
+    }
+    assert 0 <= loader_kwargs()["num_workers"] <= 8
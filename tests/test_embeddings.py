@@ -0,0 +1,189 @@
+import os
+import numpy as np
+import pytest
+
+from embeddings import EmbeddingIndex
+
+
+def clustered(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    return centres[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+
+
+def test_exact_search_returns_nearest_with_metadata(tmp_path):
+    vectors = clustered(500)
+    index = EmbeddingIndex(str(tmp_path / "index"))
+    index.add(vectors, [{"filename": f"img{i}.jpg"} for i in range(len(vectors))])
+
+    hits = index.search(vectors[42], k=5)
+    assert [row for _, row, _ in hits][0] == 42
+    assert hits[0][2] == {"filename": "img42.jpg"}
+    assert hits[0][0] == pytest.approx(1.0, abs=1e-3)
+    assert [score for score, _, _ in hits] == sorted((score for score, _, _ in hits), reverse=True)
+
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normed @ normed[42]))[:5]
+    assert set(row for _, row, _ in hits) == set(expected)
+
+
+def test_appends_persist_across_reopen(tmp_path):
+    path = str(tmp_path / "index")
+    vectors = clustered(30)
+    index = EmbeddingIndex(path)
+    index.add(vectors[:20], [{"i": i} for i in range(20)])
+    index.add(vectors[20:], [{"i": i} for i in range(20, 30)])
+
+    reopened = EmbeddingIndex(path)
+    assert len(reopened) == 30 and reopened.dim == 32
+    assert reopened.search(vectors[25], k=1)[0][2] == {"i": 25}
+    with pytest.raises(ValueError):
+        reopened.add(np.ones((1, 8)), [{}])
+
+
+def test_partial_append_is_ignored_and_overwritten(tmp_path):
+    path = str(tmp_path / "index")
+    vectors = clustered(10)
+    EmbeddingIndex(path).add(vectors[:5], [{"i": i} for i in range(5)])
+    # A crash after the metadata was written but before the vector was
+    with open(tmp_path / "index" / "meta.jsonl", "ab") as f:
+        f.write(b'{"i": "torn"')
+
+    index = EmbeddingIndex(path)
+    assert len(index) == 5
+    index.add(vectors[5:], [{"i": i} for i in range(5, 10)])
+    assert [meta["i"] for meta in index.metadata(range(10))] == list(range(10))
+
+
+def test_ivf_search_matches_exact_and_takes_new_rows(tmp_path):
+    vectors = clustered(4000)
+    index = EmbeddingIndex(str(tmp_path / "index"), nprobe=4)
+    index.add(vectors, [{"i": i} for i in range(len(vectors))])
+    assert index.train(nlist=40) == 40
+
+    queries = clustered(50, seed=1)
+    recall = np.mean([
+        len({r for _, r, _ in index.search(q, k=10)} & {r for _, r, _ in index.search(q, k=10, exact=True)}) / 10
+        for q in queries
+    ])
+    assert recall >= 0.9
+
+    # Rows appended after training are assigned to a list and found
+    new = clustered(3, seed=2)
+    rows = index.add(new, [{"i": "new"}] * 3)
+    assert index.search(new[1], k=1)[0][1] == rows[1]
+    reopened = EmbeddingIndex(str(tmp_path / "index"))
+    assert reopened.centroids is not None and len(reopened) == 4003
+    assert reopened.search(new[1], k=1)[0][1] == rows[1]
+
+
+def test_rows_appended_while_another_process_trains_are_kept(tmp_path):
+    path = str(tmp_path / "index")
+    vectors = clustered(600)
+    appender = EmbeddingIndex(path)
+    appender.add(vectors[:500], [{"i": i} for i in range(500)])
+    trainer = EmbeddingIndex(path)  # e.g. python -m src.embeddings --train
+    appender.add(vectors[500:550], [{"i": i} for i in range(500, 550)])
+    trainer.train(nlist=10)  # lists.i32 covers the 500 rows it saw
+
+    # A restart before the appender writes again keeps the later rows
+    reopened = EmbeddingIndex(path)
+    assert len(reopened) == 550
+    assert reopened.search(vectors[520], k=1)[0][1] == 520
+
+    rows = appender.add(vectors[550:], [{"i": i} for i in range(550, 600)])
+    assert appender.centroids is not None
+    assert appender.search(vectors[580], k=1)[0][1] == rows[30] == 580
+    assert os.path.getsize(os.path.join(path, "lists.i32")) == 600 * 4
+    reopened = EmbeddingIndex(path)
+    assert len(reopened) == 600
+    for row in (10, 520, 580):
+        assert reopened.search(vectors[row], k=1)[0][1] == row
+
+
+def test_empty_index(tmp_path):
+    index = EmbeddingIndex(str(tmp_path / "missing"))
+    assert len(index) == 0 and index.search(np.ones(4)) == []
+    with pytest.raises(ValueError):
+        index.train()
+
+
+class EmbeddingModel:
+    """Stub eager backend: features are the mean colour of the image."""
+
+    def __call__(self, batch):
+        return np.zeros((len(batch), 7), dtype=np.float32)
+
+    def embed(self, batch):
+        return self(batch), batch.mean(dim=(2, 3)).numpy()
+
+
+class IdentityScaler:
+    def inverse_transform(self, x):
+        return np.asarray(x)
+
+
+def test_similar_endpoint_searches_then_appends(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("fastapi_mail")
+    import io
+    import api
+    import inference
+    from PIL import Image
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(inference, "_model", EmbeddingModel())
+    monkeypatch.setattr(inference, "_scaler", IdentityScaler())
+    monkeypatch.setattr(api, "embedding_index", EmbeddingIndex(str(tmp_path / "index")))
+    api.app.dependency_overrides[api.get_current_user] = lambda: api.SimpleNamespace(username="tester")
+
+    def upload(colour):
+        buf = io.BytesIO()
+        Image.new("RGB", (64, 64), colour).save(buf, format="PNG")
+        return {"file": (f"{colour}.png", buf.getvalue(), "image/png")}
+
+    try:
+        with TestClient(api.app) as client:
+            for colour in ("red", "blue", "green"):
+                body = client.post("/similar?add=true", files=upload(colour)).json()
+            # Searched before the green upload was appended
+            assert {n["filename"] for n in body["neighbours"]} == {"red.png", "blue.png"}
+
+            body = client.post("/similar?k=1", files=upload("blue")).json()
+            assert body["neighbours"][0]["filename"] == "blue.png"
+            assert body["neighbours"][0]["added_by"] == "tester"
+            assert body["neighbours"][0]["similarity"] == pytest.approx(1.0, abs=1e-3)
+            assert len(api.embedding_index) == 3
+    finally:
+        api.app.dependency_overrides.clear()
+
+
+def test_similar_endpoint_separates_not_ready_from_failures(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("fastapi_mail")
+    import io
+    import api
+    import inference
+    from PIL import Image
+    from fastapi.testclient import TestClient
+
+    class BrokenModel(EmbeddingModel):
+        def embed(self, batch):
+            raise RuntimeError("forward pass failed")
+
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), "red").save(buf, format="PNG")
+    files = {"file": ("red.png", buf.getvalue(), "image/png")}
+    monkeypatch.setattr(inference, "_scaler", IdentityScaler())
+    monkeypatch.setattr(api, "embedding_index", EmbeddingIndex(str(tmp_path / "index")))
+    api.app.dependency_overrides[api.get_current_user] = lambda: api.SimpleNamespace(username="tester")
+    # No lifespan, so nothing starts loading the real model
+    client = TestClient(api.app, raise_server_exceptions=False)
+    try:
+        monkeypatch.setattr(inference, "_model", None)
+        assert client.post("/similar", files=files).status_code == 503
+
+        monkeypatch.setattr(inference, "_model", BrokenModel())
+        assert client.post("/similar", files=files).status_code == 500
+    finally:
+        api.app.dependency_overrides.clear()
@@ -0,0 +1,41 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("onnx")
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+from sklearn.preprocessing import MinMaxScaler  # noqa: E402
+
+from backends import load_backend  # noqa: E402
+from export import export_model, check_parity  # noqa: E402
+from model import get_model  # noqa: E402
+
+
+def test_exported_backends_match_eager(tmp_path):
+    torch.manual_seed(0)
+    checkpoint = tmp_path / "resnet18_aqi.pth"
+    torch.save(get_model("resnet18", pretrained=False).state_dict(), checkpoint)
+    scaler_path = tmp_path / "label_scaler.save"
+    joblib.dump(MinMaxScaler().fit(np.random.rand(10, 7)), scaler_path)
+    out_dir = tmp_path / "export"
+
+    model, paths = export_model("resnet18", str(checkpoint), str(scaler_path), str(out_dir))
+    diffs = check_parity(model, paths)
+    assert set(diffs) == {"torchscript", "onnx"}
+    assert (out_dir / "label_scaler.save").exists()
+
+    # The same artifacts load through the configurable inference path
+    batch = torch.randn(2, 3, 224, 224)
+    cpu = torch.device("cpu")
+    eager = load_backend("eager", "resnet18", str(checkpoint), str(out_dir), cpu)(batch)
+    for kind in ("torchscript", "onnx"):
+        out = load_backend(kind, "resnet18", str(checkpoint), str(out_dir), cpu)(batch)
+        np.testing.assert_allclose(out, eager, atol=1e-3)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        load_backend("tensorrt", "resnet18", "unused.pth", "unused", torch.device("cpu"))
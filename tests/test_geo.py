@@ -0,0 +1,64 @@
+import numpy as np
+
+from geo import PointIndex, covering_geohashes, geohash, haversine_km
+
+
+def test_geohash_known_value():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+
+def test_haversine_scalar_and_vectorized():
+    # Bengaluru -> Chennai is about 290 km
+    assert abs(haversine_km(12.9716, 77.5946, 13.0827, 80.2707) - 290) < 5
+    distances = haversine_km(0.0, 0.0, np.array([0.0, 1.0]), np.array([1.0, 0.0]))
+    np.testing.assert_allclose(distances, [111.19, 111.19], atol=0.01)
+
+
+def test_covering_geohashes_contain_every_point_in_radius():
+    rng = np.random.default_rng(0)
+    lat, lon, radius = 12.97, 77.59, 5.0
+    prefixes = covering_geohashes(lat, lon, radius)
+    assert len(prefixes) <= 32
+    points = np.column_stack([lat + rng.uniform(-0.05, 0.05, 500), lon + rng.uniform(-0.05, 0.05, 500)])
+    inside = points[haversine_km(lat, lon, points[:, 0], points[:, 1]) <= radius]
+    for p_lat, p_lon in inside:
+        assert any(geohash(p_lat, p_lon).startswith(prefix) for prefix in prefixes)
+
+
+def test_point_index_matches_brute_force():
+    rng = np.random.default_rng(1)
+    lats, lons = 12.9 + rng.uniform(0, 0.3, 2000), 77.5 + rng.uniform(0, 0.3, 2000)
+    index = PointIndex(cell_deg=0.05)
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        index.add(lat, lon, i, i)
+
+    hits = index.query(13.0, 77.6, 3.0)
+
+    distances = haversine_km(13.0, 77.6, lats, lons)
+    assert [item for _, item in hits] == sorted(np.flatnonzero(distances <= 3.0), key=lambda i: distances[i])
+    assert [d for d, _ in hits] == sorted(d for d, _ in hits)
+    assert len(index.query(13.0, 77.6, 3.0, limit=5)) == 5
+
+
+def test_point_index_filters_and_expires_by_time():
+    index = PointIndex(cell_deg=0.05, max_age_s=100)
+    for t in (0, 50, 150):
+        index.add(10.0, 20.0, t, t)
+
+    assert [item for _, item in index.query(10.0, 20.0, 1.0, since=40)] == [50, 150]
+    assert [item for _, item in index.query(10.0, 20.0, 1.0, now=160)] == [150]
+    assert len(index) == 1
+
+
+def test_point_index_expires_cells_that_are_never_queried():
+    index = PointIndex(cell_deg=0.05, max_age_s=100)
+    for t in range(0, 300, 10):
+        index.add(10.0, 20.0, t, t)  # a cell only ever written to
+    index.add(-30.0, 40.0, 0, "stale")  # a cell nobody touches again
+
+    # Adding trims the written cell as it goes
+    assert len(index) == 11 + 1
+    index.sweep(now=290)
+    assert len(index) == 11
+    assert len(index._cells) == 1
+    assert [item for _, item in index.query(10.0, 20.0, 1.0)][-1] == 290
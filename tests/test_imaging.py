@@ -0,0 +1,70 @@
+import io
+import numpy as np
+import pytest
+from PIL import Image
+
+from imaging import ImageTooLarge, decode, open_image
+
+
+def encode(img, fmt, **options):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **options)
+    return buf.getvalue()
+
+
+@pytest.fixture(scope="module")
+def photo():
+    # Smooth gradients plus noise, roughly how a sky photo compresses
+    y, x = np.mgrid[0:1500, 0:2000]
+    rgb = np.stack([x / 8, y / 6, (x + y) / 14], axis=-1) % 255
+    noise = np.random.default_rng(0).normal(0, 6, rgb.shape)
+    return Image.fromarray(np.clip(rgb + noise, 0, 255).astype(np.uint8))
+
+
+def test_large_jpeg_is_downscaled_while_decoding(photo):
+    img = decode(encode(photo, "JPEG", quality=90), size=224)
+    assert img.mode == "RGB"
+    # 1/4 scale is the largest reduction that keeps both sides >= 224
+    assert img.size == (500, 375)
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "WEBP"])
+def test_other_formats_are_box_reduced(photo, fmt):
+    img = decode(encode(photo, fmt), size=224)
+    assert img.mode == "RGB"
+    assert min(img.size) >= 2 * 224
+    assert img.size[0] < photo.size[0]
+
+
+def test_reduced_decode_matches_full_decode(photo):
+    data = encode(photo, "JPEG", quality=90)
+    full = Image.open(io.BytesIO(data)).convert("RGB").resize((224, 224), Image.BILINEAR)
+    fast = decode(data, size=224).resize((224, 224), Image.BILINEAR)
+    diff = np.abs(np.asarray(full, dtype=np.float32) - np.asarray(fast, dtype=np.float32))
+    assert diff.mean() < 3
+
+
+def test_small_and_palette_images_are_converted_not_reduced():
+    img = Image.new("P", (100, 80))
+    img.info["transparency"] = 0
+    decoded = decode(encode(img, "PNG"))
+    assert decoded.mode == "RGB" and decoded.size == (100, 80)
+
+
+def test_limits_are_checked_before_decoding(photo, tmp_path):
+    data = encode(photo, "JPEG")
+    with pytest.raises(ImageTooLarge):
+        open_image(data, max_pixels=1000 * 1000)
+    with pytest.raises(ImageTooLarge):
+        decode(data, max_bytes=len(data) - 1)
+
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+    with pytest.raises(ImageTooLarge):
+        decode(str(path), max_bytes=1024)
+    assert decode(str(path)).size == (500, 375)
+
+
+def test_unsupported_format_is_rejected():
+    with pytest.raises(Image.UnidentifiedImageError):
+        decode(encode(Image.new("RGB", (8, 8)), "ICO"))
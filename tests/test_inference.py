@@ -0,0 +1,112 @@
+import io
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+import imaging  # noqa: E402
+import inference  # noqa: E402
+from PIL import Image  # noqa: E402
+
+
+class IdentityScaler:
+    def inverse_transform(self, x):
+        return np.asarray(x)
+
+
+class ConstantModel:
+    """Stub backend predicting the same value for every label of every image."""
+
+    def __init__(self, value):
+        self.value = value
+        self.batch_sizes = []
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        return np.full((len(batch), 7), self.value, dtype=np.float32)
+
+
+def test_tta_views_include_original_flips_and_crops():
+    batch = torch.randn(2, 3, 224, 224)
+    views = inference.tta_views(batch, ["flip", "crop"])
+    # original + five crops, each also flipped
+    assert views.shape == (2 * 12, 3, 224, 224)
+    torch.testing.assert_close(views[:2], batch)
+    torch.testing.assert_close(views[12:14], batch.flip(-1))
+
+
+def test_tta_views_without_augmentations_is_identity():
+    batch = torch.randn(1, 3, 224, 224)
+    torch.testing.assert_close(inference.tta_views(batch, []), batch)
+
+
+def test_predict_tta_runs_each_member_once_and_reports_spread(monkeypatch):
+    members = [ConstantModel(1.0), ConstantModel(3.0)]
+    monkeypatch.setattr(inference, "_model", members[0])
+    monkeypatch.setattr(inference, "_scaler", IdentityScaler())
+    monkeypatch.setattr(inference, "_ensemble", members)
+
+    mean, std = inference.predict_tta(torch.randn(3, 3, 224, 224))
+
+    views = len(inference.tta_views(torch.zeros(1, 3, 224, 224)))
+    assert [m.batch_sizes for m in members] == [[3 * views], [3 * views]]
+    assert mean.shape == std.shape == (3, 7)
+    np.testing.assert_allclose(mean, 2.0)
+    np.testing.assert_allclose(std, 1.0)
+
+
+def test_tta_scheduler_rows_hold_mean_and_std(monkeypatch):
+    monkeypatch.setattr(inference, "_model", ConstantModel(5.0))
+    monkeypatch.setattr(inference, "_scaler", IdentityScaler())
+    monkeypatch.setattr(inference, "_ensemble", [inference._model])
+
+    rows = inference.predict_tta_tensors([torch.randn(3, 224, 224), torch.randn(3, 224, 224)])
+
+    assert rows.shape == (2, 2, 7)
+    np.testing.assert_allclose(rows[:, 0], 5.0)
+    np.testing.assert_allclose(rows[:, 1], 0.0)
+
+
+def test_label_scaler_matches_minmax_inverse():
+    from sklearn.preprocessing import MinMaxScaler
+
+    rng = np.random.default_rng(0)
+    labels = rng.uniform([0, 0, 0, 0, 0, 0, 0], [500, 300, 400, 120, 10, 40, 80], size=(50, 7))
+    scaler = MinMaxScaler().fit(labels)
+    scaled = rng.uniform(0, 1, size=(16, 7)).astype(np.float32)
+
+    np.testing.assert_allclose(
+        inference.LabelScaler.from_minmax(scaler).inverse_transform(scaled),
+        scaler.inverse_transform(scaled), rtol=1e-6,
+    )
+
+
+def test_numeric_predictions_round_aqi_to_whole_numbers():
+    rows = np.array([[42.6, 32.486, 1.0, 2.0, 0.314, 5.0, 6.0]])
+    assert inference.numeric_predictions(rows) == [[43.0, 32.49, 1.0, 2.0, 0.31, 5.0, 6.0]]
+    assert inference.RESPONSE_METADATA["labels"][inference.AQI_INDEX] == "AQI"
+
+
+def test_predict_chunk_numeric_mode(monkeypatch):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32)).save(buf, format="PNG")
+    monkeypatch.setattr(inference, "predict_batch", lambda batch: np.full((len(batch), 7), 1.234))
+
+    results = inference.predict_chunk(
+        [("a.png", buf.getvalue()), ("bad.png", b"not an image"), ("b.png", buf.getvalue())], numeric=True,
+    )
+
+    assert [r["filename"] for r in results] == ["a.png", "bad.png", "b.png"]
+    assert results[0]["values"] == results[2]["values"] == [1.0] + [1.23] * 6
+    assert "error" in results[1] and "values" not in results[1]
+
+
+def test_predict_chunk_reports_oversized_images(monkeypatch):
+    buf = io.BytesIO()
+    Image.new("RGB", (400, 300)).save(buf, format="JPEG")
+    monkeypatch.setattr(inference, "predict_batch", lambda batch: np.zeros((len(batch), 7)))
+    monkeypatch.setattr(imaging, "MAX_IMAGE_PIXELS", 100 * 100)
+
+    results = inference.predict_chunk([("big.jpg", buf.getvalue())])
+    assert "limit" in results[0]["error"] and "predictions" not in results[0]
@@ -0,0 +1,144 @@
+import time
+import threading
+import pytest
+from sqlalchemy import Column, Float, Integer, create_engine, func, select
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from ingest import BufferedWriter, bulk_insert
+
+Base = declarative_base()
+
+
+class Reading(Base):
+    __tablename__ = "readings"
+    id = Column(Integer, primary_key=True)
+    aqi = Column(Float)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    Base.metadata.create_all(engine)
+    return sessionmaker(bind=engine)
+
+
+def count(session_factory):
+    with session_factory() as session:
+        return session.execute(select(func.count()).select_from(Reading)).scalar()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_bulk_insert_returns_ids_in_order(session_factory):
+    with session_factory() as session:
+        ids = bulk_insert(session, Reading, [{"aqi": 1.0}, {"aqi": 2.0}, {"aqi": 3.0}])
+        stored = dict(session.execute(select(Reading.id, Reading.aqi)).all())
+    assert [stored[i] for i in ids] == [1.0, 2.0, 3.0]
+
+
+def test_flushes_when_batch_is_full(session_factory):
+    flushed = []
+    writer = BufferedWriter(session_factory, Reading, max_rows=3, max_delay_s=60, on_flush=flushed.extend)
+    for aqi in (1.0, 2.0, 3.0):
+        writer.add({"aqi": aqi})
+
+    wait_for(lambda: len(flushed) == 3)
+    assert count(session_factory) == 3
+    assert all(row["id"] for row in flushed)
+
+    writer.add({"aqi": 4.0})
+    time.sleep(0.05)
+    assert writer.pending() == 1  # below max_rows and max_delay_s
+
+    writer.close()
+    assert count(session_factory) == 4
+
+
+def test_flushes_after_delay(session_factory):
+    writer = BufferedWriter(session_factory, Reading, max_rows=100, max_delay_s=0.05)
+    writer.add({"aqi": 1.0})
+    wait_for(lambda: count(session_factory) == 1)
+    writer.close()
+
+
+def test_concurrent_adds_are_all_written(session_factory):
+    writer = BufferedWriter(session_factory, Reading, max_rows=25, max_delay_s=0.02)
+
+    def produce():
+        for i in range(100):
+            writer.add({"aqi": float(i)})
+
+    threads = [threading.Thread(target=produce) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    assert count(session_factory) == 400
+
+
+def test_failed_flush_is_retried(session_factory):
+    class FailingSession:
+        def execute(self, *args, **kwargs):
+            raise RuntimeError("db down")
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    sessions = [FailingSession()]
+
+    def flaky_factory():
+        return sessions.pop() if sessions else session_factory()
+
+    writer = BufferedWriter(flaky_factory, Reading, max_rows=1, max_delay_s=0.01)
+    writer.add({"aqi": 1.0})
+    wait_for(lambda: count(session_factory) == 1)
+    writer.close()
+    assert not sessions
+
+
+def test_failing_on_flush_does_not_stop_the_writer(session_factory):
+    calls = []
+
+    def on_flush(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise ValueError("callback broke")
+
+    writer = BufferedWriter(session_factory, Reading, max_rows=1, max_delay_s=0.01, on_flush=on_flush)
+    writer.add({"aqi": 1.0})
+    wait_for(lambda: len(calls) == 1)
+    writer.add({"aqi": 2.0})
+    wait_for(lambda: count(session_factory) == 2)
+    writer.close()
+    assert len(calls) == 2
+
+
+def test_failing_session_factory_keeps_the_rows(session_factory):
+    attempts = []
+
+    def flaky_factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("pool exhausted")
+        return session_factory()
+
+    writer = BufferedWriter(flaky_factory, Reading, max_rows=1, max_delay_s=0.01)
+    writer.add({"aqi": 1.0})
+    wait_for(lambda: count(session_factory) == 1)
+    writer.close()
+
+
+def test_add_after_close_fails(session_factory):
+    writer = BufferedWriter(session_factory, Reading)
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.add({"aqi": 1.0})
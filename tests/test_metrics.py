@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry, StackSampler
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    latency = Histogram("op_seconds", "Op latency", ["op"], registry=registry, buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, op="read")
+
+    text = registry.render()
+    assert "# TYPE op_seconds histogram" in text
+    assert 'op_seconds_bucket{op="read",le="0.1"} 2' in text
+    assert 'op_seconds_bucket{op="read",le="1.0"} 3' in text
+    assert 'op_seconds_bucket{op="read",le="+Inf"} 4' in text
+    assert 'op_seconds_count{op="read"} 4' in text
+    assert 'op_seconds_sum{op="read"} 3.65' in text
+
+
+def test_counter_and_gauge_labels():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests", ["path"], registry=registry)
+    requests.inc(path='/a"b')
+    requests.inc(2, path='/a"b')
+    depth = Gauge("depth", "Queue depth", ["queue"], registry=registry, fn=lambda: {("q1",): 7})
+
+    text = registry.render()
+    assert 'requests_total{path="/a\\"b"} 3' in text
+    assert 'depth{queue="q1"} 7' in text
+    assert depth.fn() == {("q1",): 7}
+    with pytest.raises(ValueError):
+        requests.inc(other="x")
+    with pytest.raises(ValueError):
+        Counter("requests_total", "Again", registry=registry)
+
+
+def test_stage_records_into_stage_histogram():
+    before = metrics.STAGE_SECONDS.count(stage="unit-test")
+    with metrics.stage("unit-test"):
+        pass
+    assert metrics.STAGE_SECONDS.count(stage="unit-test") == before + 1
+
+
+def busy_loop_for_sampler(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_stack_sampler_sees_other_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop_for_sampler, args=(stop,), name="busy")
+    worker.start()
+    try:
+        metrics.start_profiler("stacks", interval_ms=1)
+        with pytest.raises(RuntimeError):
+            metrics.start_profiler("stacks")
+        time.sleep(0.1)
+    finally:
+        report = metrics.stop_profiler()
+        stop.set()
+        worker.join()
+
+    assert not metrics.profiler_running()
+    busy = [line for line in report.splitlines() if "busy_loop_for_sampler" in line]
+    assert busy and busy[0].startswith("busy;")
+    with pytest.raises(RuntimeError):
+        metrics.stop_profiler()
+
+
+def test_unknown_profiler_is_rejected():
+    with pytest.raises(ValueError):
+        metrics.start_profiler("perf")
+    assert StackSampler().report() == ""
+
+
+class ZeroModel:
+    def __call__(self, batch):
+        import numpy as np
+        return np.zeros((len(batch), 7), dtype=np.float32)
+
+
+class IdentityScaler:
+    def inverse_transform(self, x):
+        return x
+
+
+def test_metrics_endpoint_reports_request_stages(monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("fastapi_mail")
+    import io
+    import api
+    import inference
+    from PIL import Image
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(inference, "_model", ZeroModel())
+    monkeypatch.setattr(inference, "_scaler", IdentityScaler())
+    api.app.dependency_overrides[api.get_current_user] = lambda: api.SimpleNamespace(username="tester")
+    buf = io.BytesIO()
+    Image.new("RGB", (640, 480), "skyblue").save(buf, format="JPEG")
+
+    try:
+        with TestClient(api.app) as client:
+            assert client.post("/predict", files={"file": ("sky.jpg", buf.getvalue(), "image/jpeg")}).status_code == 200
+            assert client.get("/no/such/path").status_code == 404
+            text = client.get("/metrics").text
+
+            # Profiler hooks are hidden unless PROFILING_ENABLED=1
+            assert client.post("/debug/profiler/start").status_code == 404
+            monkeypatch.setattr(api, "PROFILING_ENABLED", True)
+            assert client.post("/debug/profiler/start?interval_ms=1").status_code == 200
+            assert client.post("/debug/profiler/start").status_code == 409
+            report = client.post("/debug/profiler/stop")
+            assert report.status_code == 200 and report.headers["content-type"].startswith("text/plain")
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert 'http_requests_total{method="POST",route="/predict",status="200"}' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"}' in text
+    for name in ("upload_read", "cache_lookup", "decode", "transform", "inference", "forward", "inverse_scale"):
+        assert f'aqi_stage_seconds_count{{stage="{name}"}}' in text
+    assert 'aqi_batch_size_count{scheduler="predict"}' in text
+    assert 'aqi_batch_queue_depth{scheduler="predict"} 0' in text
+    assert 'db_pool_connections{engine="sync",state="checked_out"}' in text
@@ -0,0 +1,57 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from model import forward_with_features, get_model, load_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("ckpt") / "resnet18_aqi.pth"
+    torch.save(get_model("resnet18", pretrained=False).state_dict(), path)
+    return str(path)
+
+
+def test_get_model_rejects_unknown_name():
+    with pytest.raises(ValueError):
+        get_model("vgg16", pretrained=False)
+
+
+def test_channels_last_matches_default_layout(checkpoint):
+    cpu = torch.device("cpu")
+    batch = torch.randn(2, 3, 224, 224)
+    with torch.no_grad():
+        expected = load_model("resnet18", checkpoint, cpu)(batch)
+        model = load_model("resnet18", checkpoint, cpu, channels_last=True)
+        out = model(batch.contiguous(memory_format=torch.channels_last))
+    torch.testing.assert_close(out, expected, atol=1e-4, rtol=1e-4)
+
+
+@pytest.mark.parametrize("mode", ["dynamic", "static"])
+def test_quantized_model_runs(checkpoint, mode):
+    calibration = [torch.randn(2, 3, 224, 224)] if mode == "static" else None
+    model = load_model("resnet18", checkpoint, torch.device("cpu"), quantize=mode, calibration_batches=calibration)
+    with torch.no_grad():
+        out = model(torch.randn(3, 3, 224, 224))
+    assert out.shape == (3, 7)
+    assert torch.isfinite(out).all()
+
+
+def test_static_quantization_needs_calibration(checkpoint):
+    with pytest.raises(ValueError):
+        load_model("resnet18", checkpoint, torch.device("cpu"), quantize="static")
+
+
+@pytest.mark.parametrize("name, dim", [("resnet18", 512), ("mobilenet_v2", 1280)])
+def test_forward_with_features_returns_head_input(name, dim):
+    model = get_model(name, pretrained=False).eval()
+    batch = torch.randn(2, 3, 224, 224)
+    with torch.no_grad():
+        outputs, features = forward_with_features(model, batch)
+        torch.testing.assert_close(outputs, model(batch))
+    assert features.shape == (2, dim)
+    head = model.fc if name == "resnet18" else model.classifier[-1]
+    torch.testing.assert_close(head(features), outputs)
+    assert not head._forward_pre_hooks  # the capture hook is removed again
@@ -0,0 +1,69 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import score
+from embeddings import EmbeddingIndex
+from score import CsvSink, find_images, load_resized
+
+
+def test_find_images_walks_subdirectories(tmp_path):
+    (tmp_path / "cam1").mkdir()
+    Image.new("RGB", (8, 8)).save(tmp_path / "cam1" / "a.jpg")
+    Image.new("RGB", (8, 8)).save(tmp_path / "b.PNG")
+    (tmp_path / "notes.txt").write_text("not an image")
+
+    assert find_images(str(tmp_path)) == ["b.PNG", os.path.join("cam1", "a.jpg")]
+
+
+def test_load_resized_returns_uint8_or_error(tmp_path):
+    Image.new("RGB", (640, 480), (10, 20, 30)).save(tmp_path / "sky.jpg")
+    (tmp_path / "broken.jpg").write_bytes(b"not a jpeg")
+
+    name, array, error = load_resized(("sky.jpg", str(tmp_path / "sky.jpg"), 224))
+    assert (name, error) == ("sky.jpg", None)
+    assert array.shape == (224, 224, 3) and array.dtype == np.uint8
+
+    name, array, error = load_resized(("broken.jpg", str(tmp_path / "broken.jpg"), 224))
+    assert array is None and error
+
+
+def test_csv_sink_appends_and_reports_scored(tmp_path):
+    path = str(tmp_path / "results.csv")
+    columns = ["filename", "AQI", "error"]
+    sink = CsvSink(path, columns)
+    assert sink.scored() == set()
+
+    sink.write([{"filename": "a.jpg", "AQI": 50.0, "error": None}])
+    sink.write([{"filename": "b.jpg", "AQI": None, "error": "bad file"}])
+
+    assert CsvSink(path, columns).scored() == {"a.jpg", "b.jpg"}
+    with open(path) as f:
+        assert f.read().count("filename") == 1  # header written once
+
+
+def test_resume_after_crash_does_not_duplicate_index_rows(tmp_path, monkeypatch):
+    pytest.importorskip("torch")
+    pytest.importorskip("pyarrow")
+    import inference
+
+    def predict_embeddings(batch):
+        return np.zeros((len(batch), len(inference.LABEL_COLS))), batch.mean(dim=(2, 3)).numpy()
+
+    monkeypatch.setattr(inference, "predict_embeddings", predict_embeddings)
+    images, out, index_dir = tmp_path / "images", str(tmp_path / "out.parquet"), str(tmp_path / "index")
+    images.mkdir()
+    for i, colour in enumerate(("red", "green", "blue")):
+        Image.new("RGB", (32, 32), colour).save(images / f"{i}.png")
+
+    # A crash before the sink wrote its buffered rows, after the index was appended
+    with monkeypatch.context() as m:
+        m.setattr(score.ParquetSink, "close", lambda self: None)
+        score.score_directory(str(images), out, batch_size=2, workers=1, index_dir=index_dir)
+    assert len(EmbeddingIndex(index_dir)) == 3
+
+    score.score_directory(str(images), out, batch_size=2, workers=1, index_dir=index_dir)
+    index = EmbeddingIndex(index_dir)
+    assert sorted(meta["filename"] for meta in index.metadata(range(len(index)))) == ["0.png", "1.png", "2.png"]
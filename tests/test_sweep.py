@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from src.sweep import build_grid, threads_per_worker, write_results  # noqa: E402
+
+
+def test_grid_covers_every_combination():
+    grid = build_grid(["resnet18", "mobilenet_v2"], [1e-4, 3e-4], [16])
+    assert len(grid) == 4
+    assert {"model_name": "mobilenet_v2", "lr": 3e-4, "batch_size": 16} in grid
+
+
+def test_cores_are_split_between_workers():
+    assert threads_per_worker(3, cores=12) == 4
+    assert threads_per_worker(4, cores=2) == 1
+
+
+def test_results_table_has_one_row_per_trial(tmp_path):
+    rows = [{"trial": "a", "test_mse": 0.1}, {"trial": "b", "test_mse": 0.2}]
+    path = tmp_path / "results.csv"
+    write_results(rows, str(path))
+    assert path.read_text().splitlines() == ["trial,test_mse", "a,0.1", "b,0.2"]
@@ -0,0 +1,84 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+pd = pytest.importorskip("pandas")
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from src.dataset import LABEL_COLS, build_cache  # noqa: E402
+from src.train import train_model  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def cache_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp("train")
+    rng = np.random.default_rng(0)
+    names = []
+    for i in range(10):
+        Image.fromarray((rng.random((32, 32, 3)) * 255).astype(np.uint8)).save(root / f"{i}.jpg")
+        names.append(f"{i}.jpg")
+    df = pd.DataFrame(rng.random((10, len(LABEL_COLS))), columns=LABEL_COLS)
+    df.insert(0, "Filename", names)
+    build_cache(df, str(root), str(root / "cache"), workers=1)
+    return str(root / "cache")
+
+
+def run(cache_dir, tmp_path, **kwargs):
+    options = dict(num_epochs=1, batch_size=4, cache_dir=cache_dir, num_workers=0,
+                   pretrained=False, checkpoint_path=str(tmp_path / "run.ckpt"))
+    options.update(kwargs)
+    return train_model(None, None, "resnet18", str(tmp_path / "model.pth"), torch.device("cpu"), **options)
+
+
+def test_checkpoint_resume_continues_from_last_epoch(cache_dir, tmp_path):
+    first = run(cache_dir, tmp_path, amp=True, accum_steps=2)
+    assert first["epochs"] == 1
+    assert len(first["test_mse_per_label"]) == len(LABEL_COLS)
+    assert first["images_per_sec"] > 0
+
+    checkpoint = torch.load(tmp_path / "run.ckpt")
+    assert checkpoint["epoch"] == 0 and checkpoint["optimizer"]["state"]
+
+    resumed = run(cache_dir, tmp_path, num_epochs=2, resume=True, amp=True, accum_steps=2)
+    assert resumed["epochs"] == 2
+    assert torch.load(tmp_path / "run.ckpt")["epoch"] == 1
+
+
+def test_early_stopping_keeps_best_weights(cache_dir, tmp_path, monkeypatch):
+    import src.train
+
+    held_out = iter([0.5, 0.4, 0.6, 0.7, 0.8])
+    monkeypatch.setattr(src.train, "evaluate", lambda *args: (next(held_out), [0.0] * len(LABEL_COLS)))
+    result = run(cache_dir, tmp_path, num_epochs=5, patience=1)
+
+    # Best after epoch 2, stopped after one worse epoch
+    assert result["epochs"] == 3
+    checkpoint = torch.load(tmp_path / "run.ckpt")
+    assert checkpoint["best_mse"] == 0.4
+    saved = torch.load(tmp_path / "model.pth")
+    for name, tensor in checkpoint["best_state"].items():
+        torch.testing.assert_close(saved[name], tensor)
+
+
+def test_early_stopping_uses_a_validation_split_not_the_test_set(cache_dir, tmp_path, monkeypatch):
+    import src.train
+
+    def rows(dataset):
+        # Positions in the full dataset, through nested random_split subsets
+        indices = list(range(len(dataset)))
+        while isinstance(dataset, torch.utils.data.Subset):
+            indices = [dataset.indices[i] for i in indices]
+            dataset = dataset.dataset
+        return set(indices)
+
+    seen = []
+    monkeypatch.setattr(src.train, "evaluate",
+                        lambda model, loader, *args: (seen.append(rows(loader.dataset)), (0.5, [0.0] * len(LABEL_COLS)))[1])
+    result = run(cache_dir, tmp_path, num_epochs=2, patience=5)
+
+    *epochs, final = seen
+    assert len(epochs) == 2 and all(val == epochs[0] for val in epochs)
+    assert epochs[0] and final and not epochs[0] & final
+    assert result["val_mse"] == 0.5
@@ -0,0 +1,98 @@
+import asyncio
+import httpx
+import pytest
+
+from waqi import WAQI_LOOKUPS, WAQI_SECONDS, WaqiClient, WaqiUnavailable, parse_feed
+from waqi_stub import create_app
+
+
+def make_client(app, **kwargs):
+    kwargs.setdefault("backoff", 0)
+    return WaqiClient("token", base_url="http://waqi.test", transport=httpx.ASGITransport(app=app), **kwargs)
+
+
+def test_station_parses_feed():
+    async def run():
+        client = make_client(create_app())
+        try:
+            return await client.station(12.97, 77.59)
+        finally:
+            await client.aclose()
+
+    data = asyncio.run(run())
+    assert (data["station_lat"], data["station_lon"]) == (13.0, 77.6)
+    assert data["aqi"] == 87 and data["pm25"] == 32.5
+
+
+def test_nearby_positions_share_one_cached_lookup():
+    app = create_app(latency_ms=20)
+    before = {result: WAQI_LOOKUPS.value(result=result) for result in ("fetched", "coalesced", "cache_hit")}
+
+    async def run():
+        client = make_client(app, bucket_deg=0.01)
+        try:
+            # Concurrent pings in one bucket coalesce, later ones hit the cache
+            await asyncio.gather(*(client.station(12.9701, 77.5901) for _ in range(5)))
+            await client.station(12.9702, 77.5898)
+            await client.station(12.99, 77.59)  # a different bucket
+        finally:
+            await client.aclose()
+
+    asyncio.run(run())
+    assert app.state.requests == 2
+    counts = {result: WAQI_LOOKUPS.value(result=result) - before[result] for result in before}
+    assert counts == {"fetched": 2, "coalesced": 4, "cache_hit": 1}
+
+
+def test_retries_transient_errors():
+    app = create_app(fail_first=2)
+    retryable, ok = WAQI_SECONDS.count(outcome="retryable"), WAQI_SECONDS.count(outcome="ok")
+
+    async def run():
+        client = make_client(app, retries=2)
+        try:
+            return await client.station(1.0, 2.0)
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run())["aqi"] == 87
+    assert app.state.requests == 3
+    assert WAQI_SECONDS.count(outcome="retryable") - retryable == 2
+    assert WAQI_SECONDS.count(outcome="ok") - ok == 1
+
+
+def test_gives_up_after_retries():
+    app = create_app(fail_first=10)
+
+    async def run():
+        client = make_client(app, retries=1)
+        try:
+            await client.station(1.0, 2.0)
+        finally:
+            await client.aclose()
+
+    with pytest.raises(WaqiUnavailable):
+        asyncio.run(run())
+    assert app.state.requests == 2
+
+
+def test_non_json_body_is_retried_then_reported_to_every_waiter():
+    async def run(app, retries):
+        client = make_client(app, retries=retries)
+        try:
+            return await asyncio.gather(*(client.station(1.0, 2.0) for _ in range(3)), return_exceptions=True)
+        finally:
+            await client.aclose()
+
+    recovered = create_app(html_first=1)
+    assert [r["aqi"] for r in asyncio.run(run(recovered, retries=1))] == [87, 87, 87]
+    assert recovered.state.requests == 2
+
+    down = create_app(html_first=10)
+    results = asyncio.run(run(down, retries=1))
+    assert all(isinstance(r, WaqiUnavailable) for r in results)
+    assert down.state.requests == 2
+
+
+def test_parse_feed_without_station():
+    assert parse_feed({"status": "error", "data": "Unknown station"}) is None
@@ -0,0 +1,92 @@
+import os
+import threading
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torchvision")
+
+from backends import EagerBackend  # noqa: E402
+from model import get_model, load_model  # noqa: E402
+from workers import InferencePool  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def checkpoint(tmp_path_factory):
+    torch.manual_seed(0)
+    path = tmp_path_factory.mktemp("ckpt") / "resnet18_aqi.pth"
+    torch.save(get_model("resnet18", pretrained=False).state_dict(), path)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def reference(checkpoint):
+    return EagerBackend(load_model("resnet18", checkpoint, torch.device("cpu")), torch.device("cpu"))
+
+
+@pytest.fixture(scope="module")
+def pool(checkpoint):
+    # Two slots of two rows: a batch of 5 needs more slots than the ring has
+    pool = InferencePool(2, "resnet18", checkpoint, num_threads=1, slot_rows=2, slots=2)
+    yield pool
+    pool.close()
+
+
+def test_pool_matches_in_process_model(pool, reference):
+    batch = torch.randn(5, 3, 224, 224)
+    np.testing.assert_allclose(pool(batch), reference(batch), atol=1e-4)
+
+    preds, features = pool.embed(batch)
+    expected_preds, expected_features = reference.embed(batch)
+    np.testing.assert_allclose(preds, expected_preds, atol=1e-4)
+    np.testing.assert_allclose(features, expected_features, atol=1e-4)
+    assert features.shape == (5, 512)
+
+
+def test_concurrent_callers_get_their_own_rows(pool, reference):
+    batches = [torch.randn(n, 3, 224, 224) for n in (1, 3, 4, 2)]
+    results, errors = {}, []
+
+    def call(i):
+        try:
+            results[i] = pool(batches[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(len(batches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    assert not errors
+    for i, batch in enumerate(batches):
+        np.testing.assert_allclose(results[i], reference(batch), atol=1e-4)
+
+
+def test_wrong_input_shape_is_rejected(pool):
+    with pytest.raises(ValueError):
+        pool(torch.randn(1, 3, 32, 32))
+    assert pool.healthy
+
+
+def test_worker_death_fails_calls_instead_of_hanging(checkpoint):
+    pool = InferencePool(1, "resnet18", checkpoint, num_threads=1)
+    try:
+        pool._processes[0].kill()
+        with pytest.raises(RuntimeError):
+            pool(torch.randn(1, 3, 224, 224))
+        assert not pool.healthy
+    finally:
+        pool.close()
+
+
+def test_mmap_weights_are_used_in_place(checkpoint, reference):
+    model = load_model("resnet18", checkpoint, torch.device("cpu"), mmap=True)
+    if os.path.exists("/proc/self/maps"):
+        with open("/proc/self/maps") as f:
+            assert checkpoint in f.read()
+    batch = torch.randn(2, 3, 224, 224)
+    with torch.no_grad():
+        np.testing.assert_allclose(model(batch).numpy(), reference(batch), atol=1e-5)
+    with pytest.raises(ValueError):
+        load_model("resnet18", checkpoint, torch.device("cpu"), mmap=True, channels_last=True)
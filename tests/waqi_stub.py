@@ -0,0 +1,52 @@
+"""
+Local stand-in for the WAQI feed API, for tests and benchmarks.
+
+    python tests/waqi_stub.py --port 8765 --latency-ms 150
+    WAQI_BASE_URL=http://127.0.0.1:8765 uvicorn api:app
+
+Stations sit on a 0.1 degree grid; /feed/geo:<lat>;<lon>/ answers with the
+nearest one after latency_ms. The first fail_first requests get a 503, to
+exercise retries, and the next html_first get a 200 with an HTML body.
+app.state.requests counts the feed requests served.
+"""
+import asyncio
+import argparse
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse, JSONResponse
+
+
+def create_app(latency_ms=0.0, fail_first=0, html_first=0):
+    app = FastAPI()
+    app.state.requests = 0
+
+    @app.get("/feed/geo:{lat};{lon}/")
+    async def feed(lat: float, lon: float, token: str = ""):
+        app.state.requests += 1
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        if app.state.requests <= fail_first:
+            return JSONResponse(status_code=503, content={"status": "error"})
+        if app.state.requests <= fail_first + html_first:
+            return HTMLResponse("<html><body>Down for maintenance</body></html>")
+        station = [round(lat, 1), round(lon, 1)]
+        return {
+            "status": "ok",
+            "data": {
+                "aqi": 87,
+                "city": {"geo": station, "name": f"Stub station {station[0]},{station[1]}"},
+                "iaqi": {"pm25": {"v": 32.5}, "pm10": {"v": 51}, "o3": {"v": 12.1},
+                         "co": {"v": 0.4}, "so2": {"v": 3}, "no2": {"v": 17.8}},
+            },
+        }
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms), host="127.0.0.1", port=args.port, log_level="warning")